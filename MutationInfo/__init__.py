@@ -4,46 +4,102 @@ import re
 import sys
 import glob
 import gzip
+import array
+import copy
 import json
+import zlib
 import time
 import errno
-import shutil
+import hashlib
+import socket
+import sqlite3
+import string
+import struct
 import urllib
+import mmap
 import logging
 import tarfile 
+import tempfile
+import threading
+import unicodedata
+import contextlib
+import collections
+import importlib
 import urllib2
-import requests
-import feedparser # For LOVD atom data 
 import subprocess # For transvar 
 
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
 from distutils.spawn import find_executable # https://docs.python.org/release/2.4/dist/module-distutils.spawn.html 
 
-from Bio import Entrez, SeqIO
+import numpy as np
+
 from appdirs import *
 
-# Importing: https://bitbucket.org/biocommons/hgvs
-try:
-	import hgvs as hgvs_biocommons
-except ImportError as e:
-	if 'cannot import name ExtendedInterpolation' in str(e):
-		print str(e)
-		print 'This is a known issue.'
-		print 'Please refer to https://github.com/kantale/MutationInfo/issues/9 in order to resolve it'
-	raise e
+class _LazyImport(object):
+	'''
+	A module (or an attribute of a module) that is imported the first time it is used. 
+	Heavy dependencies are imported like this, so ``import MutationInfo`` is fast and every backend imports only what it needs. 
+	Attributes that are set before the import (i.e. ``Entrez.email``) are set on the module when it is imported.
+
+	:param module: The name of the module
+	:param attribute: Optional. The name of an attribute of this module (i.e. a class)
+	:param loader: Optional. A function that returns the object (instead of the import)
+	:param on_error: Optional. Called with the ImportError before it is raised
+	'''
 
-import hgvs.parser as hgvs_biocommons_parser
+	_lock = threading.RLock()
 
-try:
-	import psycopg2 # In order to catch psycopg2.OperationalError 
-	import hgvs.dataproviders.uta as hgvs_biocommons_uta # http://hgvs.readthedocs.org/en/latest/examples/manuscript-example.html#project-genomic-variant-to-a-new-transcript 
-	import hgvs.variantmapper as hgvs_biocommons_variantmapper 
+	def __init__(self, module=None, attribute=None, loader=None, on_error=None):
+		self.__dict__.update(_module=module, _attribute=attribute, _loader=loader, _on_error=on_error, _object=None, _pending={})
 
-except ImportError as e:
+	def _load(self):
+		if self._object is None:
+			with _LazyImport._lock:
+				if self._object is None:
+					try:
+						if self._loader:
+							obj = self._loader()
+						else:
+							obj = importlib.import_module(self._module)
+							if self._attribute:
+								obj = getattr(obj, self._attribute)
+					except ImportError as e:
+						if self._on_error:
+							self._on_error(e)
+						raise
+					for name, value in self._pending.iteritems():
+						setattr(obj, name, value)
+					self._pending.clear() # From now on the attributes are read from obj
+					self.__dict__['_object'] = obj
+		return self._object
+
+	def __getattr__(self, name):
+		if name in self._pending:
+			return self._pending[name]
+		return getattr(self._load(), name)
+
+	def __setattr__(self, name, value):
+		if self._object is None:
+			with _LazyImport._lock:
+				if self._object is None:
+					self._pending[name] = value
+					return
+		setattr(self._object, name, value)
+
+	def __call__(self, *args, **kwargs):
+		return self._load()(*args, **kwargs)
+
+def _biocommons_import_error(e):
+	'''
+	Known issues when biocommons hgvs (or psycopg2) is imported
+	'''
 
-	if 'sphinx' in sys.modules:
-		# Ignore this. These packages are not required for doc building.
-		# Credits to http://stackoverflow.com/questions/20843737/check-if-sphinx-doc-called-the-script for the tip.
-		pass 
+	if 'cannot import name ExtendedInterpolation' in str(e):
+		print str(e)
+		print 'This is a known issue.'
+		print 'Please refer to https://github.com/kantale/MutationInfo/issues/9 in order to resolve it'
 
 	elif 'Library not loaded: libssl.1.0.0.dylib' in str(e):
 
@@ -61,16 +117,32 @@ except ImportError as e:
 		print command
 		print 'For more please check: http://stackoverflow.com/questions/27264574/import-psycopg2-library-not-loaded-libssl-1-0-0-dylib'
 		sys.exit(1)
-		#raise e
-	else:
-		# We do not know what caused this
-		raise e
+
+requests = _LazyImport('requests')
+feedparser = _LazyImport('feedparser') # For LOVD atom data 
+
+Entrez = _LazyImport('Bio.Entrez')
+SeqIO = _LazyImport('Bio.SeqIO')
+SeqFeature = _LazyImport('Bio.SeqFeature', 'SeqFeature')
+FeatureLocation = _LazyImport('Bio.SeqFeature', 'FeatureLocation')
+CompoundLocation = _LazyImport('Bio.SeqFeature', 'CompoundLocation')
+
+# Importing: https://bitbucket.org/biocommons/hgvs
+hgvs_biocommons_exceptions = _LazyImport('hgvs.exceptions', on_error=_biocommons_import_error)
+hgvs_biocommons_parser = _LazyImport('hgvs.parser', on_error=_biocommons_import_error)
+hgvs_biocommons_location = _LazyImport('hgvs.location', on_error=_biocommons_import_error)
+hgvs_biocommons_interface = _LazyImport('hgvs.dataproviders.interface', on_error=_biocommons_import_error)
+hgvs_biocommons_seqfetcher = _LazyImport('hgvs.dataproviders.seqfetcher', on_error=_biocommons_import_error)
+
+psycopg2 = _LazyImport('psycopg2', on_error=_biocommons_import_error) # In order to catch psycopg2.OperationalError 
+hgvs_biocommons_uta = _LazyImport('hgvs.dataproviders.uta', on_error=_biocommons_import_error) # http://hgvs.readthedocs.org/en/latest/examples/manuscript-example.html#project-genomic-variant-to-a-new-transcript 
+hgvs_biocommons_variantmapper = _LazyImport('hgvs.variantmapper', on_error=_biocommons_import_error)
+hgvs_biocommons_normalizer = _LazyImport('hgvs.normalizer', on_error=_biocommons_import_error)
 
 # Importing https://github.com/counsyl/hgvs 
 # How to setup data files : https://github.com/counsyl/hgvs/blob/master/examples/example1.py 
-import pyhgvs as hgvs_counsyl
-import pyhgvs.utils as hgvs_counsyl_utils
-from pygr.seqdb import SequenceFileDB
+hgvs_counsyl = _LazyImport('pyhgvs')
+hgvs_counsyl_utils = _LazyImport('pyhgvs.utils')
 # Use this package to retrieve genomic position for known refSeq entries.
 # MutationInfo comes to the rescue when pyhgvs fails
 
@@ -80,21 +152,20 @@ from pygr.seqdb import SequenceFileDB
 # The mapper is available here: https://github.com/lennax/biopython/tree/f_loc5/Bio/SeqUtils/Mapper 
 # I have changed the name from mapper to biopython_mapper 
 # An example of how to use this mapper is here: https://gist.github.com/lennax/10600113 
-from biopython_mapper import CoordinateMapper 
-from biopython_mapper.MapPositions import GenomePositionError as biopython_GenomePositionError 
+CoordinateMapper = _LazyImport('biopython_mapper', 'CoordinateMapper')
+biopython_MapPositions = _LazyImport('biopython_mapper.MapPositions') # For GenomePositionError
 
-from cruzdb import Genome as UCSC_genome # To Access UCSC https://pypi.python.org/pypi/cruzdb/ 
+UCSC_genome = _LazyImport('cruzdb', 'Genome') # To Access UCSC https://pypi.python.org/pypi/cruzdb/ 
 
-from pyVEP import VEP # Variant Effect Predictor https://github.com/kantale/pyVEP 
+VEP = _LazyImport('pyVEP', 'VEP') # Variant Effect Predictor https://github.com/kantale/pyVEP 
 
-from bs4 import BeautifulSoup 
+BeautifulSoup = _LazyImport('bs4', 'BeautifulSoup')
 
-# For progress bar..
+# For cross-process locking of cache entries. Not available on windows
 try:
-	from IPython.core.display import clear_output
-	have_ipython = True
+	import fcntl
 except ImportError:
-	have_ipython = False
+	fcntl = None
 
 
 __docformat__ = 'reStructuredText'
@@ -122,10 +193,72 @@ Notes:
 class MutationInfoException(Exception):
 	pass
 
+class MutationInfoOfflineError(socket.error):
+	'''
+	Raised when a connection is attempted in offline mode (see the ``offline`` parameter of :py:class:`MutationInfo`).
+	It is a socket.error, so urllib2, requests etc report it as a failed connection.
+	'''
+	pass
+
+class _LazyAttribute(object):
+	'''
+	An attribute of :py:class:`MutationInfo` that is created the first time it is used. 
+	The loader method sets it (and maybe other attributes of the same loader) on the instance. 
+	After this the instance attribute is used and this descriptor is not called again. 
+	Loaders run under ``instance._lazy_lock`` so concurrent threads load every backend only once.
+	'''
+
+	def __init__(self, name, loader):
+		self.name = name
+		self.loader = loader
+
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self
+
+		with instance._lazy_lock:
+			if not self.name in instance.__dict__:
+				logging.info('Loading %s' % (self.name))
+				getattr(instance, self.loader)()
+		if not self.name in instance.__dict__:
+			raise AttributeError(self.name)
+		return instance.__dict__[self.name]
+
+class _AssemblyAttribute(object):
+	'''
+	An attribute of :py:class:`MutationInfo` that has a different value for every assembly (genome). 
+	The value of the current assembly (see :py:func:`MutationInfo.using_genome`) is returned. 
+	If it has not been set, the loader method is called first. Loaders set the attributes of the current assembly.
+	Every (assembly, loader) has its own lock, so loading one assembly does not block the requests of another.
+	'''
+
+	def __init__(self, name, loader):
+		self.name = name
+		self.loader = loader
+
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self
+
+		resources = instance._assembly_resources()
+		if not self.name in resources:
+			with instance._loader_lock(instance.genome, self.loader):
+				if not self.name in resources:
+					logging.info('Loading %s for genome: %s' % (self.name, instance.genome))
+					getattr(instance, self.loader)()
+		if not self.name in resources:
+			raise AttributeError(self.name)
+		return resources[self.name]
+
+	def __set__(self, instance, value):
+		instance._assembly_resources()[self.name] = value
+
 class MutationInfo(object):
 	"""The MutationInfo class handles all necessary connections to various sources in order to assess the chromosomal position of a variant.
-The first time that this class is instantiated it downloads the reference genome in fasta format and splits it per chromosome. 
+The first time that the reference genome is needed it is downloaded in fasta format. 
 This might take approximately 13GB of disc space. 
+All connections and local data (reference genome, refGene, UTA, LOVD, UCSC, dbSNP) are set up the first time that they are used, \
+so creating an instance is fast and unused sources cost nothing. 
 
 MutationInfo offers a single method for accessing the complete functionality of the module: :py:func:`get_info`. 
 
@@ -147,17 +280,45 @@ Accepted values should have the ``hgXX`` format. Default value is *hg19*.
 	.. warning:: 
 		MutationInfo does not guarantee that the returned position is aligned according to the ``genome`` parameter \
 		since certain tools work only with specific genome assemblies. For this reason always check the ``genome`` key of the returned \
-		item after calling the :py:func:`get_info` method. 
+		item after calling the :py:func:`get_info` method (or set the ``liftover`` parameter). 
 
 :param ucsc_genome: Set the version of human genome assembly explicitly for the CruzDB tool (UCSC). \
 Default: Same as the ``genome`` parameter. 
 
 :param dbsnp_version: The version of dbsnp for rs variants. Default value is *snp146*.
 
+:param blat_backend: The aligner of the BLAT method. ``'ucsc'`` (default) uses UCSC's blat service. \
+``'local'`` aligns against the reference genome that is installed in ``local_directory``. The first time it is used it builds \
+a k-mer index of the genome (this takes a while and uses all available cores). 
+
+:param uta_snapshot: A SQLite snapshot of UTA (see :py:func:`build_uta_snapshot`) to use instead of the remote UTA database. \
+Default: ``<local_directory>/uta/uta.sqlite`` if it exists. 
+
+:param lovd_refresh: If True, revalidate the locally stored LOVD gene list and per gene variant feeds \
+on startup (see :py:func:`refresh_lovd`). Default: False. 
+
+:param offline: If True, MutationInfo never connects to the network. Only local data (reference genome, refGene, local dbSNP, \
+UTA snapshot, local aligner) and previously cached results are used. Methods that would need the network fail immediately and \
+this is reported in the ``notes`` of the result. Default: False. 
+
+:param liftover: If True, positions that a tool reports on another assembly (for example GRCh38 from VEP) are converted to ``genome`` \
+with the UCSC chain files. The position before the conversion is kept in the ``original_chrom``, ``original_offset`` and ``original_genome`` keys. \
+Default: False. 
+
+:param genome_contigs: A list of contig names (for example ``['chr1', 'chr2', 'chrX']``). When the reference genome is installed, only \
+these contigs are kept. Default: None (all contigs). 
+
+:param genome_format: 'fasta', '2bit' or 'bgzf'. With '2bit' the reference genome is converted once to UCSC's .2bit format (2 bits per base) \
+and read from it. This needs 4 times less memory (page cache) than the FASTA file. With 'bgzf' the reference genome is stored \
+compressed with bgzip (about a third of the disk space) and only the 64 KB blocks that are accessed are decompressed. Default: 'fasta'. 
+
+:param verify_reference: If True, the reference allele of every result on ``genome`` is checked against the local reference genome \
+(see :py:func:`verify_references`). Mismatches and alleles that are on the reverse strand are reported in ``notes``. Default: False. 
+
 	"""
 
 	_properties_file = 'properties.json'
-	biocommons_parser = hgvs_biocommons_parser.Parser() # https://bitbucket.org/biocommons/hgvs 
+	biocommons_parser = _LazyImport(loader=lambda: hgvs_biocommons_parser.Parser()) # https://bitbucket.org/biocommons/hgvs 
 
 	# This is the size of the sequence, left and right to the variant 
 	# position that we will attempt to perform a blat search on the
@@ -183,6 +344,34 @@ Default: Same as the ``genome`` parameter.
 
 	mutalyzer_url = 'https://mutalyzer.nl/name-checker?description={variant}'
 
+	# Accession.version --> chromosome, assembly, length of the primary assembly chromosomes (NC_ records)
+	assembly_report_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'assembly_report.tsv')
+
+	# Resources that are shared by all assemblies. They are loaded the first time they are used
+	biocommons_hdp = _LazyAttribute('biocommons_hdp', 'biocommons_connect')
+	biocommons_normalizer = _LazyAttribute('biocommons_normalizer', 'biocommons_connect')
+	lovd_directory = _LazyAttribute('lovd_directory', '_lovd_setup')
+	lovd_genes_atom = _LazyAttribute('lovd_genes_atom', '_lovd_setup')
+	lovd_genes_json = _LazyAttribute('lovd_genes_json', '_lovd_setup')
+	lovd_transcript_dict = _LazyAttribute('lovd_transcript_dict', '_lovd_setup')
+	refgene_mapper = _LazyAttribute('refgene_mapper', '_load_refgene_mapper')
+	refgene_transcripts = _LazyAttribute('refgene_transcripts', '_load_refgene_transcripts') # genes.refGene is the same for all assemblies
+
+	# Resources that depend on the assembly. Every assembly (genome parameter of get_info) loads them the first time they are used.
+	blat_directory = _AssemblyAttribute('blat_directory', '_load_assembly_genome')
+	counsyl_hgvs = _AssemblyAttribute('counsyl_hgvs', '_load_assembly_genome')
+	local_aligner = _AssemblyAttribute('local_aligner', '_load_assembly_genome')
+	local_dbsnp_directory = _AssemblyAttribute('local_dbsnp_directory', '_load_assembly_dbsnp')
+	local_dbsnp = _AssemblyAttribute('local_dbsnp', '_load_assembly_dbsnp')
+	ucsc_options = _AssemblyAttribute('ucsc_options', '_load_assembly_ucsc_options')
+	ucsc = _AssemblyAttribute('ucsc', '_load_assembly_ucsc')
+	ucsc_dbsnp = _AssemblyAttribute('ucsc_dbsnp', '_load_assembly_ucsc')
+	ucsc_assembly = _AssemblyAttribute('ucsc_assembly', '_load_assembly_ucsc')
+	biocommons_vm_splign = _AssemblyAttribute('biocommons_vm_splign', '_load_assembly_biocommons')
+	biocommons_vm_blat = _AssemblyAttribute('biocommons_vm_blat', '_load_assembly_biocommons')
+	biocommons_vm_genewise = _AssemblyAttribute('biocommons_vm_genewise', '_load_assembly_biocommons')
+	liftover = _AssemblyAttribute('liftover', '_load_assembly_liftover')
+
 	def __init__(self, local_directory=None, email=None, genome='hg19', dbsnp_version='snp146', **kwargs):
 	#def __init__(self, local_directory=None, email=None, genome='hg38', dbsnp_version='snp146'):
 		'''
@@ -194,14 +383,19 @@ Default: Same as the ``genome`` parameter.
 
 		'''
 
+		#Backends are loaded on first use. See _LazyAttribute and _AssemblyAttribute
+		self._lazy_lock = threading.RLock()
+		self._assemblies = {}
+		self._loader_locks = {} # (genome, loader) --> lock
+		self._assembly_state = threading.local()
+
 		#Check genome value
 		match = re.match(r'hg[\d]+', genome)
 		if not match:
 			raise ValueError('genome parameter should be hgDD (for example hg18, hg19, hg38, ...)')
-		self.genome = genome
-		if not self.genome in self.GrCh_genomes:
-			raise KeyError('genome parameter: %s does not have an GrCh equivalent..' % (self.genome))
-		self.genome_GrCh = self.GrCh_genomes[self.genome]
+		if not genome in self.GrCh_genomes:
+			raise KeyError('genome parameter: %s does not have an GrCh equivalent..' % (genome))
+		self.default_genome = genome
 
 		#Do a simple check in dbsnp_version
 		match = re.match(r'snp[\w]+', dbsnp_version)
@@ -218,11 +412,14 @@ Default: Same as the ``genome`` parameter.
 				raise EnvironmentError('Local Directory %s does not exist' % (str(local_directory)))
 			self.local_directory = local_directory
 
+		#In offline mode nothing is downloaded
+		self.offline = kwargs.get('offline', False)
+
 		self._properties_file = os.path.join(self.local_directory, self._properties_file)
-		if not Utils.file_exists(self._properties_file):
-			#Create property file
-			with open(self._properties_file, 'w') as f:
-				f.write('{}\n')
+		with Utils.single_flight(self._properties_file) as missing:
+			if missing:
+				#Create property file
+				Utils.save_json_filenane(self._properties_file, {})
 
 		#Read property file
 		self.properties = Utils.load_json_filename(self._properties_file)
@@ -233,27 +430,32 @@ Default: Same as the ``genome`` parameter.
 		elif not 'email' in self.properties:
 				self.properties['email'] = raw_input('I need an email to query Entrez. Please insert one (it will be stored for future access): ')
 		Entrez.email = self.properties['email']
-		logging.info('Using email for accessing Entrez: %s' % (str(Entrez.email)))
+		logging.info('Using email for accessing Entrez: %s' % (str(self.properties['email'])))
 
 		#Create transcripts directory
 		self.transcripts_directory = os.path.join(self.local_directory, 'transcripts')
 		logging.info('transcripts Directory: %s' % self.transcripts_directory)
 		Utils.mkdir_p(self.transcripts_directory)
 
-		#Create blat directory
-		self.blat_directory = os.path.join(self.local_directory, 'blat')
-		logging.info('blat Directory: %s' % (self.blat_directory))
-		Utils.mkdir_p(self.blat_directory)
+		#Chromosome and assembly of reference assembly accessions. Unknown accessions are looked up with Entrez esummary
+		self.assembly_report = Utils.load_assembly_report(self.assembly_report_filename)
 
-		self.counsyl_hgvs = Counsyl_HGVS(
-			local_directory = self.local_directory,
-			genome = self.genome,
-			)
+		# Reference genome, refGene and BLAT aligner
+		self.genome_contigs = kwargs.get('genome_contigs')
+		self.genome_format = kwargs.get('genome_format', 'fasta')
+		self.blat_backend = kwargs.get('blat_backend', 'ucsc')
+		if not self.blat_backend in ['ucsc', 'local']:
+			raise ValueError('blat_backend parameter should be "ucsc" or "local". Found: %s' % (str(self.blat_backend)))
 
-		self.biocommons_connect()
+		# A local UTA snapshot (if it exists) is used instead of the remote UTA database
+		self.uta_snapshot_filename = kwargs.get('uta_snapshot', os.path.join(self._cache_directory('uta'), 'uta.sqlite'))
 
 		# Set up LOVD data 
-		self._lovd_setup()
+		if kwargs.get('lovd_refresh', False):
+			if self.offline:
+				logging.warning('Offline mode: LOVD data will not be refreshed')
+			else:
+				self.refresh_lovd()
 
 		# Set up mutalizer
 		self.mutalyzer_directory = os.path.join(self.local_directory, 'mutalyzer')
@@ -261,11 +463,7 @@ Default: Same as the ``genome`` parameter.
 		logging.info('Mutalyzer directory: %s' % (self.mutalyzer_directory))
 
 		# Set up cruzdb (UCSC)
-		self.ucsc_options = {}
-		if 'ucsc_genome' in kwargs:
-			self.ucsc_options['ucsc_genome'] = kwargs['ucsc_genome']
-
-		self._setup_UCSC(**self.ucsc_options)
+		self.ucsc_genome = kwargs.get('ucsc_genome')
 
 		#Save properties file
 		Utils.save_json_filenane(self._properties_file, self.properties)
@@ -273,8 +471,137 @@ Default: Same as the ``genome`` parameter.
 		#Stores what went wrong during a conversion 
 		self.current_fatal_error = []
 
+		#Identical concurrent get_info requests run the pipeline only once
+		self.coalescer = RequestCoalescer()
+
+		#Convert the results of all tools to self.genome
+		self.liftover_enabled = kwargs.get('liftover', False)
+
+		#Check the reference allele of all results against the local reference genome
+		self.verify_reference = kwargs.get('verify_reference', False)
+
+		#Memoized results of canonical_key
+		self._canonical_keys = {}
+
+	@property
+	def genome(self):
+		'''
+		The assembly of the current get_info call (see :py:func:`using_genome`), otherwise the genome of the constructor
+		'''
+		return getattr(self._assembly_state, 'genome', None) or self.default_genome
+
+	@property
+	def genome_GrCh(self):
+		return self.GrCh_genomes[self.genome]
+
+	@contextlib.contextmanager
+	def using_genome(self, genome):
+		'''
+		Within this block, and only in this thread, ``self.genome`` is genome. 
+		The resources of this assembly (reference genome, local dbSNP, UCSC connection, ...) are loaded the first time they are used. 
+		If genome is None, nothing changes.
+		'''
+
+		if genome is None:
+			yield
+			return
+
+		if not genome in self.GrCh_genomes:
+			raise KeyError('genome parameter: %s does not have an GrCh equivalent..' % (genome))
+
+		previous = getattr(self._assembly_state, 'genome', None)
+		self._assembly_state.genome = genome
+		try:
+			yield
+		finally:
+			self._assembly_state.genome = previous
+
+	def _assembly_resources(self):
+		'''
+		The resources (attribute name --> value) of the current assembly
+		'''
+		genome = self.genome
+		resources = self._assemblies.get(genome)
+		if resources is None:
+			resources = self._assemblies.setdefault(genome, {}) # Atomic. Threads that race here get the same dictionary
+		return resources
+
+	def _loader_lock(self, genome, loader):
+		'''
+		The lock of an assembly loader (see _AssemblyAttribute)
+		'''
+		return self._loader_locks.setdefault((genome, loader), threading.RLock())
+
+	def _load_refgene_transcripts(self):
+		self.refgene_transcripts = Counsyl_HGVS.load_transcripts(self.local_directory, self.offline)
+
+	def _load_refgene_mapper(self):
+		self.refgene_mapper = RefGeneMapper(self.refgene_transcripts)
+
+	def _load_assembly_genome(self):
+		#Create blat directory. BLAT alignments depend on the assembly
+		self.blat_directory = self._cache_directory('blat', self.genome)
+		logging.info('blat Directory: %s' % (self.blat_directory))
+
+		self.counsyl_hgvs = Counsyl_HGVS(
+			local_directory = self.local_directory,
+			genome = self.genome,
+			offline = self.offline,
+			contigs = self.genome_contigs,
+			genome_format = self.genome_format,
+			transcripts = self.refgene_transcripts,
+			)
+
+		# Set up the aligner for the BLAT method
+		if self.blat_backend == 'local':
+			self.local_aligner = LocalAligner(self.counsyl_hgvs.genome_filename, self._cache_directory('blat', self.genome, 'index'))
+		else:
+			self.local_aligner = None
+
+	def _load_assembly_dbsnp(self):
+		self.local_dbsnp_directory = self._cache_directory('dbsnp', self.genome, self.dbsnp_version)
+		if LocalDbSNP.exists(self.local_dbsnp_directory):
+			logging.info('Using local dbSNP index: %s' % (self.local_dbsnp_directory))
+			self.local_dbsnp = LocalDbSNP(self.local_dbsnp_directory)
+		else:
+			self.local_dbsnp = None
+
+	def _load_assembly_ucsc_options(self):
+		# The ucsc_genome parameter of the constructor applies only to the genome of the constructor
+		self.ucsc_options = {}
+		if self.ucsc_genome and self.genome == self.default_genome:
+			self.ucsc_options['ucsc_genome'] = self.ucsc_genome
+
+	def _load_assembly_ucsc(self):
+		self._setup_UCSC(**self.ucsc_options)
+
+	def _load_assembly_biocommons(self):
+		if self.biocommons_hdp is None:
+			self.biocommons_vm_splign = None
+			self.biocommons_vm_blat = None
+			self.biocommons_vm_genewise = None
+			return
+
+		# http://hgvs.readthedocs.org/en/latest/examples/manuscript-example.html#project-genomic-variant-to-a-new-transcript 
+		self.biocommons_vm_splign = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='splign')
+		self.biocommons_vm_blat = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='blat')
+		self.biocommons_vm_genewise = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='genewise')
+
+	def _load_assembly_liftover(self):
+		if self.liftover_enabled:
+			self.liftover = LiftOver(self._cache_directory('liftover'), self.genome)
+		else:
+			self.liftover = None
+
 	def _setup_UCSC(self, **kwargs):
 		# Set up cruzdb (UCSC)
+		if self.offline:
+			logging.warning('Offline mode: UCSC (CruzDB) is disabled')
+			self.ucsc = None
+			self.ucsc_dbsnp = None
+			self.ucsc_assembly = None
+			return
+
 		logging.info('Setting up UCSC access..')
 		try:
 			if 'ucsc_genome' in kwargs:
@@ -298,15 +625,46 @@ Default: Same as the ``genome`` parameter.
 		See also issue #10
 		'''
 
-		logging.info('Connecting to biocommons uta..')
-		self.biocommons_hdp = hgvs_biocommons_uta.connect()
+		if Utils.file_exists(self.uta_snapshot_filename):
+			logging.info('Using UTA snapshot: %s' % (self.uta_snapshot_filename))
+			self.biocommons_hdp = SQLiteUTADataProvider(self.uta_snapshot_filename)
+		elif self.offline:
+			logging.warning('Offline mode: There is no UTA snapshot (%s). Biocommons methods are disabled' % (self.uta_snapshot_filename))
+			self.biocommons_hdp = None
+		else:
+			logging.info('Connecting to biocommons uta..')
+			self.biocommons_hdp = hgvs_biocommons_uta.connect()
 
-		# http://hgvs.readthedocs.org/en/latest/examples/manuscript-example.html#project-genomic-variant-to-a-new-transcript 
-		self.biocommons_vm_splign = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='splign')
-		self.biocommons_vm_blat = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='blat')
-		self.biocommons_vm_genewise = hgvs_biocommons_variantmapper.EasyVariantMapper(self.biocommons_hdp, primary_assembly=self.genome_GrCh, alt_aln_method='genewise')
+		# The variant mappers of all assemblies use the previous connection. They are created again when they are used
+		for resources in self._assemblies.values(): # A copy. Other threads can add assemblies
+			for name in ['biocommons_vm_splign', 'biocommons_vm_blat', 'biocommons_vm_genewise']:
+				resources.pop(name, None)
+
+		# 3' shifting of indels for canonical_key
+		if self.biocommons_hdp is None:
+			self.biocommons_normalizer = None
+		else:
+			self.biocommons_normalizer = hgvs_biocommons_normalizer.Normalizer(self.biocommons_hdp, shuffle_direction=3)
 
 
+	def build_uta_snapshot(self, transcripts=None, genes=None):
+		'''
+		Extract the UTA data of some transcripts (and / or of all transcripts of some genes) from the remote UTA database into a local SQLite snapshot. \
+		From then on, the biocommons methods use the snapshot instead of the remote database. \
+		The snapshot can be extended by calling this method again.
+
+		:param transcripts: A list of transcript accessions (i.e. ``['NM_000367.2']``)
+		:param genes: A list of HGNC gene names (i.e. ``['TPMT']``)
+		'''
+
+		if self.offline:
+			raise MutationInfoException('Offline mode: Cannot connect to the remote UTA database')
+
+		hdp = hgvs_biocommons_uta.connect()
+		with Utils.file_lock(self.uta_snapshot_filename):
+			SQLiteUTADataProvider.build(self.uta_snapshot_filename, hdp, transcripts=transcripts, genes=genes)
+		self.biocommons_connect()
+
 	@staticmethod
 	def biocommons_parse(variant):
 		"""
@@ -316,7 +674,7 @@ Default: Same as the ``genome`` parameter.
 		"""
 		try:
 			return MutationInfo.biocommons_parser.parse_hgvs_variant(variant)
-		except hgvs_biocommons.exceptions.HGVSParseError as e:
+		except hgvs_biocommons_exceptions.HGVSParseError as e:
 			logging.warning('Biocommons could not parse variant:  %s . Error: %s' % (str(variant), str(e)))
 			return None
 
@@ -388,13 +746,113 @@ Default: Same as the ``genome`` parameter.
 
 		return new_variant
 
+	def canonical_key(self, variant, transcript=None, ref_type=None, **kwargs):
+		"""
+		Compute one canonical key for all equivalent spellings of a variant. 
+		This key is used by the caches and by the deduplication of batch and concurrent requests. 
+		It is not sent to any service. 
+
+		* Unicode is normalized (NFKC) and all whitespace is removed.
+		* rs variants are lower case (``RS53576`` --> ``rs53576``). 
+		* Accessions are upper case (``nm_006446.4`` --> ``NM_006446.4``). 
+		* Variants that biocommons cannot parse are rewritten with :py:func:`fuzzy_hgvs_corrector`.
+		* Variants are formatted with the biocommons parser. If a local UTA snapshot exists (see :py:func:`build_uta_snapshot`), \
+indels are 3' shifted with the biocommons normalizer. The remote UTA database is never used for keys. 
+
+		:param variant: The name of the variant
+		:param transcript: See :py:func:`fuzzy_hgvs_corrector`
+		:param ref_type: See :py:func:`fuzzy_hgvs_corrector`
+
+		:return: The key (str) or None if the variant is not a string, contains non ascii characters or it corresponds to more than one variant.
+		"""
+
+		if not type(variant) in [str, unicode]:
+			return None
+
+		cache_key = (variant, transcript, ref_type)
+		if cache_key in self._canonical_keys:
+			return self._canonical_keys[cache_key]
+
+		key = self._canonical_key(variant, transcript, ref_type)
+		if len(self._canonical_keys) > 100000:
+			self._canonical_keys.clear()
+		self._canonical_keys[cache_key] = key
+		return key
+
+	def _canonical_key(self, variant, transcript, ref_type):
+
+		if type(variant) is unicode:
+			variant = unicodedata.normalize('NFKC', variant)
+			try:
+				variant = variant.encode('ascii')
+			except UnicodeEncodeError:
+				# A lossy key (i.e. with ? for every non ascii character) would be shared by different variants
+				logging.warning('Variant: %s . Contains non ascii characters. It does not have a canonical key' % (variant.encode('ascii', 'replace')))
+				return None
+
+		key = re.sub(r'\s+', '', variant)
+
+		if re.match(r'^rs[\d]+$', key, re.IGNORECASE):
+			return key.lower()
+
+		# Accessions are always upper case
+		key = re.sub(r'^([a-zA-Z]+_?[\d]+(\.[\d]+)?)', lambda m: m.group(1).upper(), key)
+
+		hgvs = MutationInfo.biocommons_parse(key)
+		if hgvs is None:
+			try:
+				new_key = MutationInfo.fuzzy_hgvs_corrector(key, transcript=transcript, ref_type=ref_type)
+			except ValueError as e:
+				logging.warning('Variant: %s . Could not correct variant: %s' % (key, str(e)))
+				return key
+			if type(new_key) is list:
+				# More than one variants
+				return None
+			if new_key is None:
+				return key
+			hgvs = MutationInfo.biocommons_parse(new_key)
+			if hgvs is None:
+				return new_key
+
+		is_indel = type(hgvs.posedit.edit).__name__ != 'NARefAlt' or hgvs.posedit.edit.type != 'sub'
+		if is_indel and Utils.file_exists(self.uta_snapshot_filename):
+			# Indel. 3' shift it. Only with the local snapshot: keys are computed before any real work and should not wait for the network
+			try:
+				hgvs = self.biocommons_normalizer.normalize(hgvs)
+			except Exception as e:
+				# Normalization needs sequence data from UTA. If this is not available we keep the variant as it is
+				logging.warning('Variant: %s . Could not normalize variant: %s' % (key, str(e)))
+
+		return str(hgvs)
+
 	def _get_info_rs(self, variant):
 		return self._search_ucsc(variant)
 
 	def get_info_ucsc(self, variant):
 		return self._search_ucsc(variant)
 
+	def get_info_local_dbsnp(self, variant):
+		return self._search_local_dbsnp(variant)
+
+	def install_local_dbsnp(self, filename):
+		'''
+		Build a local dbSNP index for the ``genome`` and ``dbsnp_version`` of this instance. \
+		After this, rs variants are searched first in the local index (method ``LOCAL_DBSNP``).
+
+		:param filename: A dbSNP VCF file (i.e. ftp://ftp.ncbi.nih.gov/snp/organisms/human_9606_b146_GRCh37p13/VCF/All_20151104.vcf.gz ) \
+		or a UCSC snp table dump (i.e. http://hgdownload.cse.ucsc.edu/goldenPath/hg19/database/snp146.txt.gz ). Gzipped files are accepted. \
+		The positions in the file should be in the ``genome`` assembly.
+		'''
+
+		with Utils.file_lock(LocalDbSNP.meta_filename(self.local_dbsnp_directory)):
+			LocalDbSNP.build(filename, self.local_dbsnp_directory, self.genome)
+		self.local_dbsnp = LocalDbSNP(self.local_dbsnp_directory)
+
 	def get_info_vep(self, variant, **kwargs):
+		if self.offline:
+			self._offline_miss('Variant: %s . VEP' % (variant))
+			return {'notes': ' / '.join(self.current_fatal_error)}
+
 		if 'vep_assembly' in kwargs:
 			vep_ret = self._search_VEP(variant, vep_assembly=kwargs['vep_assembly'])
 		else:
@@ -409,6 +867,9 @@ Default: Same as the ``genome`` parameter.
 		#url_pattern = 'http://myvariant.info/v1/query?q={variant}&hg38=true' # As of now (1 June 2016) it does not work. Returns hg19 
 		url = url_pattern.format(variant=variant)
 
+		if self.offline:
+			return self._offline_miss('Variant: %s . MyVariant.info' % (variant))
+
 		logging.info('TRYING MyVariant INFO for: %s' % (variant))
 		logging.debug('MyVariantInfo URL: %s' % (url)  )
 
@@ -445,6 +906,9 @@ Default: Same as the ``genome`` parameter.
 
 
 	def get_info_biocommons(self, variant):
+		if self.biocommons_hdp is None:
+			return self._offline_miss('Variant: %s . UTA (biocommons)' % (variant))
+
 		hgvs = MutationInfo.biocommons_parse(variant)
 		if hgvs is None:
 			print 'COULD NOT PARSE VARIANT WITH BIOCOMMONS'
@@ -490,21 +954,18 @@ Default: Same as the ``genome`` parameter.
 				hgvs_reference_assembly = method.c_to_g(hgvs)
 				hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = self.get_elements_from_hgvs(hgvs_reference_assembly)
 				print 'BIOCOMMONS METHOD: %s SUCCEEDED: ' % method_name, hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative
-				print 'FETCHING TRANSCRIPT %s FROM ENTREZ' % (hgvs_transcript) 
-				ncbi_info = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='asn.1')
-				search = re.search(r'Homo sapiens chromosome ([\w]+), ([\w\.]+) Primary Assembly', ncbi_info)
-				if search is None:
+				assembly_info = self._get_assembly_info(hgvs_transcript)
+				if assembly_info is None:
 					print 'INVESTIGATE MORE.... 9834'
 					assert False
-				entrez_chromosome = search.group(1)
-				entrez_genome = search.group(2)
-			except hgvs_biocommons.exceptions.HGVSDataNotAvailableError as e:
+				entrez_chromosome, entrez_genome, _ = assembly_info
+			except hgvs_biocommons_exceptions.HGVSDataNotAvailableError as e:
 				print 'BIOCOMMONS METHOD: %s FAILED' % method_name
 				print 'REASON:', str(e)
 				hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = ['UNKNOWN'] * 5
 				entrez_chromosome, entrez_genome = ['UNKNOWN'] * 2
 				hgvs_notes = str(e)
-			except hgvs_biocommons.exceptions.HGVSError as e:
+			except hgvs_biocommons_exceptions.HGVSError as e:
 				print 'BIOCOMMONS METHOD: %s FAILED' % method_name
 				print 'REASON:', str(e)
 				hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = ['UNKNOWN'] * 5
@@ -537,6 +998,54 @@ Default: Same as the ``genome`` parameter.
 			return {}
 		return self._build_ret_dict(chrom, offset, ref, alt, self.genome, 'counsyl_hgvs_to_vcf')
 
+	def get_info_local_refgene(self, variant):
+		'''
+		Map a c. (NM_) or n. (NR_) variant on the genome with the exon tables of genes.refGene. No network access is needed.
+		'''
+
+		if self.genome != Counsyl_HGVS.refseq_genome:
+			logging.info('Variant: %s . genes.refGene is on %s. Skipping local refGene for genome: %s' % (str(variant), Counsyl_HGVS.refseq_genome, self.genome))
+			return None
+
+		if type(variant) in [str, unicode]:
+			hgvs = MutationInfo.biocommons_parse(variant)
+		else:
+			hgvs = variant
+		if hgvs is None:
+			return None
+
+		if not hgvs.type in ['c', 'n']:
+			return None
+
+		edit_type = getattr(hgvs.posedit.edit, 'type', None)
+		if not edit_type in ['sub', 'del', 'delins', 'dup', 'ins']:
+			logging.info('Variant: %s . Local refGene does not support edit: %s' % (str(variant), str(edit_type)))
+			return None
+
+		positions = []
+		for pos in [hgvs.posedit.pos.start, hgvs.posedit.pos.end]:
+			if pos.base is None or pos.offset is None or pos.uncertain:
+				return None
+			if hgvs.type == 'c':
+				mapped = self.refgene_mapper.c_to_g(hgvs.ac, pos.base, pos.offset, cds_end=pos.datum == hgvs_biocommons_location.CDS_END)
+			else:
+				mapped = self.refgene_mapper.n_to_g(hgvs.ac, pos.base, pos.offset)
+			if mapped is None:
+				logging.info('Variant: %s . Could not map position %s with local refGene' % (str(variant), str(pos)))
+				return None
+			positions.append(mapped)
+
+		chrom, _, strand = positions[0]
+		offset = min(positions[0][1], positions[1][1])
+
+		_, _, _, hgvs_reference, hgvs_alternative = self.get_elements_from_hgvs(hgvs)
+		if strand == '-':
+			hgvs_reference = self.reverse_inverse(hgvs_reference)
+			hgvs_alternative = self.reverse_inverse(hgvs_alternative)
+
+		logging.info('Variant: %s . Local refGene mapped it to: %s:%i (strand: %s)' % (str(variant), chrom, offset, strand))
+		return self._build_ret_dict(chrom, offset, hgvs_reference, hgvs_alternative, self.genome, 'LOCAL_REFGENE', ' / '.join(self.current_fatal_error))
+
 	def get_info_mutalyzer(self, variant, gene=None):
 		#print self._search_mutalyzer(variant)
 		logging.debug('Variant: %s TRYING MUTALYZER POSITION CONVERTER..' % (str(variant)))
@@ -589,13 +1098,13 @@ Default: Same as the ``genome`` parameter.
 		hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = self.get_elements_from_hgvs(hgvs)
 		#print hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative
 		logging.debug('SEARCHING NCBI FOR TRANSCRIPT %s GENERATED FROM MUTALYZER' % (hgvs_transcript))
-		ncbi_info = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='asn.1')
-		search = re.search(r'Homo sapiens chromosome ([\w]+), ([\w\.]+) Primary Assembly', ncbi_info)
-		if search is None:
+		assembly_info = self._get_assembly_info(hgvs_transcript)
+		if assembly_info is None:
 			print 'INVESTIGATE MORE.. 5910'
 			assert False
 
-		ret = self._build_ret_dict(search.group(1), hgvs_position, hgvs_reference, hgvs_alternative, search.group(2), 'Mutalyzer', ' , '.join(self.current_fatal_error))
+		entrez_chromosome, entrez_genome, _ = assembly_info
+		ret = self._build_ret_dict(entrez_chromosome, hgvs_position, hgvs_reference, hgvs_alternative, entrez_genome, 'Mutalyzer', ' , '.join(self.current_fatal_error))
 		return ret
 
 	def get_info_LOVD(self, variant):
@@ -619,6 +1128,8 @@ Default: Same as the ``genome`` parameter.
 		return None
 
 	def get_info_VARIATION_REPORTER(self, variant):
+		if self.offline:
+			return self._offline_miss('Variant: %s . Variation Reporter' % (variant))
 		return self._search_variation_reporter(variant)
 
 	def get_info_TRANSVAR(self, variant):
@@ -646,10 +1157,9 @@ Default: Same as the ``genome`` parameter.
 				hgvs_type = s.group(1)
 				print 'Using hgvs_type:', hgvs_type
 
-		logging.info('Fetching fasta sequence for trascript: %s' % (hgvs_transcript))
-		#fasta = self._get_fasta_from_nucleotide_entrez(hgvs_transcript)
-		fasta = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='fasta')
-		if fasta is None:
+		logging.info('Fetching sequence length for trascript: %s' % (hgvs_transcript))
+		fasta_length = self._get_sequence_length(hgvs_transcript)
+		if fasta_length is None:
 			logging.error('BLAT method failed')
 			return None
 
@@ -657,23 +1167,17 @@ Default: Same as the ``genome`` parameter.
 		if hgvs_type == 'c':
 			logging.warning('Variant: %s . This is a c (coding DNA) variant. Trying to infer g position..' % (variant))
 			#logging.info('Variant: %s . Fetching NCBI XML for transcript: %s' % (variant, hgvs_transcript))
-			logging.info('Variant: %s . Fetching genbank entry for transcript: %s' % (variant, hgvs_transcript))
+			logging.info('Variant: %s . Fetching exons for transcript: %s' % (variant, hgvs_transcript))
 			#ncbi_xml = self._get_xml_from_nucleotide_entrez(hgvs_transcript)
 			#ncbi_xml = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='xml')
 			#genbank = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='gb')
-			genbank = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='gbwithparts')
-			if genbank is None:
+			exons = self._get_exons_from_entrez(hgvs_transcript)
+			if exons is None:
 				logging.error('Variant: %s . Could not get data from Entrez' % (variant))
 				return None
 
-			genbank_filename = self._ncbi_filename(hgvs_transcript, 'gbwithparts')
-			logging.info('Variant: %s . Genbank filename: %s' % (variant, genbank_filename))
-			if 'gene' in kwargs:
-				genbank_gene = kwargs['gene']
-			else:
-				genbank_gene = None
 			#genbank_c_to_g_mapper = self._get_sequence_features_from_genbank(genbank_filename, gene=genbank_gene)
-			genbank_c_to_g_mapper = self._biopython_c2g_mapper(genbank_filename)
+			genbank_c_to_g_mapper = self._biopython_c2g_mapper(exons)
 			if genbank_c_to_g_mapper is None:
 				logging.error('Variant: %s . Could not infer a g. position' % (variant))
 				return None
@@ -696,19 +1200,9 @@ Default: Same as the ``genome`` parameter.
 			logging.error('Variant: %s Sorry.. only c (coding DNA) and g (genomic) variants are supported so far.' % (variant))
 			return None
 
-		fasta_reference = fasta[hgvs_position-1:hgvs_position-1 + (0 if hgvs_reference is None else len(hgvs_reference))  ]
-		logging.info('Variant: %s . Reference on fasta: %s  Reference on variant: %s' % (variant, fasta_reference, hgvs_reference))
-
-		if fasta_reference != hgvs_reference:
-			if fasta_reference == '' and hgvs_reference is None:
-				pass
-			else:
-				notes = 'Variant: %s . ***SERIOUS*** Reference on fasta (%s) and Reference on variant name (%s) are different!' % (variant, fasta_reference, hgvs_reference)
-				logging.error(notes)
-				self.current_fatal_error.append(notes)
-
-		logging.info('Variant: %s . Fasta length: %i' % (variant, len(fasta)))
-		logging.info('Variant: %s . Variant position: %i' % (variant, hgvs_position))
+		if not 0 < hgvs_position <= fasta_length:
+			logging.error('Variant: %s . Position %i is outside of %s (length: %i)' % (variant, hgvs_position, hgvs_transcript, fasta_length))
+			return None
 
 		#relatve_pos is the relative position in the 2*blat_margin sample of the variant
 		relative_pos = hgvs_position
@@ -720,25 +1214,78 @@ Default: Same as the ``genome`` parameter.
 			chunk_start = hgvs_position - self.blat_margin
 			relative_pos = self.blat_margin
 
-		if hgvs_position + self.blat_margin > len(fasta):
-			chunk_end = len(fasta)
+		if hgvs_position + self.blat_margin > fasta_length:
+			chunk_end = fasta_length
 		else:
 			chunk_end = hgvs_position + self.blat_margin
 
-		fasta_chunk = fasta[chunk_start:chunk_end]
+		# Fetch only the chunk, not the complete sequence of the transcript
+		fasta_chunk = self._get_sequence_range(hgvs_transcript, chunk_start, chunk_end)
+		if fasta_chunk is None:
+			logging.error('BLAT method failed')
+			return None
+
+		if len(fasta_chunk) != chunk_end - chunk_start:
+			# i.e. a truncated Entrez reply
+			self.current_fatal_error.append('Variant: %s . Expected %i bases of %s [%i, %i) but received %i' % (variant, chunk_end - chunk_start, hgvs_transcript, chunk_start, chunk_end, len(fasta_chunk)))
+			logging.error(self.current_fatal_error[-1])
+			return None
+
+		fasta_reference = fasta_chunk[relative_pos-1:relative_pos-1 + (0 if hgvs_reference is None else len(hgvs_reference))  ]
+		logging.info('Variant: %s . Reference on fasta: %s  Reference on variant: %s' % (variant, fasta_reference, hgvs_reference))
+
+		if fasta_reference != hgvs_reference:
+			if fasta_reference == '' and hgvs_reference is None:
+				pass
+			else:
+				notes = 'Variant: %s . ***SERIOUS*** Reference on fasta (%s) and Reference on variant name (%s) are different!' % (variant, fasta_reference, hgvs_reference)
+				logging.error(notes)
+				self.current_fatal_error.append(notes)
+
+		logging.info('Variant: %s . Fasta length: %i' % (variant, fasta_length))
+		logging.info('Variant: %s . Variant position: %i' % (variant, hgvs_position))
+
 		logging.info('Variant: %s . Chunk position [start, end] = [%i, %i]' % (variant, chunk_start, chunk_end))
 		logging.info('Variant: %s . Position of variant in chunk: %i ' % (variant, relative_pos))
-		logging.info('Variant: %s . Reference on chunk: %s   Reference on fasta: %s  Reference at variant position +/- 1: %s' % (variant, fasta_chunk[relative_pos-1], fasta[hgvs_position-1], fasta_chunk[relative_pos-2:relative_pos+1]))
-
-		assert fasta_chunk[relative_pos-1] == fasta[hgvs_position-1]
+		logging.info('Variant: %s . Reference on chunk: %s   Reference at variant position +/- 1: %s' % (variant, fasta_chunk[relative_pos-1], fasta_chunk[relative_pos-2:relative_pos+1]))
 
 		#Now that we have a fair sample of the sample 
 		# We can blat it!
+		if self.blat_backend == 'local':
+			logging.info('Variant: %s . Aligning chunk with the local aligner..' % (variant))
+			chrom, human_genome_position, direction = self.local_aligner.align(fasta_chunk, relative_pos)
+			source = 'LOCAL_BLAT'
+		else:
+			chrom, human_genome_position, direction = self._blat_ucsc(variant, hgvs_transcript, fasta_chunk, chunk_start, chunk_end, relative_pos)
+			source = 'BLAT'
+		if human_genome_position is None:
+			return None
+		logging.info('Variant: %s . Blat alignment position: %i, direction: %s' % (variant, human_genome_position, direction))
+
+		#Invert reference / alternative if sequence was located in negative strand 
+		if direction == '-':
+			# TODO : Reverse also sequence for deletions / additions 
+			hgvs_reference = self.inverse(hgvs_reference)
+			hgvs_alternative = self.inverse(hgvs_alternative)
+
+		ret = self._build_ret_dict(chrom, human_genome_position, hgvs_reference, hgvs_alternative, self.genome, source, ' / '.join(self.current_fatal_error))
+		return ret
+
+	def _blat_ucsc(self, variant, hgvs_transcript, fasta_chunk, chunk_start, chunk_end, relative_pos):
+		'''
+		Align fasta_chunk with UCSC's blat and locate relative_pos in the alignment
+		Returns chrom, position, direction
+		'''
+
 		blat_filename = self._create_blat_filename(hgvs_transcript, chunk_start, chunk_end)
 		logging.info('Variant: %s . Blat results filename: %s' % (variant, blat_filename) )
-		if not Utils.file_exists(blat_filename):
-			logging.info('Variant: %s . Blat filename does not exist. Requesting it from UCSC..' % (variant) )
-			self._perform_blat(fasta_chunk, blat_filename)
+		with Utils.single_flight(blat_filename) as missing:
+			if missing:
+				if self.offline:
+					self._offline_miss('Variant: %s . UCSC BLAT results' % (variant))
+					return None, None, None
+				logging.info('Variant: %s . Blat filename does not exist. Requesting it from UCSC..' % (variant) )
+				self._perform_blat(fasta_chunk, blat_filename)
 
 		logging.info('Variant: %s . Blat results filename exists (or created). Parsing it..' % (variant))
 		blat = self._parse_blat_results_filename(blat_filename)
@@ -753,46 +1300,39 @@ Default: Same as the ``genome`` parameter.
 		blat_alignment_filename = self._create_blat_alignment_filename(hgvs_transcript, chunk_start, chunk_end)
 		logging.info('Variant: %s . Blat alignment filename: %s' % (variant, blat_alignment_filename))
 
-		if not Utils.file_exists(blat_alignment_filename):
-			logging.info('Variant: %s . Blat alignment filename does not exist. Creating it..' % (variant))
-			blat_temp_alignment_filename = blat_alignment_filename + '.tmp'
-			logging.info('Variant: %s . Temporary blat alignment filename: %s' % (variant, blat_temp_alignment_filename))
-			logging.info('Variant: %s . Downloading Details url in Temporary blat alignment filename' % (variant))
-			Utils.download(blat_details_url, blat_temp_alignment_filename)
-			logging.info('Variant: %s . Parsing temporary blat alignment filename' % (variant))
-			with open(blat_temp_alignment_filename) as blat_temp_alignment_file:
-				blat_temp_alignment_soup =  BeautifulSoup(blat_temp_alignment_file)
-			blat_real_alignment_url = 'https://genome.ucsc.edu/' + blat_temp_alignment_soup.find_all('frame')[1]['src'].replace('../', '')
-			logging.info('Variant: %s . Real blat alignment URL: %s' % (variant, blat_real_alignment_url))
-			blat_real_alignment_filename = blat_alignment_filename + '.html'
-			logging.info('Variant: %s . Real blat alignment filename: %s' % (variant, blat_real_alignment_url))
-			logging.info('Variant: %s . Downloading real blat alignment filename..' % (variant))
-			Utils.download(blat_real_alignment_url, blat_real_alignment_filename)
-			logging.info('Variant: %s . Reading content from real alignment filename' % (variant))
-			with open(blat_real_alignment_filename) as blat_real_alignment_file:
-				# We have to set html.parser otherwise parsing is incomplete
-				blat_real_alignment_soup = BeautifulSoup(blat_real_alignment_file, 'html.parser')
-				#Take the complete text
-				blat_real_alignment_text = blat_real_alignment_soup.text
-
-			logging.info('Variant: %s . Saving content to blat alignment filename: %s' % (variant, blat_alignment_filename))
-			with open(blat_alignment_filename, 'w') as blat_alignment_file:
-				blat_alignment_file.write(blat_real_alignment_text)
+		with Utils.single_flight(blat_alignment_filename) as missing:
+			if missing:
+				if self.offline:
+					self._offline_miss('Variant: %s . UCSC BLAT alignment' % (variant))
+					return None, None, None
+				logging.info('Variant: %s . Blat alignment filename does not exist. Creating it..' % (variant))
+				blat_temp_alignment_filename = blat_alignment_filename + '.tmp'
+				logging.info('Variant: %s . Temporary blat alignment filename: %s' % (variant, blat_temp_alignment_filename))
+				logging.info('Variant: %s . Downloading Details url in Temporary blat alignment filename' % (variant))
+				Utils.download(blat_details_url, blat_temp_alignment_filename)
+				logging.info('Variant: %s . Parsing temporary blat alignment filename' % (variant))
+				with open(blat_temp_alignment_filename) as blat_temp_alignment_file:
+					blat_temp_alignment_soup =  BeautifulSoup(blat_temp_alignment_file)
+				blat_real_alignment_url = 'https://genome.ucsc.edu/' + blat_temp_alignment_soup.find_all('frame')[1]['src'].replace('../', '')
+				logging.info('Variant: %s . Real blat alignment URL: %s' % (variant, blat_real_alignment_url))
+				blat_real_alignment_filename = blat_alignment_filename + '.html'
+				logging.info('Variant: %s . Real blat alignment filename: %s' % (variant, blat_real_alignment_url))
+				logging.info('Variant: %s . Downloading real blat alignment filename..' % (variant))
+				Utils.download(blat_real_alignment_url, blat_real_alignment_filename)
+				logging.info('Variant: %s . Reading content from real alignment filename' % (variant))
+				with open(blat_real_alignment_filename) as blat_real_alignment_file:
+					# We have to set html.parser otherwise parsing is incomplete
+					blat_real_alignment_soup = BeautifulSoup(blat_real_alignment_file, 'html.parser')
+					#Take the complete text
+					blat_real_alignment_text = blat_real_alignment_soup.text
+
+				logging.info('Variant: %s . Saving content to blat alignment filename: %s' % (variant, blat_alignment_filename))
+				with Utils.atomic_write(blat_alignment_filename) as blat_alignment_file:
+					blat_alignment_file.write(blat_real_alignment_text)
 
 		logging.info('Variant: %s . Blat alignment filename exists (or created)' % (variant))
 		human_genome_position, direction = self._find_alignment_position_in_blat_result(blat_alignment_filename, relative_pos, verbose=True)
-		if human_genome_position is None:
-			return None
-		logging.info('Variant: %s . Blat alignment position: %i, direction: %s' % (variant, human_genome_position, direction))
-
-		#Invert reference / alternative if sequence was located in negative strand 
-		if direction == '-':
-			# TODO : Reverse also sequence for deletions / additions 
-			hgvs_reference = self.inverse(hgvs_reference)
-			hgvs_alternative = self.inverse(hgvs_alternative)
-
-		ret = self._build_ret_dict(chrom, human_genome_position, hgvs_reference, hgvs_alternative, self.genome, 'BLAT', ' / '.join(self.current_fatal_error))
-		return ret
+		return chrom, human_genome_position, direction
 
 	def get_elements_from_hgvs(self, hgvs):
 		hgvs_transcript = hgvs.ac
@@ -806,7 +1346,7 @@ Default: Same as the ``genome`` parameter.
 
 		return hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative
 
-	def get_info(self, variant, empty_current_fatal_error=True, **kwargs):
+	def get_info(self, variant, empty_current_fatal_error=True, genome=None, **kwargs):
 		"""
 		Gets the chromosome, position, reference and alternative of a `dbsnp <http://www.ncbi.nlm.nih.gov/SNP/>`_ or `HGVS <http://varnomen.hgvs.org/>`_ variant. \
 		If the ``method`` parameter is not specified, by default it will go through the following pipeline:
@@ -818,12 +1358,18 @@ Default: Same as the ``genome`` parameter.
 
 		Optional arguments:
 
+		:param genome: The assembly of the result for this call only (i.e. ``'hg38'``). The resources of this assembly (reference genome, \
+local dbSNP, UCSC connection) are loaded the first time it is used. Assembly independent resources (Entrez cache, LOVD, UTA) are shared. \
+Default: the genome of the constructor. 
+
 		:param method: Instead of the default pipeline, use a specific tool. Accepted values are:
 
 		- ``UCSC`` : Use `CruzDB <https://github.com/brentp/cruzdb>`_ (only for dbsnp variants)
+		- ``LOCAL_DBSNP`` : Use the local dbSNP index (see :py:func:`install_local_dbsnp`) (only for dbsnp variants)
 		- ``VEP`` : Use `Variant Effect Predictor <http://www.ensembl.org/info/docs/tools/vep/index.html>`_ (only for dbsnp variants)  
 		- ``MYVARIANTINFO`` : Use `MyVariant.info <http://myvariant.info/>`_ (only for dbsnp variants)
 		- ``BIOCOMMONS`` : Use `Biocommons HGVS <https://bitbucket.org/biocommons/hgvs>`_ (only for HGVS variants)
+		- ``LOCAL_REFGENE`` : Use the exon tables of genes.refGene (only for c. and n. HGVS variants on hg19)
 		- ``COUNSYL`` : Use `Counsyl HGVS <https://github.com/counsyl/hgvs>`_ (only for HGVS variants)
 		- ``MUTALYZER`` : Use `Mutalyzer <https://mutalyzer.nl/>`_ (only for HGVS variants)
 		- ``BLAT`` : Perform a BLAT search (only for HGVS variants)
@@ -856,22 +1402,276 @@ Default: Same as the ``genome`` parameter.
 
 		"""
 
-		if empty_current_fatal_error:
-			self.current_fatal_error = []
+		with Utils.network_guard(self.offline), self.using_genome(genome):
+			ret = self._get_info_coalesced(variant, empty_current_fatal_error, **kwargs)
 
-		#Check if a preferred info is in parameters:
-		if 'method' in kwargs:
-			if kwargs['method'] == 'UCSC':
-				return self.get_info_ucsc(variant)
-			elif kwargs['method'] == 'VEP':
-				return self.get_info_vep(variant, **kwargs)
-			elif kwargs['method'] == 'MYVARIANTINFO':
-				return self.get_info_myvariantinfo(variant)
-			elif kwargs['method'] == 'BIOCOMMONS':
-				return self.get_info_biocommons(variant)
-			elif kwargs['method'] == 'COUNSYL':
-				return self.get_info_counsyl(variant)
-			elif kwargs['method'] == 'MUTALYZER':
+			if not self.liftover is None:
+				ret = self._liftover_results(ret)
+
+			if self.verify_reference:
+				ret = self._verify_results(ret)
+
+		return ret
+
+	def _get_info_coalesced(self, variant, empty_current_fatal_error=True, **kwargs):
+		'''
+		Runs _get_info. Identical concurrent requests are run only once.
+		'''
+
+		key = self._coalescing_key(variant, empty_current_fatal_error, kwargs)
+		if key is None:
+			return self._get_info(variant, empty_current_fatal_error, **kwargs)
+
+		return self.coalescer.run(key, self._get_info, variant, empty_current_fatal_error, **kwargs)
+
+	def _ucsc_genome(self, genome):
+		'''
+		The UCSC name of the assembly that a tool reported (i.e. GRCh37.p13 --> hg19). None if it is unknown.
+		'''
+
+		if genome is None:
+			return None
+
+		genome = str(genome)
+		if re.match(r'hg[\d]+$', genome):
+			return genome
+
+		for ucsc_genome, GrCh_genome in self.GrCh_genomes.iteritems():
+			if genome.upper().startswith(GrCh_genome.upper()):
+				return ucsc_genome
+
+		return None
+
+	def _liftover_results(self, results):
+		'''
+		Convert the positions of get_info results to self.genome (see the liftover parameter).
+		The positions of all results that are on the same assembly are converted with a single :py:func:`LiftOver.convert` call.
+		Returns copies. Results of the coalescer are shared between threads.
+		'''
+
+		results = copy.deepcopy(results)
+		to_lift = {} # Source assembly --> results
+
+		def collect(result):
+			if type(result) is list:
+				for x in result:
+					collect(x)
+			elif type(result) is dict and type(result.get('offset')) in [int, long]:
+				source = self._ucsc_genome(result.get('genome'))
+				if source is None or source == self.genome:
+					return
+				to_lift.setdefault(source, []).append(result)
+
+		collect(results)
+
+		for source, source_results in to_lift.iteritems():
+			chroms = []
+			for result in source_results:
+				chrom = str(result['chrom']).upper()
+				chroms.append('chrM' if chrom == 'MT' else 'chr' + chrom)
+
+			try:
+				lifted = self.liftover.convert(source, chroms, [result['offset'] for result in source_results])
+			except urllib2.URLError as e:
+				logging.error('Could not get the chain file from %s to %s: %s' % (source, self.genome, str(e)))
+				lifted = [None] * len(source_results)
+
+			for result, lifted_position in zip(source_results, lifted):
+				if lifted_position is None:
+					note = 'Could not lift over %s:%i from %s to %s' % (result['chrom'], result['offset'], result['genome'], self.genome)
+					logging.warning(note)
+					result['notes'] = ' / '.join([x for x in [result.get('notes'), note] if x])
+					continue
+
+				lifted_chrom, lifted_offset, lifted_strand = lifted_position
+				result['original_chrom'] = result['chrom']
+				result['original_offset'] = result['offset']
+				result['original_genome'] = result['genome']
+
+				if lifted_strand == '-':
+					# The variant is reversed. The first base of the reference is now the last
+					ref = result['ref']
+					if type(ref) in [str, unicode] and len(ref) > 1:
+						lifted_offset -= len(ref) - 1
+					try:
+						result['ref'] = [MutationInfo.reverse_inverse(x) for x in ref] if type(ref) is list else MutationInfo.reverse_inverse(ref)
+						alt = result['alt']
+						result['alt'] = [MutationInfo.reverse_inverse(x) for x in alt] if type(alt) is list else MutationInfo.reverse_inverse(alt)
+					except KeyError:
+						logging.warning('Could not reverse the alleles of: %s' % (str(result)))
+
+				result.update(self._build_ret_dict(lifted_chrom, lifted_offset, result['ref'], result['alt'], self.genome, result['source'], result.get('notes', '')))
+
+		return results
+
+	def verify_references(self, chroms, offsets, refs):
+		"""
+		Checks in a single vectorized pass over the local reference genome that the reference alleles of many variants are correct. 
+
+		:param chroms: A list of chromosomes (i.e. ``'1'``, ``'chrX'``)
+		:param offsets: A list of positions (1-based, position of the first base of the reference allele)
+		:param refs: A list of reference alleles
+
+		:return: A list with one value per variant: 
+
+		- ``'match'`` : The reference allele matches the reference genome
+		- ``'reverse'`` : The reverse complement of the reference allele matches the reference genome (the variant is on the other strand)
+		- ``'mismatch'`` : The reference allele does not match the reference genome
+		- ``None`` : It could not be checked (empty reference allele, unknown chromosome or position outside of the chromosome)
+
+		"""
+
+		ret = [None] * len(refs)
+		genome_chroms = {} # Memoization of _genome_chrom
+		by_chrom = {} # Chromosome name in the genome --> indexes of the variants
+
+		for index, (chrom, offset, ref) in enumerate(zip(chroms, offsets, refs)):
+			if not type(ref) in [str, unicode] or not ref or not type(offset) in [int, long]:
+				continue
+			if not chrom in genome_chroms:
+				genome_chroms[chrom] = self._genome_chrom(chrom)
+			if genome_chroms[chrom] is None:
+				continue
+			by_chrom.setdefault(genome_chroms[chrom], []).append(index)
+
+		for name, indexes in by_chrom.iteritems():
+			chromosome = self.counsyl_hgvs.sequence_genome[name]
+			statuses = MutationInfo._compare_references(chromosome, [offsets[i] - 1 for i in indexes], [str(refs[i]).upper() for i in indexes])
+			for index, status in zip(indexes, statuses):
+				ret[index] = status
+
+		return ret
+
+	_complement_codes = np.array([ord(string.maketrans('ACGTN', 'TGCAN')[x]) for x in range(256)], dtype=np.uint8)
+
+	@staticmethod
+	def _compare_references(chromosome, starts, refs):
+		'''
+		Vectorized part of verify_references. starts are 0-based. refs are upper case and not empty.
+		The bases of all references are concatenated and compared with the bases of the chromosome in both directions.
+		'''
+
+		starts = np.array(starts, dtype=np.int64)
+		lengths = np.array([len(ref) for ref in refs], dtype=np.int64)
+		ref_bases = np.frombuffer(''.join(refs), dtype=np.uint8)
+		record_starts = np.cumsum(lengths) - lengths
+
+		inside = np.repeat((starts >= 0) & (starts + lengths <= len(chromosome)), lengths)
+		within = np.arange(len(ref_bases)) - np.repeat(record_starts, lengths) # Position of every base in its reference
+		forward_positions = np.where(inside, np.repeat(starts, lengths) + within, 0)
+		reverse_positions = np.where(inside, np.repeat(starts + lengths - 1, lengths) - within, 0)
+
+		wildcard = ref_bases == ord('N')
+		forward = (chromosome.bases_at(forward_positions) == ref_bases) | wildcard
+		reverse = (MutationInfo._complement_codes[chromosome.bases_at(reverse_positions)] == ref_bases) | wildcard
+		inside = np.logical_and.reduceat(inside, record_starts)
+		forward = np.logical_and.reduceat(forward, record_starts)
+		reverse = np.logical_and.reduceat(reverse, record_starts)
+
+		ret = []
+		for is_inside, is_forward, is_reverse in zip(inside, forward, reverse):
+			if not is_inside:
+				ret.append(None)
+			elif is_forward:
+				ret.append('match')
+			elif is_reverse:
+				ret.append('reverse')
+			else:
+				ret.append('mismatch')
+		return ret
+
+	def _genome_chrom(self, chrom):
+		'''
+		The name of a chromosome in the local reference genome (i.e. 'x' --> 'chrX', 'MT' --> 'chrM'). None if it does not exist.
+		'''
+		chrom = str(chrom).upper().replace('CHR', '')
+		for name in ['chrM' if chrom in ['M', 'MT'] else 'chr' + chrom, chrom]:
+			if name in self.counsyl_hgvs.sequence_genome:
+				return name
+		return None
+
+	def _verify_results(self, results):
+		'''
+		Add a note to the get_info results whose reference allele does not match the local reference genome (see the verify_reference parameter).
+		All results are checked with a single :py:func:`verify_references` call. 
+		Returns copies. Results of the coalescer are shared between threads.
+		'''
+
+		results = copy.deepcopy(results)
+		to_verify = []
+
+		def collect(result):
+			if type(result) is list:
+				for x in result:
+					collect(x)
+			elif type(result) is dict and result.get('genome') == self.genome:
+				to_verify.append(result)
+
+		collect(results)
+		statuses = self.verify_references([x['chrom'] for x in to_verify], [x['offset'] for x in to_verify], [x['ref'] for x in to_verify])
+
+		for result, status in zip(to_verify, statuses):
+			if status == 'mismatch':
+				note = 'Reference allele %s does not match the reference genome %s at %s:%i' % (result['ref'], self.genome, result['chrom'], result['offset'])
+			elif status == 'reverse':
+				note = 'Reference allele %s matches the reverse strand of the reference genome %s at %s:%i' % (result['ref'], self.genome, result['chrom'], result['offset'])
+			else:
+				continue
+			logging.warning(note)
+			result['notes'] = ' / '.join([x for x in [result.get('notes'), note] if x])
+
+		return results
+
+	def _coalescing_key(self, variant, empty_current_fatal_error, kwargs):
+		'''
+		The key under which identical concurrent get_info requests are coalesced. 
+		Returns None if this request should not be coalesced.
+		'''
+		if not empty_current_fatal_error:
+			# Internal call that continues an existing pipeline
+			return None
+
+		if not type(variant) in [str, unicode]:
+			return None
+
+		canonical_key = self.canonical_key(variant, **kwargs)
+		if canonical_key is None:
+			return None
+
+		try:
+			key = (self.genome, canonical_key, tuple(sorted(kwargs.items())))
+			hash(key)
+		except TypeError:
+			# Unhashable arguments
+			return None
+
+		return key
+
+	def _get_info(self, variant, empty_current_fatal_error=True, **kwargs):
+		'''
+		The get_info pipeline. See get_info for documentation
+		'''
+
+		if empty_current_fatal_error:
+			self.current_fatal_error = []
+
+		#Check if a preferred info is in parameters:
+		if 'method' in kwargs:
+			if kwargs['method'] == 'UCSC':
+				return self.get_info_ucsc(variant)
+			elif kwargs['method'] == 'LOCAL_DBSNP':
+				return self.get_info_local_dbsnp(variant)
+			elif kwargs['method'] == 'VEP':
+				return self.get_info_vep(variant, **kwargs)
+			elif kwargs['method'] == 'MYVARIANTINFO':
+				return self.get_info_myvariantinfo(variant)
+			elif kwargs['method'] == 'BIOCOMMONS':
+				return self.get_info_biocommons(variant)
+			elif kwargs['method'] == 'LOCAL_REFGENE':
+				return self.get_info_local_refgene(variant)
+			elif kwargs['method'] == 'COUNSYL':
+				return self.get_info_counsyl(variant)
+			elif kwargs['method'] == 'MUTALYZER':
 				return self.get_info_mutalyzer(variant)
 			elif kwargs['method'] == 'LOVD':
 				return self.get_info_LOVD(variant)
@@ -886,7 +1686,19 @@ Default: Same as the ``genome`` parameter.
 
 		#Check the type of variant
 		if type(variant) is list:
-			ret = [self.get_info(v) for v in variant]
+			# Equivalent variants in the list are resolved only once
+			resolved = {}
+			ret = []
+			for v in variant:
+				key = self.canonical_key(v)
+				if key is None:
+					ret.append(self._get_info_coalesced(v))
+				elif key in resolved:
+					logging.info('Variant: %s . Same as a previous variant in the list (%s)' % (str(v), key))
+					ret.append(copy.deepcopy(resolved[key]))
+				else:
+					resolved[key] = self._get_info_coalesced(v)
+					ret.append(resolved[key])
 			return ret
 		elif type(variant) is unicode:
 			logging.info('Converting variant: %s from unicode to str and rerunning..' % (variant))
@@ -900,11 +1712,20 @@ Default: Same as the ``genome`` parameter.
 			return None
 
 		#Is this an rs variant?
-		match = re.match(r'rs[\d]+', variant)
+		match = re.match(r'^rs[\d]+$', variant)
 		if match:
 			# This is an rs variant 
 			logging.info('Variant %s is an rs variant' % (variant))
 
+			# Local dbSNP index 
+			if not self.local_dbsnp is None:
+				logging.info('Variant: %s . Trying local dbSNP..' % (variant))
+				ret = self.get_info_local_dbsnp(variant)
+				if ret:
+					return ret
+				else:
+					logging.warning('Variant: %s . Local dbSNP failed' % (variant))
+
 			# Variant Effect Predictor
 			logging.info('Variant: %s . Trying VEP..' % (variant))
 			ret = self.get_info_vep(variant, **kwargs)
@@ -926,6 +1747,8 @@ Default: Same as the ``genome`` parameter.
 			ret = self._get_info_rs(variant)
 			if not ret:
 				logging.warning('Variant: %s CruzDB (UCSC) failed..'% (variant))
+				if self.current_fatal_error:
+					return {'notes': ' / '.join(self.current_fatal_error)}
 				return ret
 			elif ret['alt'] == 'lengthTooLong':
 				logging.warning('Variant: %s . CruzDB (UCSC) Returned "lengthTooLong"' % (variant))
@@ -961,8 +1784,18 @@ Default: Same as the ``genome`` parameter.
 		hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = self.get_elements_from_hgvs(hgvs)
 
 
+		#Try to map the variant locally with refGene. Remote methods are tried only if this fails
+		if hgvs_type in ['c', 'n']:
+			logging.info('Variant: %s . Trying local refGene..' % (variant))
+			ret = self.get_info_local_refgene(hgvs)
+			if ret:
+				return ret
+			logging.info('Variant: %s . Local refGene failed' % (variant))
+
 		#Try to map the variant in the reference assembly with biocommons
-		if hgvs_type == 'c':
+		if hgvs_type == 'c' and self.biocommons_hdp is None:
+			self._offline_miss('Variant: %s . UTA (biocommons)' % (variant))
+		elif hgvs_type == 'c':
 			logging.info('Variant: %s . Trying to map variant in the reference assembly with biocommons' % (variant))
 			success = False
 
@@ -981,12 +1814,12 @@ Default: Same as the ``genome`` parameter.
 						hgvs_transcript, hgvs_type, hgvs_position, hgvs_reference, hgvs_alternative = self.get_elements_from_hgvs(hgvs_reference_assembly)
 						success = True
 						retry = 0
-					except hgvs_biocommons.exceptions.HGVSDataNotAvailableError as e:
+					except hgvs_biocommons_exceptions.HGVSDataNotAvailableError as e:
 						error_message = 'Variant: %s . biocommons method %s method failed: %s' % (variant, biocommons_vm_name, str(e))
 						logging.warning(error_message)
 						self.current_fatal_error.append(error_message)
 						retry = 0
-					except hgvs_biocommons.exceptions.HGVSError as e:
+					except hgvs_biocommons_exceptions.HGVSError as e:
 						error_message = 'Variant: %s . biocommons method %s reported error: %s' % (variant,  biocommons_vm_name, str(e))
 						logging.error(error_message)
 						self.current_fatal_error.append(error_message)
@@ -1006,13 +1839,12 @@ Default: Same as the ``genome`` parameter.
 		#Is this a reference assembly?
 		if self._get_ncbi_accession_type(hgvs_transcript) == 'NC':
 			logging.info('Variant: %s . is a Complete genomic molecule, reference assembly' % (variant))
-			#ncbi_info = self._get_info_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='asn.1')
-			ncbi_info = self._get_data_from_nucleotide_entrez(hgvs_transcript, retmode='text', rettype='asn.1')
-			search = re.search(r'Homo sapiens chromosome ([\w]+), ([\w\.]+) Primary Assembly', ncbi_info)
-			if search is None:
+			assembly_info = self._get_assembly_info(hgvs_transcript)
+			if assembly_info is None:
 				logging.error('Variant: %s . Although this variant is a reference assembly, could not locate the chromosome and assembly name in the NCBI entry' % (variant))
 				return None
-			ret = self._build_ret_dict(search.group(1), hgvs_position, hgvs_reference, hgvs_alternative, search.group(2), 'NC_transcript', ' / '.join(self.current_fatal_error))
+			entrez_chromosome, entrez_genome, _ = assembly_info
+			ret = self._build_ret_dict(entrez_chromosome, hgvs_position, hgvs_reference, hgvs_alternative, entrez_genome, 'NC_transcript', ' / '.join(self.current_fatal_error))
 			return ret
 
 		logging.info('Biocommons Failed')
@@ -1078,6 +1910,26 @@ Default: Same as the ``genome`` parameter.
 
 		return MutationInfo.inverse(nucleotide)[::-1]
 
+	def _cache_directory(self, *namespace):
+		'''
+		Create (if it does not exist) and return a cache directory under local_directory.
+		Artefacts that depend on the assembly or on the dbSNP version should include them in the namespace
+		(for example: ``self._cache_directory('blat', self.genome)``) so that instances with different 
+		settings can share the same local_directory. Assembly independent artefacts (i.e. Entrez records) are stored once.
+		'''
+		directory = os.path.join(self.local_directory, *namespace)
+		Utils.mkdir_p(directory)
+		return directory
+
+	def _offline_miss(self, what):
+		'''
+		Offline mode: note that what is not available locally. Returns None
+		'''
+		message = 'Offline mode: %s is not available locally' % (what)
+		logging.warning(message)
+		self.current_fatal_error.append(message)
+		return None
+
 	def _create_blat_filename(self, transcript, chunk_start, chunk_end):
 		return os.path.join(self.blat_directory, 
 			transcript + '_' + str(chunk_start) + '_' + str(chunk_end) + '.blat.results.html')
@@ -1091,6 +1943,9 @@ Default: Same as the ``genome`` parameter.
 		http://www.ncbi.nlm.nih.gov/books/NBK25499/table/chapter4.T._valid_values_of__retmode_and/?report=objectonly 
 		'''
 
+		if self.offline:
+			return self._offline_miss('Entrez %s record of %s' % (rettype, ncbi_access_id))
+
 		try:
 			handle = Entrez.efetch(db='nuccore', id=ncbi_access_id, retmode=retmode, rettype=rettype)
 		except urllib2.HTTPError as e:
@@ -1102,26 +1957,181 @@ Default: Same as the ``genome`` parameter.
 		return data
 
 	def _get_data_from_nucleotide_entrez(self, ncbi_access_id, retmode, rettype):
+		'''
+		Cached Entrez efetch. FASTA records are returned without the header and the new lines (see :py:func:`_get_sequence_filename`)
+		'''
+
+		if rettype == 'fasta':
+			sequence_filename = self._get_sequence_filename(ncbi_access_id, retmode)
+			if sequence_filename is None:
+				return None
+			with open(sequence_filename, 'rb') as f:
+				return f.read()
+
+		return self._get_entrez_record(ncbi_access_id, retmode, rettype)
+
+	def _get_entrez_record(self, ncbi_access_id, retmode, rettype):
+		'''
+		Returns the Entrez efetch record as it is stored in the cache
+		'''
 
 		filename = self._ncbi_filename(ncbi_access_id, rettype)
 		logging.info('NCBI %s %s filename: %s' % (retmode, rettype, filename))
 
-		if Utils.file_exists(filename):
-			logging.info('NCBI Filename: %s exists.' % (filename))
-			data = self._load_ncbi_filename(ncbi_access_id, rettype)
-		else:
-			logging.info('Filename: %s does not exist. Querying ncbi through Entrez..' % (filename))
-			data = self._entrez_request(ncbi_access_id, retmode, rettype)
-			if data is None:
-				return None
+		with Utils.single_flight(filename) as missing:
+			if missing:
+				logging.info('Filename: %s does not exist. Querying ncbi through Entrez..' % (filename))
+				data = self._entrez_request(ncbi_access_id, retmode, rettype)
+				if data is None:
+					return None
 
-			self._save_ncbi_filename(ncbi_access_id, rettype, data)
-			logging.info('NCBI Filename: %s created.' % (filename))
+				self._save_ncbi_filename(ncbi_access_id, rettype, data)
+				logging.info('NCBI Filename: %s created.' % (filename))
+			else:
+				logging.info('NCBI Filename: %s exists.' % (filename))
+				data = self._load_ncbi_filename(ncbi_access_id, rettype)
 
-		if rettype == 'fasta':
-			return self.strip_fasta(data)
-		else:
-			return data
+		return data
+
+	def _get_sequence_filename(self, ncbi_access_id, retmode='text'):
+		'''
+		<ACCESSION>.seq contains only the bases of the Entrez FASTA record (no header, no new lines). 
+		It is created once from the cached <ACCESSION>.fasta , so that parts of the sequence can be read with :py:func:`Utils.read_file_range` 
+		without loading the complete record.
+		Returns None if the FASTA record is not available.
+		'''
+
+		filename = self._ncbi_filename(ncbi_access_id, 'seq')
+		with Utils.single_flight(filename) as missing:
+			if missing:
+				if not Utils.file_exists(self._ncbi_filename(ncbi_access_id, 'fasta')):
+					if self._get_entrez_record(ncbi_access_id, retmode, 'fasta') is None:
+						return None
+				logging.info('Creating sequence filename: %s' % (filename))
+				Utils.strip_fasta_file(self._ncbi_filename(ncbi_access_id, 'fasta'), filename)
+
+		return filename
+
+	def _entrez_summary_request(self, ncbi_access_id):
+		'''
+		Title and length of a nuccore record through Entrez esummary. This is a few hundred bytes, whereas efetch returns the complete record
+		'''
+
+		if self.offline:
+			return self._offline_miss('Entrez summary of %s' % (ncbi_access_id))
+
+		try:
+			handle = Entrez.esummary(db='nuccore', id=ncbi_access_id)
+			record = Entrez.read(handle)
+			handle.close()
+		except (urllib2.HTTPError, RuntimeError) as e:
+			logging.error('Entrez summary request failed: %s' % (str(e)))
+			return None
+
+		if not len(record):
+			logging.error('Entrez summary request for %s returned no records' % (ncbi_access_id))
+			return None
+
+		return {'title': str(record[0]['Title']), 'length': int(record[0]['Length'])}
+
+	def _get_assembly_info(self, ncbi_access_id):
+		'''
+		Chromosome, assembly and length of a reference assembly accession. 
+		For example: NC_000001.10 --> ('1', 'GRCh37.p13', 249250621)
+		Accessions that are not in the bundled assembly report are looked up (once) with Entrez esummary.
+		Returns None if the accession is not a chromosome of a primary assembly.
+		'''
+
+		key = ncbi_access_id.strip().upper()
+		if key in self.assembly_report:
+			return self.assembly_report[key]
+
+		logging.info('Accession %s is not in the assembly report' % (ncbi_access_id))
+		summary = self._get_entrez_summary(ncbi_access_id)
+		if summary is None:
+			return None
+
+		search = re.search(r'Homo sapiens chromosome ([\w]+), ([\w\.]+) Primary Assembly', summary['title'])
+		if search is None:
+			logging.warning('Accession %s is not a chromosome of a primary assembly. Entrez title: %s' % (ncbi_access_id, summary['title']))
+			return None
+
+		ret = (str(search.group(1)), str(search.group(2)), int(summary['length']))
+		self.assembly_report[key] = ret
+		return ret
+
+	def _get_entrez_summary(self, ncbi_access_id):
+		'''
+		Cached version of :py:func:`_entrez_summary_request`
+		'''
+
+		filename = self._ncbi_filename(ncbi_access_id, 'esummary.json')
+		with Utils.single_flight(filename) as missing:
+			if missing:
+				logging.info('Filename: %s does not exist. Querying ncbi through Entrez esummary..' % (filename))
+				summary = self._entrez_summary_request(ncbi_access_id)
+				if summary is None:
+					return None
+				Utils.save_json_filenane(filename, summary)
+			else:
+				summary = Utils.load_json_filename(filename)
+
+		return summary
+
+	def _get_sequence_length(self, ncbi_access_id):
+		'''
+		Length of the sequence of an accession, without downloading the sequence
+		'''
+
+		assembly_info = self.assembly_report.get(ncbi_access_id.strip().upper())
+		if not assembly_info is None:
+			return assembly_info[2]
+
+		summary = self._get_entrez_summary(ncbi_access_id)
+		if summary is None:
+			return None
+		return summary['length']
+
+	def _get_sequence_range(self, ncbi_access_id, start, end):
+		'''
+		Returns the same as: self._get_data_from_nucleotide_entrez(ncbi_access_id, retmode='text', rettype='fasta')[start:end]
+		but only moves the requested part:
+		* Chromosomes of the installed reference genome are read from the local fasta (unless they were skipped with genome_contigs).
+		* If the complete fasta of the accession has been downloaded before, the range is read from its .seq file through mmap.
+		* Otherwise only [start, end) is fetched with Entrez efetch (seq_start / seq_stop) and cached. 
+		'''
+
+		assembly_info = self.assembly_report.get(ncbi_access_id.strip().upper())
+		if not assembly_info is None and assembly_info[1].startswith(self.genome_GrCh):
+			chrom = 'chr' + assembly_info[0]
+			if chrom in self.counsyl_hgvs.sequence_genome:
+				logging.info('Accession %s is %s of %s. Reading [%i, %i) from the local reference genome' % (ncbi_access_id, chrom, self.genome, start, end))
+				return str(self.counsyl_hgvs.sequence_genome[chrom][start:end]).upper()
+			logging.info('Accession %s is %s of %s. This contig is not installed' % (ncbi_access_id, chrom, self.genome))
+
+		if Utils.file_exists(self._ncbi_filename(ncbi_access_id, 'seq')) or Utils.file_exists(self._ncbi_filename(ncbi_access_id, 'fasta')):
+			return Utils.read_file_range(self._get_sequence_filename(ncbi_access_id), start, end)
+
+		rettype = 'fasta_%i_%i' % (start, end)
+		filename = self._ncbi_filename(ncbi_access_id, rettype)
+		with Utils.single_flight(filename) as missing:
+			if missing:
+				if self.offline:
+					return self._offline_miss('Entrez sequence of %s [%i, %i)' % (ncbi_access_id, start, end))
+				logging.info('Filename: %s does not exist. Querying ncbi through Entrez for [%i, %i)..' % (filename, start, end))
+				try:
+					# seq_start and seq_stop are 1-based, inclusive
+					handle = Entrez.efetch(db='nuccore', id=ncbi_access_id, retmode='text', rettype='fasta', seq_start=start+1, seq_stop=end)
+				except urllib2.HTTPError as e:
+					logging.error('Entrez request failed: %s' % (str(e)))
+					return None
+				data = handle.read()
+				handle.close()
+				self._save_ncbi_filename(ncbi_access_id, rettype, data)
+			else:
+				data = self._load_ncbi_filename(ncbi_access_id, rettype)
+
+		return self.strip_fasta(data)
 
 	@staticmethod
 	def strip_fasta(fasta):
@@ -1136,7 +2146,8 @@ Default: Same as the ``genome`` parameter.
 		Create filename that contains NCBI fasta file
 		rettype : fasta , xml , gb (genbank)
 		'''
-		return os.path.join(self.transcripts_directory, ncbi_access_id + '.' + rettype)
+		# Accessions are case insensitive
+		return os.path.join(self.transcripts_directory, ncbi_access_id.strip().upper() + '.' + rettype)
 
 
 	def _save_ncbi_filename(self, ncbi_access_id, rettype, data):
@@ -1145,7 +2156,7 @@ Default: Same as the ``genome`` parameter.
 		'''
 
 		filename = self._ncbi_filename(ncbi_access_id, rettype)
-		with open(filename, 'w') as f:
+		with Utils.atomic_write(filename) as f:
 			f.write(data)
 
 	def _load_ncbi_filename(self, ncbi_access_id, rettype):
@@ -1183,7 +2194,7 @@ Default: Same as the ``genome`` parameter.
 		r = requests.post(self.ucsc_blat_url, data=data)
 		logging.info('   ... Request is done')
 
-		with open(output_filename, 'w') as f:
+		with Utils.atomic_write(output_filename) as f:
 			f.write(r.text)
 
 		return True
@@ -1348,28 +2359,111 @@ Default: Same as the ``genome`` parameter.
 		ret = search.group()[0:-1] # Remove '_'
 		return ret
 
-	#@staticmethod
-	def _biopython_c2g_mapper(self, filename):
+	@staticmethod
+	def _features_from_feature_table(feature_table):
+		'''
+		Parse an NCBI feature table (efetch rettype=ft). Format: https://www.ncbi.nlm.nih.gov/Sequin/table.html 
+		Returns a list of (feature type, [[start, end, strand], ...]) in the order of the table. 
+		Locations are 0-based, end exclusive (as in biopython).
 		'''
-		See comments at top!
 
-		Using this biopython mapper: https://github.com/lennax/biopython/tree/f_loc5/Bio/SeqUtils/Mapper
-		This code is adapted from: https://gist.github.com/lennax/10600113  
+		ret = []
+		for l in feature_table.split('\n'):
+			if not l.strip() or l[0] in '>\t':
+				# Empty, record header or qualifier line
+				continue
+
+			ls = l.rstrip('\r').split('\t')
+			try:
+				start, end = int(ls[0].strip('<>')), int(ls[1].strip('<>'))
+			except ValueError:
+				# i.e. 123^124 
+				continue
+
+			if start <= end:
+				interval = [start-1, end, 1]
+			else:
+				# Complement
+				interval = [end-1, start, -1]
+
+			if len(ls) > 2 and ls[2]:
+				# A new feature
+				ret.append((ls[2], [interval]))
+			elif len(ret):
+				# Another interval of the last feature
+				ret[-1][1].append(interval)
+
+		return ret
+
+	@staticmethod
+	def _features_from_genbank(filename):
+		'''
+		Same as :py:func:`_features_from_feature_table` for a genbank file
+		'''
+
+		ret = []
+		for rec in SeqIO.parse(filename, "genbank"):
+			for feat in rec.features:
+				ret.append((feat.type, [[int(part.start), int(part.end), part.strand] for part in feat.location.parts]))
+
+		return ret
+
+	def _get_exons_from_entrez(self, ncbi_access_id):
 		'''
+		The exons that :py:func:`_biopython_c2g_mapper` needs: The locations of the first CDS with more than one part.
+		If there isn't any, the first mRNA and then the first CDS.
+		These come from the feature table of the accession which (unlike gbwithparts) does not contain the sequence.
+		The exons are stored in a small per accession json file. Empty results are not stored, so they are requested again next time. 
+		'''
+
+		filename = self._ncbi_filename(ncbi_access_id, 'exons.json')
+		with Utils.single_flight(filename) as missing:
+			if not missing:
+				return Utils.load_json_filename(filename)
+
+			logging.info('Filename: %s does not exist. Querying ncbi through Entrez for the feature table..' % (filename))
+			feature_table = self._entrez_request(ncbi_access_id, retmode='text', rettype='ft')
+			if feature_table:
+				features = self._features_from_feature_table(feature_table)
+			else:
+				logging.warning('Could not get the feature table of %s . Falling back to genbank..' % (ncbi_access_id))
+				genbank = self._get_data_from_nucleotide_entrez(ncbi_access_id, retmode='text', rettype='gbwithparts')
+				if genbank is None:
+					return None
+				features = self._features_from_genbank(self._ncbi_filename(ncbi_access_id, 'gbwithparts'))
+
+			def get_first_CDS(feat_type='CDS', max_feat_location_parts=1):
+				for feature_type, locations in features:
+					if feature_type == feat_type and len(locations) > max_feat_location_parts:
+						return locations
+
+				return None # This is by default but it looks nicer..
+
+			exons = get_first_CDS()
+			if exons is None:
+				logging.warning('Could not find any CDS (exons) information in %s . Looking for mRNA..' % (ncbi_access_id))
+				exons = get_first_CDS(feat_type='mRNA', max_feat_location_parts=0)
+			if exons is None:
+				logging.error('Could not find mRNA information in %s . Trying a 1 size exon..' % (ncbi_access_id))
+				exons = get_first_CDS(max_feat_location_parts=0)
+			if exons is None:
+				logging.warning('Could not find any exons in the features of %s' % (ncbi_access_id))
+				return []
 
-		def get_parser():
-			return SeqIO.parse(filename, "genbank")
+			Utils.save_json_filenane(filename, exons)
 
-		def get_first_CDS(feat_type='CDS', max_feat_location_parts=1):
+		return exons
 
-			parser = get_parser()
+	#@staticmethod
+	def _biopython_c2g_mapper(self, exons):
+		'''
+		See comments at top!
 
-			for rec in parser:
-				for feat in rec.features:
-					if feat.type == feat_type and len(feat.location.parts) > max_feat_location_parts:
-						return feat
+		Using this biopython mapper: https://github.com/lennax/biopython/tree/f_loc5/Bio/SeqUtils/Mapper
+		This code is adapted from: https://gist.github.com/lennax/10600113  
 
-			return None # This is by default but it looks nicer..
+		exons: As returned from :py:func:`_get_exons_from_entrez`
+		'''
 
 		def make_ret_function(cm):
 
@@ -1382,7 +2476,7 @@ Default: Same as the ``genome`` parameter.
 					self.current_fatal_error += ['Could not convert from c. to g. Could not find position in exons. Error message: %s' % (str(e))]
 					logging.error(self.current_fatal_error[-1])
 					return None
-				except biopython_GenomePositionError as e:
+				except biopython_MapPositions.GenomePositionError as e:
 					self.current_fatal_error += [str(e)]
 					logging.error(self.current_fatal_error[-1])
 					return None
@@ -1391,19 +2485,15 @@ Default: Same as the ``genome`` parameter.
 
 			return ret_f
 
-		exons = get_first_CDS()
-
-		if exons is None:
-			logging.warning('Could not find any CDS (exons) information in %s . Looking for mRNA..' % (filename))
-			exons = get_first_CDS(feat_type='mRNA', max_feat_location_parts=0)
-		if exons is None:
-			logging.error('Could not find mRNA information in %s . Trying a 1 size exon..' % (filename))
-			exons = get_first_CDS(max_feat_location_parts=0)
-		if exons is None:
+		if not exons:
 			logging.error('Could not find a 1 size exon. Returning None')
 			return None
 
-		logging.info('Exons found: %s' % (str(exons)))
+		parts = [FeatureLocation(start, end, strand) for start, end, strand in exons]
+		location = parts[0] if len(parts) == 1 else CompoundLocation(parts)
+		exons = SeqFeature(location, type='CDS')
+
+		logging.info('Exons found: %s' % (str(exons.location)))
 
 		cm = CoordinateMapper(exons)
 
@@ -1709,9 +2799,12 @@ Default: Same as the ``genome`` parameter.
 		logging.info('LOVD genes atom filename: %s' % (self.lovd_genes_atom))
 
 		#Check if genes_atom file exists
-		if not Utils.file_exists(self.lovd_genes_atom):
-			logging.info('File %s does not exist. Downloading from: %s' % (self.lovd_genes_atom, self.lovd_genes_url))
-			Utils.download(self.lovd_genes_url, self.lovd_genes_atom)
+		with Utils.single_flight(self.lovd_genes_atom) as missing:
+			if missing and self.offline:
+				logging.warning('Offline mode: LOVD gene list %s does not exist. LOVD is disabled' % (self.lovd_genes_atom))
+			elif missing:
+				logging.info('File %s does not exist. Downloading from: %s' % (self.lovd_genes_atom, self.lovd_genes_url))
+				Utils.conditional_download(self.lovd_genes_url, self.lovd_genes_atom)
 
 		self.lovd_genes_json = os.path.join(self.lovd_directory, 'genes.json')
 		logging.info('LOVD gene json filename: %s' % (self.lovd_genes_json))
@@ -1721,7 +2814,17 @@ Default: Same as the ``genome`` parameter.
 			self.lovd_transcript_dict = Utils.load_json_filename(self.lovd_genes_json)
 			return
 
+		if not Utils.file_exists(self.lovd_genes_atom):
+			self.lovd_transcript_dict = {}
+			return
+
 		logging.info('LOVD gene json filename does not exist. Creating it..')
+		self._lovd_build_transcript_dict()
+
+	def _lovd_build_transcript_dict(self):
+		'''
+		Build the LOVD transcript --> [gene, refseq_build] dictionary from genes.atom and save it in genes.json
+		'''
 
 		logging.info('Parsing LOVD genes file: %s ..' % (self.lovd_genes_atom))
 		data = feedparser.parse(self.lovd_genes_atom)
@@ -1787,59 +2890,136 @@ Default: Same as the ``genome`` parameter.
 		lovd_gene_filename = os.path.join(self.lovd_directory, gene + '.atom')
 		logging.info('LOVD entry for trascript %s is gene %s ' % (transcript, gene))
 		logging.info('Looking for LOVD file: %s' % (lovd_gene_filename))
-		if not Utils.file_exists(lovd_gene_filename):
-			logging.info('Filename: %s does not exist . Downloading from: %s' % (lovd_gene_filename, lovd_gene_url))
-			Utils.download(lovd_gene_url, lovd_gene_filename)
-		else:
-			logging.info('Filename: %s exists' % (lovd_gene_filename))
+		with Utils.single_flight(lovd_gene_filename) as missing:
+			if missing:
+				if self.offline:
+					self._offline_miss('LOVD variants of gene %s' % (gene))
+					return None, None, None, None
+				logging.info('Filename: %s does not exist . Downloading from: %s' % (lovd_gene_filename, lovd_gene_url))
+				Utils.conditional_download(lovd_gene_url, lovd_gene_filename)
+			else:
+				logging.info('Filename: %s exists' % (lovd_gene_filename))
 
-		logging.info('Parsing XML atom file: %s' % (lovd_gene_filename))
-		data = feedparser.parse(lovd_gene_filename)
+		lovd_gene_index = self._lovd_gene_index(gene)
 
+		if variation in lovd_gene_index:
+			chrom, pos_1 = lovd_gene_index[variation]
+			chrom = str(chrom)
+			if pos_1 == '?':
+				pos_1 = None
+			else:
+				pos_1 = int(pos_1)
+			pos_2 = None
 
-		for entry_index, entry in enumerate(data['entries']):
-			#print entry.keys()
-			#print entry['content']
-			#print len(entry['content'])
-			#print entry['content'][0].keys()
-			#print entry['content'][0]['value']
-			entry_value = entry['content'][0]['value']
+			logging.info('Found: Chrom: %s  pos_1: %s  pos_2: %s Genome: %s' % (str(chrom), str(pos_1), str(pos_2), genome))
+			return chrom, pos_1, pos_2, genome
 
-			# Example: position_mRNA:NM_000367.2:c.*2240
-			position_mRNA =  [''.join(x.split(':')[1:]) for x in entry_value.split('\n') if 'position_mRNA' in x][0]
+		logging.error('Could not find %s:%s in file: %s' % (transcript, variation, lovd_gene_filename))
+		return None, None, None, None
 
-			# Variant/DNA:c.*2240A>T
-			variant_DNA = [x.split(':')[1] for x in entry_value.split('\n') if 'Variant/DNA' in x][0]
+	def _lovd_gene_filenames(self, gene):
+		'''
+		The LOVD variants feed of a gene and its index
+		'''
+		return os.path.join(self.lovd_directory, gene + '.atom'), os.path.join(self.lovd_directory, gene + '.json')
 
-			# Match: 
-			# position_genomic:chr6:18155397
-			# position_genomic:chr6:18155437_18155384 
-			search = re.search(r'position_genomic:chr([\w]+):([\w\?]+)|position_genomic:chr([\w]+):([\w]+)_([\w]+)', entry_value)
-			if search is None:
+	def _lovd_gene_index(self, gene, rebuild=False):
+		'''
+		Index of the LOVD variants feed of a gene: Variant/DNA --> [chromosome, position]
+		The index is stored in <gene>.json and it is rebuilt when the feed is newer than the index
+		'''
+
+		lovd_gene_filename, lovd_gene_index_filename = self._lovd_gene_filenames(gene)
+
+		if not rebuild and Utils.file_exists(lovd_gene_index_filename):
+			if os.path.getmtime(lovd_gene_index_filename) >= os.path.getmtime(lovd_gene_filename):
+				return Utils.load_json_filename(lovd_gene_index_filename)
+
+		logging.info('Parsing XML atom file: %s' % (lovd_gene_filename))
+		data = feedparser.parse(lovd_gene_filename)
+
+		index = {}
+		for entry_index, entry in enumerate(data['entries']):
+			entry_value = entry['content'][0]['value']
+
+			# Variant/DNA:c.*2240A>T
+			variant_DNA = [x.split(':')[1] for x in entry_value.split('\n') if 'Variant/DNA' in x]
+			if not variant_DNA:
+				logging.warning('Filename: %s Could not find Variant/DNA in entry: %s' % (lovd_gene_filename, entry))
+				continue
+			variant_DNA = variant_DNA[0]
+
+			# Match: 
+			# position_genomic:chr6:18155397
+			# position_genomic:chr6:18155437_18155384 
+			search = re.search(r'position_genomic:chr([\w]+):([\w\?]+)|position_genomic:chr([\w]+):([\w]+)_([\w]+)', entry_value)
+			if search is None:
 				logging.warning('Filename: %s Could not find position_genomic in entry: %s' % (lovd_gene_filename, entry))
 				continue
 
-			#print position_mRNA, variant_DNA, position_genomic
-			#print position_mRNA, variant_DNA, variation
-			if variant_DNA == variation:
-				logging.info('Found LOVD entry: \n%s' % entry_value)
-				chrom = search.group(1)
-				pos_1 = search.group(2)
-				if pos_1 == '?':
-					pos_1 = None
-				else:
-					pos_1 = int(pos_1)
+			# Keep the first entry of each variant
+			if not variant_DNA in index:
+				index[variant_DNA] = [search.group(1), search.group(2)]
 
-				if len(search.groups()) == 4:
-					pos_2 = int(search.group(3))
-				else:
-					pos_2 = None
-				
-				logging.info('Found: Chrom: %s  pos_1: %s  pos_2: %s Genome: %s' % (str(chrom), str(pos_1), str(pos_2), genome))
-				return chrom, pos_1, pos_2, genome
+		logging.info('Saving LOVD index: %s with %i variants' % (lovd_gene_index_filename, len(index)))
+		Utils.save_json_filenane(lovd_gene_index_filename, index)
+		return index
 
-		logging.error('Could not find %s:%s in file: %s' % (transcript, variation, lovd_gene_filename))
-		return None, None, None, None
+	def refresh_lovd(self, threads=8):
+		'''
+		Refresh the local LOVD data. 
+		genes.atom and all per gene feeds that have been downloaded are revalidated with conditional HTTP requests 
+		(If-None-Match / If-Modified-Since). Unchanged feeds cost one 304 round-trip. 
+		Changed feeds are downloaded in parallel and only their indexes are rebuilt.
+
+		:param threads: Number of parallel requests for the per gene feeds
+
+		:return: A dictionary with the lists of ``changed``, ``unchanged`` and ``failed`` feeds.
+		'''
+
+		ret = {'changed': [], 'unchanged': [], 'failed': []}
+
+		logging.info('Refreshing LOVD genes file: %s' % (self.lovd_genes_atom))
+		with Utils.file_lock(self.lovd_genes_atom):
+			if Utils.conditional_download(self.lovd_genes_url, self.lovd_genes_atom):
+				ret['changed'].append('genes')
+				self._lovd_build_transcript_dict()
+			else:
+				ret['unchanged'].append('genes')
+
+		genes = sorted(os.path.basename(x)[:-len('.atom')] for x in glob.glob(os.path.join(self.lovd_directory, '*.atom')))
+		genes = [x for x in genes if x != 'genes']
+
+		def refresh_gene(gene):
+			lovd_gene_filename, _ = self._lovd_gene_filenames(gene)
+			try:
+				with Utils.file_lock(lovd_gene_filename):
+					changed = Utils.conditional_download(self.lovd_variants_url.format(gene=gene), lovd_gene_filename)
+					if changed:
+						self._lovd_gene_index(gene, rebuild=True)
+			except (urllib2.URLError, IOError) as e:
+				logging.error('Could not refresh LOVD gene: %s . Error: %s' % (gene, str(e)))
+				return gene, None
+			return gene, changed
+
+		logging.info('Refreshing %i LOVD gene feeds..' % (len(genes)))
+		pool = ThreadPool(max(1, threads))
+		try:
+			results = pool.map(refresh_gene, genes)
+		finally:
+			pool.close()
+			pool.join()
+
+		for gene, changed in results:
+			if changed is None:
+				ret['failed'].append(gene)
+			elif changed:
+				ret['changed'].append(gene)
+			else:
+				ret['unchanged'].append(gene)
+
+		logging.info('LOVD refresh. Changed: %i Unchanged: %i Failed: %i' % (len(ret['changed']), len(ret['unchanged']), len(ret['failed'])))
+		return ret
 
 	def _search_mutalyzer(self, variant, gene=None, **kwargs):
 		'''
@@ -1865,32 +3045,39 @@ Default: Same as the ``genome`` parameter.
 			logging.error('Variant: %s . Variant contains character: "/" . Aborting.. ' % (str(variant_url_encode)) )
 			return None
 
-		variant_filename = os.path.join(self.mutalyzer_directory, variant_url_encode + '.html')
+		variant_filename = os.path.join(self.mutalyzer_directory, self._mutalyzer_cache_key(variant) + '.html')
 		logging.info('Variant: %s . Mutalyzer variant filename: %s' % (variant, variant_filename))
-		if not Utils.file_exists(variant_filename):
-			logging.info('Variant: %s . Mutalyzer variant filename: %s does not exist. Creating it..' % (variant, variant_filename))
-			variant_url = self.mutalyzer_url.format(variant=variant_url_encode)
-			logging.info('Variant: %s . Variant Mutalyzer url: %s' % (variant, variant_url))
-			try:
-				Utils.download(variant_url, variant_filename)
-			except urllib2.HTTPError as e:
-				error_message = 'Variant: %s . MUTALYZER CRASHED? : %s' % (str(variant), str(e))
-				logging.error(error_message)
-				self.current_fatal_error += [error_message]
-				return None
+		with Utils.single_flight(variant_filename) as missing:
+			if missing:
+				if self.offline:
+					return self._offline_miss('Variant: %s . Mutalyzer' % (variant))
+				logging.info('Variant: %s . Mutalyzer variant filename: %s does not exist. Creating it..' % (variant, variant_filename))
+				variant_url = self.mutalyzer_url.format(variant=variant_url_encode)
+				logging.info('Variant: %s . Variant Mutalyzer url: %s' % (variant, variant_url))
+				# Download to a temporary name. The variant file becomes visible only if it does not contain errors
+				variant_temp_filename = variant_filename + '.download'
+				try:
+					Utils.download(variant_url, variant_temp_filename)
+				except urllib2.HTTPError as e:
+					error_message = 'Variant: %s . MUTALYZER CRASHED? : %s' % (str(variant), str(e))
+					logging.error(error_message)
+					self.current_fatal_error += [error_message]
+					return None
 
-			#Check for errors
-			with open(variant_filename) as f:
-				soup = BeautifulSoup(f)
+				#Check for errors
+				with open(variant_temp_filename) as f:
+					soup = BeautifulSoup(f)
+
+				alert_danger = soup.find_all(class_="alert alert-danger")
+				if len(alert_danger) > 0:
+					error_message = 'Variant: %s . Mutalyzer returned the following critical error: %s' % (variant, alert_danger[0].text)
+					logging.error(error_message)
+					self.current_fatal_error += [error_message]
+					logging.error('Variant: %s . Variant file will not be saved' % (variant))
+					os.remove(variant_temp_filename)
+					return None
 
-			alert_danger = soup.find_all(class_="alert alert-danger")
-			if len(alert_danger) > 0:
-				error_message = 'Variant: %s . Mutalyzer returned the following critical error: %s' % (variant, alert_danger[0].text)
-				logging.error(error_message)
-				self.current_fatal_error += [error_message]
-				logging.error('Variant: %s . Variant file will not be saved' % (variant))
-				os.remove(variant_filename)
-				return None
+				os.rename(variant_temp_filename, variant_filename)
 
 		logging.info('Variant: %s . Mutalyzer file: %s exists (or created). Parsing..' % (variant, variant_filename))
 		with open(variant_filename) as f:
@@ -1916,12 +3103,22 @@ Default: Same as the ``genome`` parameter.
 
 		return new_variant
 
+	def _mutalyzer_cache_key(self, variant):
+		'''
+		Filename friendly canonical key of a variant for the mutalyzer cache
+		'''
+		key = self.canonical_key(variant)
+		if key is None:
+			key = variant.encode('utf-8') if type(variant) is unicode else variant
+		return urllib.quote(key, safe='')
+
 	def search_mutalyzer_position_converter(self, variant):
 		'''
 		https://mutalyzer.nl/position-converter?assembly_name_or_alias=GRCh38&description=NM_017781.2%3Ac.166C%3ET
 		'''
 
 		variant_url_encode = urllib.quote(variant)
+		variant_cache_key = self._mutalyzer_cache_key(variant)
 
 		for mutalyzer_assembly in ['GRCh38', 'GRCh37']:
 			new_variant = None
@@ -1930,13 +3127,16 @@ Default: Same as the ``genome`` parameter.
 			variant_url = 'https://mutalyzer.nl/position-converter?assembly_name_or_alias={}&description={}'.format(mutalyzer_assembly, variant_url_encode)
 			logging.debug('MUTALYZER URL: %s' % variant_url)
 
-			variant_filename = os.path.join(self.mutalyzer_directory, variant_url_encode + '_{}_position_converter.html'.format(mutalyzer_assembly))
+			variant_filename = os.path.join(self.mutalyzer_directory, variant_cache_key + '_{}_position_converter.html'.format(mutalyzer_assembly))
 			logging.debug('MUTALYZER FILENAME: %s' % variant_filename )
 
 		
-			if not Utils.file_exists(variant_filename):
-				#logging.debug('DOWNLOADING MUTALYZER URL')
-				Utils.download(variant_url, variant_filename)
+			with Utils.single_flight(variant_filename) as missing:
+				if missing:
+					if self.offline:
+						return self._offline_miss('Variant: %s . Mutalyzer position converter' % (variant))
+					#logging.debug('DOWNLOADING MUTALYZER URL')
+					Utils.download(variant_url, variant_filename)
 
 			with open(variant_filename) as f:
 				soup = BeautifulSoup(f)
@@ -1963,6 +3163,9 @@ Default: Same as the ``genome`` parameter.
 		Variant should be an rs variant
 		'''
 
+		if self.ucsc_dbsnp is None:
+			return self._offline_miss('Variant: %s . UCSC (CruzDB)' % (variant))
+
 		# Trying three times to query UCSC..
 		ucsc_query_efforts = 0
 		ucsc_query_efforts_MAX = 3
@@ -1995,46 +3198,79 @@ Default: Same as the ``genome`` parameter.
 			self.current_fatal_error.append(message)
 			return None
 
-		ret = []
+		ret = [self._dbsnp_record_to_ret_dict(variant, result.chrom, result.chromEnd, result.strand, result.refNCBI, result.refUCSC, result.observed, self.ucsc_assembly, 'UCSC') for result in results]
 
-		for result in results:
-			chrom = result.chrom
-			start = result.chromStart  
-			offset = result.chromEnd # This is the position reported from dbSNP
-			refNCBI = result.refNCBI
-			refUCSC = result.refUCSC
+		if len(ret) == 1:
+			return ret[0]
 
-			reference = refNCBI
+		return ret
 
-			if refNCBI != refUCSC:
-				logging.warning('Variant: %s has different reference in NCBI (%s) and UCSC (%s)' % (variant, refNCBI, refUCSC))
-				logging.warning('Keeping NCBI reference')
-			
-			observed = result.observed
+	def _dbsnp_record_to_ret_dict(self, variant, chrom, chromEnd, strand, refNCBI, refUCSC, observed, assembly, source):
+		'''
+		Convert a dbSNP record (UCSC representation) to the return dictionary
+		'''
 
-			observed_s = observed.split('/')
-			
-			if result.strand == u'-':
-				#observed_s = list([MutationInfo.inverse(x) if not x in ['-'] else '-' for x in ''.join(observed_s)]) # Do not invert '-'
-				observed_s = [MutationInfo.reverse_inverse(x) if not x in ['-'] else '' for x in observed_s] # Do not invert '-'
-			else:
-				observed_s = [x if not x in ['-'] else '' for x in observed_s]
+		offset = chromEnd # This is the position reported from dbSNP
+
+		reference = refNCBI
+
+		if refNCBI != refUCSC:
+			logging.warning('Variant: %s has different reference in NCBI (%s) and UCSC (%s)' % (variant, refNCBI, refUCSC))
+			logging.warning('Keeping NCBI reference')
+
+		observed_s = observed.split('/')
+
+		if strand == u'-':
+			#observed_s = list([MutationInfo.inverse(x) if not x in ['-'] else '-' for x in ''.join(observed_s)]) # Do not invert '-'
+			observed_s = [MutationInfo.reverse_inverse(x) if not x in ['-'] else '' for x in observed_s] # Do not invert '-'
+		else:
+			observed_s = [x if not x in ['-'] else '' for x in observed_s]
 
-			if reference == '-':
-				reference = ''
+		if reference == '-':
+			reference = ''
 
-			alternative = [x for x in observed_s if x != reference]
+		alternative = [x for x in observed_s if x != reference]
 
-			logging.info('Variant: %s . observed: %s alternate: %s' % (variant, observed, str(alternative)))
-			if len(alternative) == 1:
-				alternative = alternative[0]
+		logging.info('Variant: %s . observed: %s alternate: %s' % (variant, observed, str(alternative)))
+		if len(alternative) == 1:
+			alternative = alternative[0]
 
-			#In case of a deletion we need to make this correction in order to report the same position as in HGVS
-			#For example: rs113993960 
-			if alternative == '':
-				offset = offset - len(reference) + 1
+		#In case of a deletion we need to make this correction in order to report the same position as in HGVS
+		#For example: rs113993960 
+		if alternative == '':
+			offset = offset - len(reference) + 1
+
+		return self._build_ret_dict(chrom, offset, reference, alternative, assembly, source)
+
+	def _search_local_dbsnp(self, variant):
+		'''
+		Search an rs variant in the local dbSNP index
+		'''
+
+		if self.local_dbsnp is None:
+			message = 'Local dbSNP index is not installed. See install_local_dbsnp'
+			logging.warning(message)
+			self.current_fatal_error.append(message)
+			return None
+
+		if not re.match(r'^rs[\d]+$', variant):
+			message = 'Variant: %s . Local dbSNP accepts only rs variants (i.e. rs53576)' % (variant)
+			logging.warning(message)
+			self.current_fatal_error.append(message)
+			return None
+
+		results = self.local_dbsnp.search(variant)
+		logging.info('Variant: %s . Returned from local dbSNP: %s' % (str(variant), str(results)))
+
+		if not results:
+			message = 'Variant: %s . Local dbSNP returned an empty result list' % (variant)
+			logging.warning(message)
+			self.current_fatal_error.append(message)
+			return None
 
-			ret.append(self._build_ret_dict(chrom, offset, reference, alternative, self.ucsc_assembly, 'UCSC'))
+		ret = []
+		for chrom, chromEnd, strand, refNCBI, refUCSC, observed in results:
+			ret.append(self._dbsnp_record_to_ret_dict(variant, chrom, chromEnd, strand, refNCBI, refUCSC, observed, self.local_dbsnp.assembly, 'LOCAL_DBSNP'))
 
 		if len(ret) == 1:
 			return ret[0]
@@ -2323,32 +3559,59 @@ class Counsyl_HGVS(object):
 	fasta_url_hg19 = 'http://hgdownload.cse.ucsc.edu/goldenPath/hg19/bigZips/chromFa.tar.gz'
 	fasta_url_hg38 = 'http://hgdownload.cse.ucsc.edu/goldenPath/hg38/bigZips/hg38.chromFa.tar.gz'
 	refseq_url = 'https://github.com/counsyl/hgvs/raw/master/pyhgvs/data/genes.refGene'
+	refseq_genome = 'hg19' # The coordinates of genes.refGene are on hg19
 
-	def __init__(self, local_directory, genome='hg19'):
+	def __init__(self, local_directory, genome='hg19', offline=False, contigs=None, genome_format='fasta', transcripts=None):
 
 		self.local_directory = local_directory
 		self.genome = genome
+		self.contigs = contigs
 
 		# Check genome option
 		if re.match(r'hg[\d]+', genome) is None:
 			raise ValueError('Parameter genome should follow the pattern: hgDD (for example hg18, hg19, hg38) ')
 
+		if not genome_format in ['fasta', '2bit', 'bgzf']:
+			raise ValueError('genome_format parameter should be "fasta", "2bit" or "bgzf". Found: %s' % (str(genome_format)))
+
 		#Init counsyl PYHGVS
 		self.fasta_directory = os.path.join(self.local_directory, genome)
-		self.fasta_filename = os.path.join(self.fasta_directory, genome + '.fa')
+		uncompressed_fasta_filename = os.path.join(self.fasta_directory, genome + '.fa')
+		if genome_format == 'bgzf':
+			# The genome is installed compressed. The uncompressed FASTA is never written
+			self.fasta_filename = uncompressed_fasta_filename + '.gz'
+		else:
+			self.fasta_filename = uncompressed_fasta_filename
 		self.refseq_filename = os.path.join(self.local_directory, 'genes.refGene')
-		if not Utils.file_exists(self.fasta_filename):
-			logging.info('Could not find fasta filename: %s' % self.fasta_filename)
-			self._install_fasta_files()
+		Utils.mkdir_p(self.fasta_directory)
+		with Utils.single_flight(self.fasta_filename) as missing:
+			if missing:
+				logging.info('Could not find fasta filename: %s' % self.fasta_filename)
+				if self.fasta_filename != uncompressed_fasta_filename and Utils.file_exists(uncompressed_fasta_filename):
+					logging.info('Compressing %s to %s' % (uncompressed_fasta_filename, self.fasta_filename))
+					Utils.bgzip(uncompressed_fasta_filename, self.fasta_filename)
+				elif offline:
+					raise MutationInfoException('Offline mode: The reference genome %s is not installed in %s' % (genome, self.fasta_directory))
+				else:
+					self._install_fasta_files()
+			else:
+				logging.info('Found fasta filename: %s' % self.fasta_filename)
+
+		if genome_format in ['fasta', 'bgzf']:
+			self.genome_filename = self.fasta_filename
+		elif genome_format == '2bit':
+			self.genome_filename = os.path.join(self.fasta_directory, genome + '.2bit')
+			with Utils.single_flight(self.genome_filename) as missing:
+				if missing:
+					logging.info('Converting %s to %s' % (self.fasta_filename, self.genome_filename))
+					TwoBitReader.convert(self.fasta_filename, self.genome_filename)
+
+		self.sequence_genome = Utils.open_genome(self.genome_filename)
+		if transcripts is None:
+			self.transcripts = Counsyl_HGVS.load_transcripts(self.local_directory, offline)
 		else:
-			logging.info('Found fasta filename: %s' % self.fasta_filename)
-
-		try:
-			self.sequence_genome = SequenceFileDB(self.fasta_filename)
-		except TypeError as e:
-			logging.error('Please refer to https://github.com/kantale/MutationInfo/issues/6 to resolve this issue')
-			raise e
-		self._load_transcripts()
+			# Shared with another instance
+			self.transcripts = transcripts
 
 	def hgvs_to_vcf(self, variant):
 		chrom, offset, ref, alt = hgvs_counsyl.parse_hgvs_name(
@@ -2357,17 +3620,30 @@ class Counsyl_HGVS(object):
 		return chrom, offset, ref, alt
 
 
-	def _load_transcripts(self):
-		logging.info('Indexing transcripts..')
-		with open(self.refseq_filename) as f:
-			self.transcripts = hgvs_counsyl_utils.read_transcripts(f)
+	@staticmethod
+	def load_transcripts(local_directory, offline=False):
+		'''
+		The :py:class:`RefGeneIndex` of genes.refGene in local_directory. genes.refGene is downloaded if it does not exist. 
+		The reference genome is not needed (the coordinates of genes.refGene are always on refseq_genome).
+		'''
+		refseq_filename = os.path.join(local_directory, 'genes.refGene')
+		with Utils.single_flight(refseq_filename) as missing:
+			if missing:
+				if offline:
+					raise MutationInfoException('Offline mode: %s is not installed' % (refseq_filename))
+				logging.info('Downloading refGene')
+				logging.info('Downloading from: %s' % Counsyl_HGVS.refseq_url)
+				logging.info('Downloading to: %s' % refseq_filename)
+				Utils.download(Counsyl_HGVS.refseq_url, refseq_filename)
+
+		logging.info('Loading transcripts index..')
+		return RefGeneIndex.load(refseq_filename, refseq_filename + '.index')
 
 	def _get_transcript(self, name):
 			return self.transcripts.get(name)
 
 	def _install_fasta_files(self):
 		fasta_filename_tar_gz = os.path.join(self.fasta_directory, 'chromFa.tar.gz')
-		fasta_filename_tar = os.path.join(self.fasta_directory, 'chromFa.tar')
 
 		#fasta_url = self.fasta_url_pattern.format(genome=self.genome)
 		if self.genome == 'hg19':
@@ -2379,158 +3655,2472 @@ class Counsyl_HGVS(object):
 		logging.info('Downloading to: %s' % fasta_filename_tar_gz)
 
 		Utils.mkdir_p(self.fasta_directory)
-		Utils.download(fasta_url, fasta_filename_tar_gz)
+		Utils.download(fasta_url, fasta_filename_tar_gz, md5=Utils.remote_md5(fasta_url))
 
-		logging.info('Unzipping to: %s' % fasta_filename_tar)
-		Utils.gunzip(fasta_filename_tar_gz, fasta_filename_tar)
+		logging.info('Extracting to: %s' % (self.fasta_filename))
+		Utils.tar_gz_to_fasta(fasta_filename_tar_gz, self.fasta_filename, self.contigs)
 
-		logging.info('Untar to: %s' % self.fasta_directory)
-		Utils.untar(fasta_filename_tar, self.fasta_directory)
 
-		logging.info('Merging *.fa to %s.fa' % (self.genome))
-		all_fasta_filenames_glob = os.path.join(self.fasta_directory, 'chr*.fa')
-		all_fasta_filenames = glob.glob(all_fasta_filenames_glob)
-		Utils.cat_filenames(all_fasta_filenames, self.fasta_filename)
+class RefGeneIndex(object):
+	'''
+	A compiled, mmap'd index of genes.refGene. 
 
-		logging.info('Downloading refGene')
-		logging.info('Downloading from: %s' % self.refseq_url)
-		logging.info('Downloading to: %s' % self.refseq_filename)
-		Utils.download(self.refseq_url, self.refseq_filename)
+	The records are stored once as numpy arrays (one row per refGene line) with a flat exon table. 
+	The transcript names (with and without version, as in pyhgvs.utils.read_transcripts) are a sorted array. 
+	A lookup is a binary search on the names. The pyhgvs Transcript of a name is made the first time it is requested. 
+	'''
 
+	def __init__(self, index_directory):
+		self.index_directory = index_directory
+
+		meta = Utils.load_json_filename(self.meta_filename(index_directory))
+		self.chromosomes = [str(x) for x in meta['chromosomes']]
+		load = lambda name: np.load(os.path.join(index_directory, name + '.npy'), mmap_mode='r')
+		self.names = load('names')
+		self.name_record = load('name_record')
+		self.ids = load('ids')
+		self.genes = load('genes')
+		self.chrom = load('chrom')
+		self.strand = load('strand')
+		self.start = load('start')
+		self.end = load('end')
+		self.cds_start = load('cds_start')
+		self.cds_end = load('cds_end')
+		self.exons_start = load('exons_start')
+		self.exons_count = load('exons_count')
+		self.exon_starts = load('exon_starts')
+		self.exon_ends = load('exon_ends')
+
+		self._transcripts = {}
 
-class Utils(object):
-	'''
-	Useful functions to help manange files
-	'''
+	@staticmethod
+	def meta_filename(index_directory):
+		return os.path.join(index_directory, 'refGene.json')
 
 	@staticmethod
-	def directory_exists(dirname):
+	def is_current(refgene_filename, index_directory):
 		'''
-		Check if directory exists
+		True if the index exists and it was built from the current version of refgene_filename 
 		'''
-		return os.path.isdir(dirname)
+		meta_filename = RefGeneIndex.meta_filename(index_directory)
+		if not Utils.file_exists(meta_filename):
+			return False
+		meta = Utils.load_json_filename(meta_filename)
+		stat = os.stat(refgene_filename)
+		return meta['source_size'] == stat.st_size and meta['source_mtime'] == int(stat.st_mtime)
 
 	@staticmethod
-	def file_exists(filename):
+	def load(refgene_filename, index_directory):
 		'''
-		Check if filename exists
+		Open the index of refgene_filename. It is built the first time (and again if refgene_filename changes)
 		'''
-		return os.path.isfile(filename) 
-
+		if not RefGeneIndex.is_current(refgene_filename, index_directory):
+			Utils.mkdir_p(index_directory)
+			with Utils.file_lock(RefGeneIndex.meta_filename(index_directory)):
+				if not RefGeneIndex.is_current(refgene_filename, index_directory):
+					RefGeneIndex.build(refgene_filename, index_directory)
+		return RefGeneIndex(index_directory)
 
 	@staticmethod
-	def mkdir_p(dirname):
+	def build(refgene_filename, index_directory):
 		'''
-		Create directory
-		Functionality similar with: mkdir -p
-		Reference: http://stackoverflow.com/questions/600268/mkdir-p-functionality-in-python 
+		Build the index of a refGene file (genePredExt format)
 		'''
-		try:
-			os.makedirs(dirname)
-		except OSError as exc: # Python >2.5
-			if exc.errno == errno.EEXIST and os.path.isdir(dirname):
-				pass
-			else:
-				raise
 
-	@staticmethod
-	def load_json_filename(filename):
+		Utils.mkdir_p(index_directory)
+		logging.info('Building refGene index from: %s' % (refgene_filename))
+		stat = os.stat(refgene_filename)
+
+		chromosomes = {}
+		names = {}
+		ids, genes = [], []
+		chrom = array.array('H')
+		strand = array.array('B')
+		start = array.array('I')
+		end = array.array('I')
+		cds_start = array.array('I')
+		cds_end = array.array('I')
+		exons_start = array.array('I')
+		exons_count = array.array('H')
+		exon_starts = array.array('I')
+		exon_ends = array.array('I')
+
+		with open(refgene_filename) as f:
+			for record_index, record in enumerate(hgvs_counsyl_utils.read_refgene(f)):
+				if not record['chrom'] in chromosomes:
+					chromosomes[record['chrom']] = len(chromosomes)
+
+				# Same keys as pyhgvs.utils.read_transcripts. The last record of a name wins
+				names[record['id'].split('.')[0]] = record_index
+				names[record['id']] = record_index
+
+				ids.append(str(record['id']))
+				genes.append(str(record['gene_name']))
+				chrom.append(chromosomes[record['chrom']])
+				strand.append(1 if record['strand'] == '-' else 0)
+				start.append(record['start'])
+				end.append(record['end'])
+				cds_start.append(record['cds_start'])
+				cds_end.append(record['cds_end'])
+				exons_start.append(len(exon_starts))
+				exons_count.append(len(record['exons']))
+				for exon_start, exon_end in record['exons']:
+					exon_starts.append(exon_start)
+					exon_ends.append(exon_end)
+
+		if not ids:
+			raise MutationInfoException('Could not find any refGene records in %s' % (refgene_filename))
+
+		sorted_names = sorted(names)
+		for name, values in [
+			('names', np.array([str(x) for x in sorted_names])),
+			('name_record', np.array([names[x] for x in sorted_names], dtype=np.uint32)),
+			('ids', np.array(ids)),
+			('genes', np.array(genes)),
+			('chrom', np.frombuffer(chrom, dtype=np.uint16)),
+			('strand', np.frombuffer(strand, dtype=np.uint8)),
+			('start', np.frombuffer(start, dtype=np.uint32)),
+			('end', np.frombuffer(end, dtype=np.uint32)),
+			('cds_start', np.frombuffer(cds_start, dtype=np.uint32)),
+			('cds_end', np.frombuffer(cds_end, dtype=np.uint32)),
+			('exons_start', np.frombuffer(exons_start, dtype=np.uint32)),
+			('exons_count', np.frombuffer(exons_count, dtype=np.uint16)),
+			('exon_starts', np.frombuffer(exon_starts, dtype=np.uint32)),
+			('exon_ends', np.frombuffer(exon_ends, dtype=np.uint32)),
+			]:
+			with Utils.atomic_write(os.path.join(index_directory, name + '.npy'), 'wb') as f:
+				np.save(f, values)
+
+		# The meta file is written last. Its existence means that the index is complete
+		Utils.save_json_filenane(RefGeneIndex.meta_filename(index_directory), {
+			'source': os.path.basename(refgene_filename),
+			'source_size': stat.st_size,
+			'source_mtime': int(stat.st_mtime),
+			'chromosomes': sorted(chromosomes, key=chromosomes.get),
+		})
+		logging.info('refGene index saved in: %s (%i transcripts)' % (index_directory, len(ids)))
+
+	def _record(self, name):
 		'''
-		Load a json file
+		The index of the record of a transcript name. None if it does not exist
 		'''
-		with open(filename) as f:
-			data = json.load(f)
+		i = np.searchsorted(self.names, name)
+		if i == len(self.names) or self.names[i] != name:
+			return None
+		return int(self.name_record[i])
 
-		return data
+	def __contains__(self, name):
+		return self._record(name) is not None
 
-	@staticmethod
-	def save_json_filenane(filename, data):
+	def __len__(self):
+		return len(self.names)
+
+	def get(self, name, default=None):
 		'''
-		Save a json file
+		The pyhgvs Transcript of a name (i.e. NM_000367 or NM_000367.2). 
+		Same as the dictionary of pyhgvs.utils.read_transcripts
 		'''
-		with open(filename, 'w') as f:
-			f.write(json.dumps(data, indent=4) + '\n')
+
+		if name in self._transcripts:
+			return self._transcripts[name]
+
+		i = self._record(name)
+		if i is None:
+			return default
+
+		first = int(self.exons_start[i])
+		last = first + int(self.exons_count[i])
+		chrom = self.chromosomes[self.chrom[i]]
+		transcript = hgvs_counsyl_utils.make_transcript({
+			'id': str(self.ids[i]),
+			'gene_name': str(self.genes[i]),
+			'chrom': chrom,
+			'strand': '+-'[self.strand[i]],
+			'start': int(self.start[i]),
+			'end': int(self.end[i]),
+			'cds_start': int(self.cds_start[i]),
+			'cds_end': int(self.cds_end[i]),
+			'exons': zip(self.exon_starts[first:last].tolist(), self.exon_ends[first:last].tolist()),
+		})
+		self._transcripts[name] = transcript
+		return transcript
+
+
+class RefGeneMapper(object):
+	'''
+	Maps transcript (c. / n.) positions to genomic positions with the exon tables of genes.refGene (the index of :py:class:`Counsyl_HGVS`). 
+	No network access is needed. 
+	'''
+
+	def __init__(self, transcripts):
+		'''
+		:param transcripts: Dictionary: name --> pyhgvs Transcript (as made by pyhgvs.utils.read_transcripts) or a :py:class:`RefGeneIndex`
+		'''
+		self.transcripts = transcripts
+		self._structures = {}
+
+	def _structure(self, accession):
+		'''
+		Exons in transcript order with their cumulative (spliced) offsets, transcript length and the n. positions of the first and last CDS base.
+		Returns None if the accession is not in refGene (or it is there with a different version)
+		'''
+
+		if accession in self._structures:
+			return self._structures[accession]
+
+		transcript = self.transcripts.get(accession)
+		if transcript is None or (transcript.version is not None and '.' in accession and transcript.full_name != accession):
+			self._structures[accession] = None
+			return None
+
+		forward = transcript.tx_position.is_forward_strand
+		exons = sorted([(exon.tx_position.chrom_start, exon.tx_position.chrom_stop) for exon in transcript.exons], reverse=not forward)
+
+		offsets = []
+		length = 0
+		for exon_start, exon_end in exons:
+			offsets.append(length)
+			length += exon_end - exon_start
+
+		structure = {
+			'chrom': transcript.tx_position.chrom,
+			'forward': forward,
+			'tx_start': transcript.tx_position.chrom_start,
+			'tx_end': transcript.tx_position.chrom_stop,
+			'exons': exons,
+			'offsets': offsets,
+			'length': length,
+			'cds_start': None,
+			'cds_end': None,
+		}
+
+		if transcript.is_coding:
+			cds = transcript.cds_position
+			if forward:
+				structure['cds_start'] = self._g_to_n(structure, cds.chrom_start + 1)
+				structure['cds_end'] = self._g_to_n(structure, cds.chrom_stop)
+			else:
+				structure['cds_start'] = self._g_to_n(structure, cds.chrom_stop)
+				structure['cds_end'] = self._g_to_n(structure, cds.chrom_start + 1)
+
+		self._structures[accession] = structure
+		return structure
 
 	@staticmethod
-	def download(url, filename=None):
+	def _g_to_n(structure, g):
+		for (exon_start, exon_end), offset in zip(structure['exons'], structure['offsets']):
+			if exon_start < g <= exon_end:
+				if structure['forward']:
+					return offset + g - exon_start
+				return offset + exon_end - g + 1
+		return None
+
+	def n_to_g(self, accession, n, offset=0):
 		'''
-		http://www.pypedia.com/index.php/download
+		Convert a (1-based) position on the spliced transcript and an intronic offset to a (1-based) genomic position.
+
+		:return: chrom, position, strand ('+' or '-'). None if the position cannot be mapped.
 		'''
-		if not filename:
-			file_name = url.split('/')[-1]
-		else:
-			file_name = filename
-			
-		u = urllib2.urlopen(url)
-		f = open(file_name, 'wb')
-		meta = u.info()
-		try:
-			file_size = int(meta.getheaders("Content-Length")[0])
-			pb = ProgressBar(file_size, 'Progress')
-		except IndexError:
-			file_size = None
-			logging.warning('Could not determine file size')
-		print("Downloading: {0} Bytes: {1}".format(url, file_size))
 
-		file_size_dl = 0
-		block_sz = 8192
-		while True:
-			buffer = u.read(block_sz)
-			if not buffer:
+		structure = self._structure(accession)
+		if structure is None:
+			return None
+
+		forward = structure['forward']
+		strand = '+' if forward else '-'
+
+		if n < 1 or n > structure['length']:
+			# Upstream / downstream of the transcript
+			if offset:
+				return None
+			if n < 1:
+				g = structure['tx_start'] + n if forward else structure['tx_end'] - n + 1
+			else:
+				g = structure['tx_end'] + n - structure['length'] if forward else structure['tx_start'] + 1 - (n - structure['length'])
+			return structure['chrom'], g, strand
+
+		for (exon_start, exon_end), exon_offset in zip(structure['exons'], structure['offsets']):
+			exon_length = exon_end - exon_start
+			if exon_offset < n <= exon_offset + exon_length:
 				break
 
-			file_size_dl += len(buffer)
-			f.write(buffer)
-			if file_size:
-				pb.animate_ipython(file_size_dl)
-		print # We need a new line here
-		f.close()
+		# Intronic positions are anchored at the exon boundaries 
+		if offset > 0 and n != exon_offset + exon_length:
+			return None
+		if offset < 0 and n != exon_offset + 1:
+			return None
 
-	@staticmethod
-	def gunzip(compressed_filename, uncompressed_filename):
+		if forward:
+			g = exon_start + (n - exon_offset) + offset
+		else:
+			g = exon_end - (n - exon_offset) + 1 - offset
+
+		return structure['chrom'], g, strand
+
+	def c_to_g(self, accession, base, offset=0, cds_end=False):
+		'''
+		Convert a c. position to a (1-based) genomic position. 
+
+		:param base: The c. position. Negative for 5' UTR positions. 
+		:param offset: The intronic offset (i.e. 1 for c.55+1)
+		:param cds_end: True for positions after the stop codon (i.e. c.*55 has base=55, cds_end=True)
+		:return: chrom, position, strand ('+' or '-'). None if the position cannot be mapped.
+		'''
+
+		structure = self._structure(accession)
+		if structure is None or structure['cds_start'] is None or structure['cds_end'] is None:
+			return None
+
+		if cds_end:
+			n = structure['cds_end'] + base
+		elif base > 0:
+			n = structure['cds_start'] + base - 1
+		else:
+			n = structure['cds_start'] + base
+
+		return self.n_to_g(accession, n, offset)
+
+
+class BgzfWriter(object):
+	'''
+	Writes BGZF (blocked gzip, as bgzip: http://samtools.github.io/hts-specs/SAMv1.pdf section 4.1) to file object f. 
+	The output is a valid gzip file made of independent blocks of up to 64 KB of uncompressed data.
+	'''
+
+	block_size = 0xff00 # Same as bgzip. The compressed block always fits in 64 KB
+	eof_block = '1f8b08040000000000ff0600424302001b0003000000000000000000'.decode('hex')
+
+	def __init__(self, f, level=6):
+		self.f = f
+		self.level = level
+		self.buffer = []
+		self.buffered = 0
+		self.compressed_offset = 0
+		self.uncompressed_offset = 0
+		self.index = [] # compressed offset, uncompressed offset of every block after the first
+
+	def write(self, data):
+		self.buffer.append(data)
+		self.buffered += len(data)
+		if self.buffered >= self.block_size:
+			data = ''.join(self.buffer)
+			full = len(data) - len(data) % self.block_size
+			for start in xrange(0, full, self.block_size):
+				self._write_block(data[start:start + self.block_size])
+			self.buffer = [data[full:]]
+			self.buffered = len(data) - full
+
+	def _write_block(self, data):
+		compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) # Raw deflate
+		compressed = compressor.compress(data) + compressor.flush()
+		size = 18 + len(compressed) + 8
+
+		if self.uncompressed_offset:
+			self.index.append((self.compressed_offset, self.uncompressed_offset))
+		# gzip header with the BC extra subfield (total block size - 1)
+		self.f.write(struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, ord('B'), ord('C'), 2, size - 1))
+		self.f.write(compressed)
+		self.f.write(struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+		self.compressed_offset += size
+		self.uncompressed_offset += len(data)
+
+	def close(self):
+		data = ''.join(self.buffer)
+		if data:
+			self._write_block(data)
+		self.buffer = []
+		self.buffered = 0
+		self.f.write(self.eof_block)
+
+	def write_index(self, gzi_f):
 		'''
-		unzips a gunzip file
-		https://docs.python.org/2/library/gzip.html
+		Write the .gzi index (same as bgzip -i)
 		'''
+		BgzfReader.write_index(gzi_f, self.index)
+
 
-		with gzip.open(compressed_filename, 'rb') as f_out, open(uncompressed_filename, 'wb') as f_in:
-			shutil.copyfileobj(f_out, f_in)
+class BgzfReader(object):
+	'''
+	Random access to a BGZF file with its .gzi index (created if it does not exist). All offsets are uncompressed offsets. 
+	Only the blocks that are touched are decompressed. The last cache_size decompressed blocks are kept (LRU).
+
+	Slicing has the same semantics as the mmap of the uncompressed file: ``reader[start:end]``
+	'''
+
+	cache_size = 128 # 8 MB
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.index_filename = filename + '.gzi'
+
+		with Utils.single_flight(self.index_filename) as missing:
+			if missing:
+				logging.info('BGZF index: %s does not exist. Building it..' % (self.index_filename))
+				with Utils.atomic_write(self.index_filename, 'wb') as f:
+					BgzfReader.write_index(f, BgzfReader.scan_blocks(filename))
+
+		with open(self.index_filename, 'rb') as f:
+			count, = struct.unpack('<Q', f.read(8))
+			index = np.frombuffer(f.read(16 * count), dtype='<u8').reshape(count, 2).astype(np.int64)
+		# The first block is not in the index
+		self.compressed_offsets = np.concatenate(([0], index[:, 0]))
+		self.uncompressed_offsets = np.concatenate(([0], index[:, 1]))
+
+		self.f = open(filename, 'rb')
+		self.lock = threading.Lock()
+		self.cache = collections.OrderedDict()
 
 	@staticmethod
-	def untar(tar_filename, path):
+	def write_index(gzi_f, index):
+		gzi_f.write(struct.pack('<Q', len(index)))
+		for compressed_offset, uncompressed_offset in index:
+			gzi_f.write(struct.pack('<QQ', compressed_offset, uncompressed_offset))
+
+	@staticmethod
+	def scan_blocks(filename):
 		'''
-		Untar a filename
-		https://docs.python.org/2/library/tarfile.html
+		Compressed and uncompressed offsets of all blocks (except the first) of a BGZF file. Only the block headers are read
 		'''
+		index = []
+		compressed_offset, uncompressed_offset = 0, 0
+		with open(filename, 'rb') as f:
+			while True:
+				header = f.read(12)
+				if not header:
+					break
+				if len(header) < 12 or header[0:4] != '\x1f\x8b\x08\x04':
+					raise MutationInfoException('File: %s is not BGZF compressed (use bgzip)' % (filename))
+				extra = f.read(struct.unpack('<H', header[10:12])[0])
+				size = BgzfReader._block_size(extra, filename)
+				f.seek(compressed_offset + size - 4)
+				uncompressed_size, = struct.unpack('<I', f.read(4))
+
+				if compressed_offset and uncompressed_size:
+					index.append((compressed_offset, uncompressed_offset))
+				compressed_offset += size
+				uncompressed_offset += uncompressed_size
 
-		with tarfile.open(tar_filename) as tar:
-			tar.extractall(path=path)
+		return index
 
 	@staticmethod
-	def cat_filenames(filenames, output_filename):
+	def _block_size(extra, filename):
+		'''
+		The total size of a block from the BC subfield of the gzip extra field
+		'''
+		position = 0
+		while position + 4 <= len(extra):
+			subfield_length, = struct.unpack('<H', extra[position + 2:position + 4])
+			if extra[position:position + 2] == 'BC':
+				return struct.unpack('<H', extra[position + 4:position + 6])[0] + 1
+			position += 4 + subfield_length
+		raise MutationInfoException('File: %s is not BGZF compressed (use bgzip)' % (filename))
+
+	def _block(self, block):
+		with self.lock:
+			if block in self.cache:
+				data = self.cache.pop(block)
+				self.cache[block] = data
+				return data
+
+			self.f.seek(self.compressed_offsets[block])
+			header = self.f.read(12)
+			if not header:
+				return ''
+			extra = self.f.read(struct.unpack('<H', header[10:12])[0])
+			size = self._block_size(extra, self.filename)
+			compressed = self.f.read(size - 12 - len(extra) - 8)
+			data = zlib.decompress(compressed, -15)
+
+			self.cache[block] = data
+			if len(self.cache) > self.cache_size:
+				self.cache.popitem(last=False)
+			return data
+
+	def _find_block(self, offset):
+		return np.searchsorted(self.uncompressed_offsets, offset, side='right') - 1
+
+	def read(self, offset, size):
+		'''
+		Read size bytes starting from (uncompressed) offset
+		'''
+		chunks = []
+		block = self._find_block(offset)
+		while size > 0 and block < len(self.compressed_offsets):
+			data = self._block(block)
+			start = offset - self.uncompressed_offsets[block]
+			chunk = data[start:start + size]
+			if not chunk:
+				break
+			chunks.append(chunk)
+			offset += len(chunk)
+			size -= len(chunk)
+			block += 1
+
+		return ''.join(chunks)
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice) or key.start is None or key.stop is None:
+			raise ValueError('BgzfReader supports only slices with a start and a stop')
+		return self.read(key.start, key.stop - key.start)
+
+	def take(self, offsets):
+		'''
+		The bytes at a numpy array of (uncompressed) offsets, as an uint8 array. Every block is decompressed once.
+		'''
+		offsets = np.asarray(offsets, dtype=np.int64)
+		ret = np.zeros(len(offsets), dtype=np.uint8)
+
+		blocks = self._find_block(offsets)
+		order = np.argsort(blocks, kind='mergesort')
+		boundaries = np.concatenate(([0], np.flatnonzero(np.diff(blocks[order])) + 1, [len(order)]))
+		for group_start, group_end in zip(boundaries[:-1], boundaries[1:]):
+			if group_start == group_end:
+				continue
+			indexes = order[group_start:group_end]
+			block = blocks[indexes[0]]
+			data = np.frombuffer(self._block(block), dtype=np.uint8)
+			ret[indexes] = data[offsets[indexes] - self.uncompressed_offsets[block]]
+
+		return ret
+
+	def close(self):
+		self.f.close()
+
+
+class FastaSequence(str):
+	'''
+	A sequence returned by :py:class:`FastaReader`. As in pygr, ``-sequence`` is the reverse complement.
+	'''
+
+	_complement = string.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+	def __neg__(self):
+		return FastaSequence(self.translate(self._complement)[::-1])
+
+
+class FastaChromosome(object):
+	'''
+	One record of a :py:class:`FastaReader`. Slicing (0-based, end exclusive) returns a :py:class:`FastaSequence`.
+	'''
+
+	def __init__(self, data, name, length, offset, line_bases, line_width):
+		self.data = data
+		self.name = name
+		self.length = length
+		self.offset = offset
+		self.line_bases = line_bases
+		self.line_width = line_width
+
+	def __len__(self):
+		return self.length
+
+	def _byte(self, position):
+		return self.offset + (position // self.line_bases) * self.line_width + position % self.line_bases
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			start, end, step = key.indices(self.length)
+			if step != 1:
+				raise ValueError('FastaChromosome does not support slice steps')
+		else:
+			if key < 0:
+				key += self.length
+			if not 0 <= key < self.length:
+				raise IndexError('Position %i is outside of %s' % (key, self.name))
+			start, end = key, key + 1
+
+		if start >= end:
+			return FastaSequence('')
+
+		sequence = self.data[self._byte(start):self._byte(end)]
+		if self.line_width > self.line_bases:
+			sequence = sequence.replace('\n', '').replace('\r', '')
+		return FastaSequence(sequence)
+
+	def bases_at(self, positions):
 		'''
-		Concat filenames
-		http://stackoverflow.com/questions/13613336/python-concatenate-text-files 
+		The (upper case) bases at a numpy array of 0-based positions, as an array of ASCII codes. 
 		'''
+		positions = np.asarray(positions, dtype=np.int64)
+		offsets = self.offset + (positions // self.line_bases) * self.line_width + positions % self.line_bases
+		if isinstance(self.data, BgzfReader):
+			return self.data.take(offsets) & 0xDF
+		return np.frombuffer(self.data, dtype=np.uint8)[offsets] & 0xDF
+
+	def __str__(self):
+		return str(self[:])
+
+
+class FastaIndexer(object):
+	'''
+	Builds a samtools compatible .fai index line by line, while the FASTA file is being read or written.
+	All lines of a record (except the last) should have the same length. As in samtools faidx, empty lines are allowed only at the end of a record.
+	'''
+
+	def __init__(self, index_f, fasta_filename):
+		self.index_f = index_f
+		self.fasta_filename = fasta_filename
+		self.position = 0
+		self.name = None
+
+	def _write_record(self):
+		if not self.name is None:
+			self.index_f.write('%s\t%i\t%i\t%i\t%i\n' % (self.name, self.length, self.offset, self.line_bases or 0, self.line_width or 0))
+
+	def add_line(self, line):
+		if line[0] == '>':
+			self._write_record()
+			self.name = line[1:].split()[0]
+			self.offset = self.position + len(line)
+			self.length = 0
+			self.line_bases, self.line_width = None, None
+			self.last_line = False
+			self.empty_line = False
+		elif not self.name is None:
+			bases = len(line.rstrip('\r\n'))
+			if not bases:
+				self.empty_line = True
+			else:
+				if self.empty_line:
+					raise MutationInfoException('FASTA file: %s . Record %s has an empty line' % (self.fasta_filename, self.name))
+				if self.last_line:
+					raise MutationInfoException('FASTA file: %s . Record %s has lines of different length' % (self.fasta_filename, self.name))
+				if self.line_bases is None:
+					self.line_bases, self.line_width = bases, len(line)
+				elif bases > self.line_bases:
+					raise MutationInfoException('FASTA file: %s . Record %s has lines of different length' % (self.fasta_filename, self.name))
+				elif bases != self.line_bases or len(line) != self.line_width:
+					# Only the last line of a record can be shorter
+					self.last_line = True
+				self.length += bases
+		self.position += len(line)
+
+	def close(self):
+		self._write_record()
+		self.name = None
+
+
+class FastaReader(object):
+	'''
+	Random access to a FASTA file through its samtools faidx index (``<fasta>.fai``, http://www.htslib.org/doc/faidx.html ). 
+	The index is built if it does not exist. The FASTA file is mmap'd: slicing reads only the requested bytes and \
+	all processes that open the same file share the page cache. 
+	FASTA files that end with .gz should be BGZF compressed (bgzip). They are read with :py:class:`BgzfReader`.
+
+	Drop-in replacement for pygr's SequenceFileDB: ``reader['chr1'][1000:1010]``
+	'''
 
-		with open(output_filename, 'w') as outfile:
-			for fname in filenames:
-				logging.info('Concatenating: %s' % fname)
-				with open(fname) as infile:
-					for line in infile:
-						outfile.write(line)
+	def __init__(self, fasta_filename):
+		self.fasta_filename = fasta_filename
+		self.index_filename = fasta_filename + '.fai'
+
+		with Utils.single_flight(self.index_filename) as missing:
+			if missing:
+				logging.info('FASTA index: %s does not exist. Building it..' % (self.index_filename))
+				FastaReader.build_index(fasta_filename, self.index_filename)
+
+		self.index = {}
+		self.names = []
+		with open(self.index_filename) as f:
+			for l in f:
+				name, length, offset, line_bases, line_width = l.split('\t')[0:5]
+				self.index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+				self.names.append(name)
+
+		if fasta_filename.endswith('.gz'):
+			self.data = BgzfReader(fasta_filename)
+		elif os.path.getsize(fasta_filename) == 0:
+			self.data = '' # An empty file cannot be mmap'd
+		else:
+			with open(fasta_filename, 'rb') as f:
+				self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 	@staticmethod
-	def get_application_dir(application_name):
+	def build_index(fasta_filename, index_filename):
 		'''
-		Create a cross platform local directory for this app
-		Reference: https://pypi.python.org/pypi/appdirs/1.4.0 
+		Create a samtools compatible .fai index of an existing (plain or BGZF compressed) FASTA file
 		'''
-		directory = user_data_dir(application_name, '')
-		if not Utils.directory_exists(directory):
-			Utils.mkdir_p(directory)
 
-		return directory
+		with (gzip.open if fasta_filename.endswith('.gz') else open)(fasta_filename, 'rb') as f, Utils.atomic_write(index_filename) as index_f:
+			indexer = FastaIndexer(index_f, fasta_filename)
+			for line in f:
+				indexer.add_line(line)
+			indexer.close()
+
+	def keys(self):
+		return list(self.names)
+
+	def __contains__(self, name):
+		return name in self.index
+
+	def __getitem__(self, name):
+		length, offset, line_bases, line_width = self.index[name]
+		return FastaChromosome(self.data, name, length, offset, line_bases, line_width)
+
+	def close(self):
+		'''
+		Close the mmap (or the BGZF file). Chromosomes of this reader cannot be sliced afterwards. 
+		'''
+		if hasattr(self.data, 'close'):
+			self.data.close()
+
+
+class TwoBitChromosome(object):
+	'''
+	One sequence of a :py:class:`TwoBitReader`. Same slicing interface as :py:class:`FastaChromosome`. 
+	'''
+
+	_decode = np.array([[ord('TCAG'[(byte >> shift) & 3]) for shift in (6, 4, 2, 0)] for byte in range(256)], dtype=np.uint8)
+	_bases = np.array([ord(x) for x in 'TCAG'], dtype=np.uint8)
+
+	def __init__(self, data, name, offset, endian):
+		self.data = data
+		self.name = name
+
+		self.length, n_blocks = struct.unpack_from(endian + 'II', data, offset)
+		offset += 8
+		self.n_starts, self.n_ends, offset = self._read_blocks(data, offset, n_blocks, endian)
+		mask_blocks, = struct.unpack_from(endian + 'I', data, offset)
+		offset += 4
+		self.mask_starts, self.mask_ends, offset = self._read_blocks(data, offset, mask_blocks, endian)
+		self.dna_offset = offset + 4 # Reserved
+
+	@staticmethod
+	def _read_blocks(data, offset, count, endian):
+		'''
+		Returns the starts and ends of count blocks and the offset after them
+		'''
+		dtype = np.dtype(endian + 'u4')
+		starts = np.frombuffer(data, dtype=dtype, count=count, offset=offset).astype(np.int64)
+		sizes = np.frombuffer(data, dtype=dtype, count=count, offset=offset + 4 * count).astype(np.int64)
+		return starts, starts + sizes, offset + 8 * count
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			start, end, step = key.indices(self.length)
+			if step != 1:
+				raise ValueError('TwoBitChromosome does not support slice steps')
+		else:
+			if key < 0:
+				key += self.length
+			if not 0 <= key < self.length:
+				raise IndexError('Position %i is outside of %s' % (key, self.name))
+			start, end = key, key + 1
+
+		if start >= end:
+			return FastaSequence('')
+
+		first_byte = start // 4
+		packed = np.frombuffer(self.data, dtype=np.uint8, count=(end + 3) // 4 - first_byte, offset=self.dna_offset + first_byte)
+		bases = self._decode[packed].ravel()[start - first_byte * 4:end - first_byte * 4]
+
+		for block_start, block_end in self._overlapping(self.n_starts, self.n_ends, start, end):
+			bases[block_start - start:block_end - start] = ord('N')
+		for block_start, block_end in self._overlapping(self.mask_starts, self.mask_ends, start, end):
+			bases[block_start - start:block_end - start] |= 0x20 # Lower case
+
+		return FastaSequence(bases.tostring())
+
+	@staticmethod
+	def _overlapping(starts, ends, start, end):
+		'''
+		The parts of the (sorted, non overlapping) blocks that are within start, end
+		'''
+		for i in xrange(np.searchsorted(ends, start, side='right'), np.searchsorted(starts, end, side='left')):
+			yield max(starts[i], start), min(ends[i], end)
+
+	def bases_at(self, positions):
+		'''
+		The (upper case) bases at a numpy array of 0-based positions, as an array of ASCII codes. 
+		'''
+		positions = np.asarray(positions, dtype=np.int64)
+		data = np.frombuffer(self.data, dtype=np.uint8)
+		bases = self._bases[(data[self.dna_offset + positions // 4] >> (6 - 2 * (positions % 4))) & 3]
+
+		if len(self.n_starts):
+			block = np.maximum(np.searchsorted(self.n_starts, positions, side='right') - 1, 0)
+			bases[(positions >= self.n_starts[block]) & (positions < self.n_ends[block])] = ord('N')
+
+		return bases
+
+	def __str__(self):
+		return str(self[:])
+
+
+class TwoBitReader(object):
+	'''
+	Random access to a UCSC .2bit file ( https://genome.ucsc.edu/FAQ/FAQformat.html#format7 ). 
+	Bases are stored in 2 bits, N and lower case (soft masked) regions as blocks. The file is mmap'd. 
+
+	Same interface as :py:class:`FastaReader`: ``reader['chr1'][1000:1010]``
+	'''
+
+	signature = 0x1A412743
+
+	_encode_codes = np.array(['TCAG'.find(chr(x).upper()) if chr(x) in 'ACGTacgt' else 0 for x in range(256)], dtype=np.uint8) # N is stored as T
+	_acgt = np.array([chr(x) in 'ACGTacgt' for x in range(256)], dtype=np.bool_)
+
+	def __init__(self, twobit_filename):
+		self.twobit_filename = twobit_filename
+
+		with open(twobit_filename, 'rb') as f:
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		for endian in '<>':
+			signature, version, count, reserved = struct.unpack_from(endian + 'IIII', self.data, 0)
+			if signature == self.signature:
+				break
+		else:
+			raise MutationInfoException('File: %s is not a .2bit file' % (twobit_filename))
+		if not version in (0, 1):
+			raise MutationInfoException('File: %s . Unsupported .2bit version: %i' % (twobit_filename, version))
+
+		self.endian = endian
+		self.names = []
+		self.offsets = {}
+		offset_format = endian + ('I' if version == 0 else 'Q')
+		position = 16
+		for i in xrange(count):
+			name_size = ord(self.data[position])
+			name = self.data[position + 1:position + 1 + name_size]
+			position += 1 + name_size
+			self.offsets[name], = struct.unpack_from(offset_format, self.data, position)
+			position += struct.calcsize(offset_format)
+			self.names.append(name)
+
+		self.chromosomes = {}
+
+	def keys(self):
+		return list(self.names)
+
+	def __contains__(self, name):
+		return name in self.offsets
+
+	def __getitem__(self, name):
+		if not name in self.chromosomes:
+			self.chromosomes[name] = TwoBitChromosome(self.data, name, self.offsets[name], self.endian)
+		return self.chromosomes[name]
+
+	@staticmethod
+	def _runs(flags):
+		'''
+		Starts and sizes of the runs of True in flags
+		'''
+		changes = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+		starts, ends = changes[0::2], changes[1::2]
+		return starts, ends - starts
+
+	@staticmethod
+	def encode(sequence):
+		'''
+		Encode a sequence to a .2bit record
+		'''
+		bases = np.frombuffer(sequence, dtype=np.uint8)
+		n_starts, n_sizes = TwoBitReader._runs(~TwoBitReader._acgt[bases])
+		mask_starts, mask_sizes = TwoBitReader._runs((bases >= ord('a')) & (bases <= ord('z')))
+
+		codes = np.zeros(-(-len(bases) // 4) * 4, dtype=np.uint8)
+		codes[:len(bases)] = TwoBitReader._encode_codes[bases]
+		packed = (codes[0::4] << 6) | (codes[1::4] << 4) | (codes[2::4] << 2) | codes[3::4]
+
+		return ''.join([
+			struct.pack('<II', len(bases), len(n_starts)),
+			n_starts.astype('<u4').tostring(),
+			n_sizes.astype('<u4').tostring(),
+			struct.pack('<I', len(mask_starts)),
+			mask_starts.astype('<u4').tostring(),
+			mask_sizes.astype('<u4').tostring(),
+			struct.pack('<I', 0), # Reserved
+			packed.tostring(),
+		])
+
+	@staticmethod
+	def convert(fasta_filename, twobit_filename):
+		'''
+		Convert a FASTA file to .2bit (like UCSC's faToTwoBit). Lower case bases are kept as mask blocks.
+		'''
+
+		fasta = FastaReader(fasta_filename)
+		names = fasta.keys()
+		index_size = 16 + sum(1 + len(name) + 4 for name in names)
+
+		with Utils.atomic_write(twobit_filename, 'wb') as f:
+			f.write('\0' * index_size) # The index is written when the offsets are known
+
+			offsets = []
+			for name in names:
+				logging.info('Converting to .2bit: %s' % (name))
+				offsets.append(f.tell())
+				f.write(TwoBitReader.encode(str(fasta[name][:])))
+			if f.tell() >= 2**32:
+				raise MutationInfoException('FASTA file: %s is too large for a version 0 .2bit file' % (fasta_filename))
+
+			f.seek(0)
+			f.write(struct.pack('<IIII', TwoBitReader.signature, 0, len(names), 0))
+			for name, offset in zip(names, offsets):
+				f.write(struct.pack('<B', len(name)) + name + struct.pack('<I', offset))
+
+
+def _local_aligner_index_chromosome(args):
+	'''
+	Worker of :py:func:`LocalAligner.build`. Indexes the k-mers of one chromosome.
+	It is defined at module level so that multiprocessing can pickle it.
+	'''
+
+	genome_filename, name, global_offset, k, output_prefix = args
+
+	sequence = Utils.open_genome(genome_filename)[name][:]
+
+	# Non overlapping k-mers. Every exact match of 2k-1 bases in a query contains at least one of them 
+	codes = LocalAligner.encode(sequence)
+	del sequence
+	n = len(codes) // k
+	blocks = codes[:n*k].reshape(n, k)
+
+	hashes = []
+	positions = []
+	step = 1 << 20
+	for block_start in xrange(0, n, step):
+		block = blocks[block_start:block_start+step]
+		valid = (block < 4).all(axis=1)
+		block_hashes = np.zeros(len(block), dtype=np.uint64)
+		for j in xrange(k):
+			block_hashes = np.left_shift(block_hashes, np.uint64(2)) | block[:, j].astype(np.uint64)
+		hashes.append(block_hashes[valid])
+		positions.append((global_offset + (block_start + np.flatnonzero(valid)) * k).astype(np.uint32))
+
+	hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+	positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.uint32)
+
+	np.save(output_prefix + '.hashes.npy', hashes)
+	np.save(output_prefix + '.positions.npy', positions)
+	return output_prefix
+
+
+class LocalAligner(object):
+	'''
+	A BLAT-like aligner over a local reference genome (FASTA or .2bit) file. 
+
+	The index keeps every non overlapping k-mer of the genome (similar to BLAT's index) in a sorted array of 2-bit packed hashes. 
+	A query is aligned by looking up all its overlapping k-mers (on both strands) and by voting on the diagonal (genome position - query position) of the hits. 
+	The index is built once (in parallel, one chromosome per process) and is loaded with mmap afterwards. 
+	'''
+
+	k = 32 # 2 bits per base. A k-mer fits exactly in an uint64
+	max_occurrences = 32 # Ignore repetitive k-mers (similar to BLAT's repMatch)
+	locus_window = 2000000 # Hits further than this from the best hit belong to a different locus 
+
+	_codes = np.array(['ACGT'.find(chr(x).upper()) if chr(x) in 'ACGTacgt' else 4 for x in range(256)], dtype=np.uint8)
+	_complement = string.maketrans('ACGT', 'TGCA')
+
+	def __init__(self, genome_filename, index_directory, processes=None):
+		self.genome_filename = genome_filename
+		self.index_directory = index_directory
+		self.processes = processes
+
+		Utils.mkdir_p(self.index_directory)
+		self.meta_filename = os.path.join(self.index_directory, 'index.json')
+		self.hashes_filename = os.path.join(self.index_directory, 'hashes.npy')
+		self.positions_filename = os.path.join(self.index_directory, 'positions.npy')
+
+		with Utils.single_flight(self.meta_filename) as missing:
+			if missing:
+				logging.info('Local aligner index: %s does not exist. Building it..' % (self.meta_filename))
+				self.build()
+			else:
+				logging.info('Found local aligner index: %s' % (self.meta_filename))
+
+		meta = Utils.load_json_filename(self.meta_filename)
+		if meta['k'] != self.k:
+			raise MutationInfoException('Local aligner index: %s was built with k=%i. Delete it to rebuild it' % (self.meta_filename, meta['k']))
+
+		self.chromosomes = [str(x[0]) for x in meta['chromosomes']]
+		self.offsets = np.array([x[1] for x in meta['chromosomes']], dtype=np.int64)
+		self.lengths = [x[2] for x in meta['chromosomes']]
+		self.genome = Utils.open_genome(self.genome_filename) # For the extension of the aligned segments
+		self.hashes = np.load(self.hashes_filename, mmap_mode='r')
+		self.positions = np.load(self.positions_filename, mmap_mode='r')
+
+	@staticmethod
+	def encode(sequence):
+		'''
+		A: 0, C: 1, G: 2, T: 3, Anything else: 4
+		'''
+		return LocalAligner._codes[np.frombuffer(sequence, dtype=np.uint8)]
+
+	def build(self):
+		'''
+		Build the index. One process per chromosome.
+		'''
+
+		genome = Utils.open_genome(self.genome_filename)
+
+		chromosomes = []
+		jobs = []
+		global_offset = 0
+		for name in genome.keys():
+			length = len(genome[name])
+			chromosomes.append([name, global_offset, length])
+			jobs.append((self.genome_filename, name, global_offset, self.k, os.path.join(self.index_directory, name)))
+			global_offset += length
+
+		if global_offset >= 2**32:
+			raise MutationInfoException('Genome in %s is too large for the local aligner' % (self.genome_filename))
+
+		processes = self.processes or multiprocessing.cpu_count()
+		logging.info('Indexing %i chromosomes with %i processes..' % (len(jobs), processes))
+		pool = multiprocessing.Pool(processes)
+		try:
+			output_prefixes = pool.map(_local_aligner_index_chromosome, jobs)
+		finally:
+			pool.close()
+			pool.join()
+
+		logging.info('Merging and sorting k-mers..')
+		hashes = np.concatenate([np.load(x + '.hashes.npy') for x in output_prefixes])
+		positions = np.concatenate([np.load(x + '.positions.npy') for x in output_prefixes])
+		for output_prefix in output_prefixes:
+			os.remove(output_prefix + '.hashes.npy')
+			os.remove(output_prefix + '.positions.npy')
+
+		order = np.argsort(hashes, kind='mergesort')
+		with Utils.atomic_write(self.hashes_filename, 'wb') as f:
+			np.save(f, hashes[order])
+		del hashes
+		with Utils.atomic_write(self.positions_filename, 'wb') as f:
+			np.save(f, positions[order])
+		del positions, order
+
+		# The meta file is written last. Its existence means that the index is complete
+		Utils.save_json_filenane(self.meta_filename, {'k': self.k, 'chromosomes': chromosomes})
+		logging.info('Local aligner index saved in: %s' % (self.index_directory))
+
+	def _hits(self, sequence):
+		'''
+		Returns the query positions and the diagonals (genome position - query position) of all k-mer hits 
+		'''
+
+		k = self.k
+		codes = self.encode(sequence)
+		n = len(codes) - k + 1
+		if n <= 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+		hashes = np.zeros(n, dtype=np.uint64)
+		for j in xrange(k):
+			hashes = np.left_shift(hashes, np.uint64(2)) | codes[j:j+n].astype(np.uint64)
+
+		# Discard k-mers with Ns
+		invalid = np.concatenate(([0], np.cumsum(codes >= 4)))
+		query_positions = np.flatnonzero(invalid[k:k+n] == invalid[:n])
+		hashes = hashes[query_positions]
+
+		left = np.searchsorted(self.hashes, hashes, side='left')
+		right = np.searchsorted(self.hashes, hashes, side='right')
+		counts = right - left
+		keep = (counts > 0) & (counts <= self.max_occurrences)
+		query_positions, left, counts = query_positions[keep], left[keep], counts[keep]
+
+		# Expand the [left, right) ranges of all k-mers
+		total = counts.sum()
+		within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+		genome_positions = self.positions[np.repeat(left, counts) + within].astype(np.int64)
+		query_positions = np.repeat(query_positions, counts)
+
+		return query_positions, genome_positions - query_positions
+
+	def _genome_bases(self, diagonal, anchor, first, last):
+		'''
+		The (upper case) genome bases that are on diagonal with the query positions first ... last - 1. 
+		anchor is a query position of the segment of this diagonal (it sets the chromosome). Bases outside of the chromosome are N.
+		'''
+
+		chrom_index = np.searchsorted(self.offsets, diagonal + anchor, side='right') - 1
+		start = diagonal + first - int(self.offsets[chrom_index])
+		end = diagonal + last - int(self.offsets[chrom_index])
+		clipped_start, clipped_end = max(start, 0), min(end, self.lengths[chrom_index])
+		if clipped_start >= clipped_end:
+			return 'N' * max(end - start, 0)
+
+		bases = str(self.genome[self.chromosomes[chrom_index]][clipped_start:clipped_end]).upper()
+		return 'N' * (clipped_start - start) + bases + 'N' * (end - clipped_end)
+
+	def _extension(self, query, diagonal, anchor, first, last, backwards=False):
+		'''
+		The number of consecutive bases of query[first:last] that match the genome on diagonal. 
+		Counted from first, or from last - 1 if backwards is True.
+		'''
+
+		query_bases = query[first:last]
+		genome_bases = self._genome_bases(diagonal, anchor, first, last)
+		if backwards:
+			query_bases, genome_bases = query_bases[::-1], genome_bases[::-1]
+
+		extension = 0
+		for query_base, genome_base in zip(query_bases, genome_bases):
+			if query_base != genome_base or genome_base == 'N':
+				break
+			extension += 1
+		return extension
+
+	def _splice_site(self, left_diagonal, left_anchor, right_diagonal, right_anchor, junction):
+		'''
+		True if an intron between the exons of the two diagonals, before the query position junction, has GT-AG splice sites (on either strand)
+		'''
+
+		donor = self._genome_bases(left_diagonal, left_anchor, junction, junction + 2)
+		acceptor = self._genome_bases(right_diagonal, right_anchor, junction - 2, junction)
+		return (donor, acceptor) in [('GT', 'AG'), ('CT', 'AC')]
+
+	def _junction_segment(self, query, query_pos, left, right, diagonals, segment_starts, segment_ends):
+		'''
+		Locate a query position that is between two aligned segments (or between a segment and the end of the query). 
+		left and right are the closest segments before and after query_pos (None if there is not any).
+		Returns the segment of query_pos or None if this is not certain.
+		'''
+
+		# The query position where the exon of right starts. Bases at the edges of exons can match the intron by chance, \
+		# so the extensions of the two segments can overlap. The junction is somewhere in the overlap.
+		left_end = int(segment_ends[left]) + 1 if left is not None else 0
+		right_start = int(segment_starts[right]) if right is not None else len(query)
+		last_junction = left_end
+		if left is not None:
+			last_junction += self._extension(query, int(diagonals[left]), left_end - 1, left_end, right_start)
+		first_junction = right_start
+		if right is not None:
+			first_junction -= self._extension(query, int(diagonals[right]), right_start, left_end, right_start, backwards=True)
+
+		if first_junction > last_junction:
+			# The extensions do not meet (i.e. a short exon without k-mer hits, or a mismatch). The ends of the exons are not certain
+			return None
+
+		junctions = range(first_junction, last_junction + 1)
+		if left is not None and right is not None:
+			splice_sites = [x for x in junctions if self._splice_site(int(diagonals[left]), left_end - 1, int(diagonals[right]), right_start, x)]
+			if splice_sites:
+				junctions = splice_sites
+
+		sides = set(query_pos >= x for x in junctions)
+		if len(sides) > 1:
+			logging.warning('Local aligner: The exon junction (query positions %i-%i) is ambiguous' % (first_junction, last_junction))
+			return None
+
+		return right if sides.pop() else left
+
+	def align(self, sequence, pos):
+		'''
+		Align sequence in the genome and locate the 1-based position pos of the sequence.
+
+		:return: chrom, position (1-based), direction ('+' or '-'). The position and direction have the same meaning \
+		as the ones returned by :py:func:`MutationInfo._find_alignment_position_in_blat_result`. \
+		If the position cannot be located it returns None, None, None
+		'''
+
+		sequence = str(sequence).upper()
+		length = len(sequence)
+		reverse_complement = sequence.translate(self._complement)[::-1]
+
+		# Hits of both strands: (direction, 0-based position of pos in the query, query positions, diagonals)
+		strands = []
+		for direction, query, query_pos in [('+', sequence, pos - 1), ('-', reverse_complement, length - pos)]:
+			query_positions, diagonals = self._hits(query)
+			strands.append((direction, query, query_pos, query_positions, diagonals))
+
+		# Find the locus with the best supported diagonal 
+		best = None
+		for strand in strands:
+			diagonals = strand[4]
+			if not len(diagonals):
+				continue
+			unique_diagonals, counts = np.unique(diagonals, return_counts=True)
+			best_index = np.argmax(counts)
+			if best is None or counts[best_index] > best[0]:
+				best = (counts[best_index], unique_diagonals[best_index], strand)
+
+		if best is None:
+			logging.error('Local aligner: The sequence did not match anywhere in the genome')
+			return None, None, None
+
+		_, best_diagonal, (direction, query, query_pos, query_positions, diagonals) = best
+		best_chrom_index = np.searchsorted(self.offsets, best_diagonal, side='right') - 1
+
+		# Keep the hits of the same locus 
+		locus = np.abs(diagonals - best_diagonal) <= self.locus_window
+		locus &= (np.searchsorted(self.offsets, diagonals + query_positions, side='right') - 1) == best_chrom_index
+		query_positions, diagonals = query_positions[locus], diagonals[locus]
+
+		# Every diagonal is an ungapped aligned segment (i.e. an exon). Find the one that contains pos 
+		order = np.lexsort((query_positions, diagonals))
+		query_positions, diagonals = query_positions[order], diagonals[order]
+		unique_diagonals, first, counts = np.unique(diagonals, return_index=True, return_counts=True)
+		segment_starts = np.minimum.reduceat(query_positions, first)
+		segment_ends = np.maximum.reduceat(query_positions, first) + self.k - 1
+
+		containing = np.flatnonzero((segment_starts <= query_pos) & (query_pos <= segment_ends))
+		if len(containing):
+			segment = containing[np.argmax(counts[containing])]
+		else:
+			# pos is in the part of an exon that is not covered by an indexed k-mer (up to k - 1 bases at each end), 
+			# in a short exon without hits or in a part of the query that does not align. 
+			# The closest segments before and after pos are extended against the genome (the ones with more k-mers on ties)
+			before = np.flatnonzero(segment_ends < query_pos)
+			after = np.flatnonzero(segment_starts > query_pos)
+			left = before[np.lexsort((-counts[before], -segment_ends[before]))[0]] if len(before) else None
+			right = after[np.lexsort((-counts[after], segment_starts[after]))[0]] if len(after) else None
+			segment = self._junction_segment(query, query_pos, left, right, unique_diagonals, segment_starts, segment_ends)
+
+		if segment is None:
+			logging.error('Local aligner: The position {} was not found (did not match anywhere) in the alignment.'.format(pos))
+			return None, None, None
+
+		genome_position = int(unique_diagonals[segment] + query_pos)
+		chrom_index = np.searchsorted(self.offsets, genome_position, side='right') - 1
+		chrom = self.chromosomes[chrom_index]
+		position = genome_position - int(self.offsets[chrom_index]) + 1
+
+		logging.info('Local aligner: Position: %i Chromosome: %s Genome position: %i Direction: %s Supporting k-mers: %i' % (pos, chrom, position, direction, counts[segment]))
+		return chrom, position, direction
+
+
+class LocalDbSNP(object):
+	'''
+	A local, indexed copy of dbSNP. 
+
+	It is built from a dbSNP VCF file or from a UCSC ``snpNNN.txt.gz`` table dump (http://hgdownload.cse.ucsc.edu/goldenPath/hg19/database/ ). 
+	Records are stored in the UCSC representation (chrom, chromEnd, strand, refNCBI, refUCSC, observed) as sorted numpy arrays (mmap'd) 
+	and a blob with the allele strings. A lookup is a binary search on the rs numbers. 
+	'''
+
+	def __init__(self, index_directory):
+		self.index_directory = index_directory
+
+		meta = Utils.load_json_filename(self.meta_filename(index_directory))
+		self.assembly = str(meta['assembly'])
+		self.chromosomes = [str(x) for x in meta['chromosomes']]
+		self.rs = np.load(os.path.join(index_directory, 'rs.npy'), mmap_mode='r')
+		self.chrom = np.load(os.path.join(index_directory, 'chrom.npy'), mmap_mode='r')
+		self.chromEnd = np.load(os.path.join(index_directory, 'chromEnd.npy'), mmap_mode='r')
+		self.strand = np.load(os.path.join(index_directory, 'strand.npy'), mmap_mode='r')
+		self.alleles_start = np.load(os.path.join(index_directory, 'alleles_start.npy'), mmap_mode='r')
+		self.alleles_length = np.load(os.path.join(index_directory, 'alleles_length.npy'), mmap_mode='r')
+		self.alleles = np.memmap(os.path.join(index_directory, 'alleles.bin'), dtype=np.uint8, mode='r')
+
+	@staticmethod
+	def meta_filename(index_directory):
+		return os.path.join(index_directory, 'dbsnp.json')
+
+	@staticmethod
+	def exists(index_directory):
+		return Utils.file_exists(LocalDbSNP.meta_filename(index_directory))
+
+	def search(self, variant):
+		'''
+		Returns a list of (chrom, chromEnd, strand, refNCBI, refUCSC, observed) records for an rs variant 
+		'''
+
+		if not re.match(r'^rs[\d]+$', variant):
+			return []
+
+		rs = int(variant[2:])
+		if rs >= 2**32:
+			return []
+
+		left = np.searchsorted(self.rs, rs, side='left')
+		right = np.searchsorted(self.rs, rs, side='right')
+
+		ret = []
+		for i in xrange(left, right):
+			start = int(self.alleles_start[i])
+			refNCBI, refUCSC, observed = self.alleles[start:start + int(self.alleles_length[i])].tostring().split('\t')
+			ret.append((self.chromosomes[self.chrom[i]], int(self.chromEnd[i]), '+-'[self.strand[i]], refNCBI, refUCSC, observed))
+
+		return ret
+
+	@staticmethod
+	def _ucsc_records(f):
+		'''
+		Records of a UCSC snpNNN.txt table
+		Columns: http://genome.ucsc.edu/cgi-bin/hgTables?db=hg19&hgta_group=varRep&hgta_track=snp146&hgta_table=snp146&hgta_doSchema=describe+table+schema
+		'''
+		for line in f:
+			ls = line.split('\t')
+			name = ls[4]
+			if not name.startswith('rs'):
+				continue
+			# chrom, chromEnd, name, strand, refNCBI, refUCSC, observed 
+			yield ls[1], int(ls[3]), name, ls[6], ls[7], ls[8], ls[9]
+
+	@staticmethod
+	def _vcf_records(f):
+		'''
+		Records of a dbSNP VCF file in the UCSC representation
+		'''
+		for line in f:
+			if line[0] == '#':
+				continue
+			ls = line.split('\t', 8)
+			chrom, pos, names, ref, alts = ls[0], int(ls[1]), ls[2], ls[3].upper(), ls[4].upper().split(',')
+
+			names = [x for x in names.split(';') if x.startswith('rs')]
+			if not names:
+				search = re.search(r'(?:^|;)RS=([\d]+)', ls[7])
+				if not search:
+					continue
+				names = ['rs' + search.group(1)]
+
+			alts = [x for x in alts if x != '.']
+
+			# Remove the padding base(s) of indels
+			p = 0
+			while alts and len(ref) > p and all(len(x) > p and x[p] == ref[p] for x in alts):
+				p += 1
+			ref_s = ref[p:]
+			alts_s = [x[p:] or '-' for x in alts]
+
+			chromEnd = pos + p - 1 + len(ref_s)
+			ref_s = ref_s or '-'
+			observed = '/'.join([ref_s] + alts_s)
+
+			for name in names:
+				yield chrom, chromEnd, name, '+', ref_s, ref_s, observed
+
+	@staticmethod
+	def build(input_filename, index_directory, assembly):
+		'''
+		Build the index from a dbSNP VCF file or from a UCSC snpNNN.txt table (optionally gzipped) 
+		'''
+
+		Utils.mkdir_p(index_directory)
+
+		opener = gzip.open if input_filename.endswith('.gz') else open
+		with opener(input_filename) as f:
+			first_line = f.readline()
+		is_vcf = first_line.startswith('##fileformat=VCF')
+		logging.info('Building local dbSNP index from %s file: %s' % ('VCF' if is_vcf else 'UCSC', input_filename))
+
+		chromosomes = {}
+		rs = array.array('I')
+		chrom = array.array('H')
+		chromEnd = array.array('I')
+		strand = array.array('B')
+		alleles_start = array.array('L')
+		alleles_length = array.array('I')
+
+		alleles_filename = os.path.join(index_directory, 'alleles.bin')
+		alleles_offset = 0
+		with Utils.atomic_write(alleles_filename, 'wb') as alleles_f, opener(input_filename) as f:
+			records = LocalDbSNP._vcf_records(f) if is_vcf else LocalDbSNP._ucsc_records(f)
+			for record_index, (r_chrom, r_chromEnd, r_name, r_strand, r_refNCBI, r_refUCSC, r_observed) in enumerate(records):
+				if not r_chrom in chromosomes:
+					chromosomes[r_chrom] = len(chromosomes)
+
+				record_alleles = '\t'.join([r_refNCBI, r_refUCSC, r_observed])
+				alleles_f.write(record_alleles)
+
+				rs.append(int(r_name[2:]))
+				chrom.append(chromosomes[r_chrom])
+				chromEnd.append(r_chromEnd)
+				strand.append(1 if r_strand == '-' else 0)
+				alleles_start.append(alleles_offset)
+				alleles_length.append(len(record_alleles))
+				alleles_offset += len(record_alleles)
+
+				if record_index % 1000000 == 0:
+					logging.info('Imported %i records' % (record_index))
+
+		if not len(rs):
+			raise MutationInfoException('Could not find any dbSNP records in %s' % (input_filename))
+
+		logging.info('Sorting %i records..' % (len(rs)))
+		order = np.argsort(np.frombuffer(rs, dtype='u%i' % rs.itemsize), kind='mergesort')
+		for name, values, dtype in [
+			('rs', rs, np.uint32),
+			('chrom', chrom, np.uint16),
+			('chromEnd', chromEnd, np.uint32),
+			('strand', strand, np.uint8),
+			('alleles_start', alleles_start, np.uint64),
+			('alleles_length', alleles_length, np.uint32),
+			]:
+			with Utils.atomic_write(os.path.join(index_directory, name + '.npy'), 'wb') as f:
+				np.save(f, np.frombuffer(values, dtype='u%i' % values.itemsize).astype(dtype)[order])
+
+		# The meta file is written last. Its existence means that the index is complete
+		Utils.save_json_filenane(LocalDbSNP.meta_filename(index_directory), {
+			'assembly': assembly,
+			'source': os.path.basename(input_filename),
+			'chromosomes': sorted(chromosomes, key=chromosomes.get),
+		})
+		logging.info('Local dbSNP index saved in: %s' % (index_directory))
+
+
+class _SQLiteUTADataProvider(object):
+	'''
+	A biocommons hgvs data provider that serves a local SQLite snapshot of UTA (see :py:func:`build`). 
+	It can be used instead of the remote PostgreSQL UTA connection by EasyVariantMapper and Normalizer. 
+	The data provider class (:py:class:`SQLiteUTADataProvider`) also derives from the hgvs Interface and SeqFetcher. 
+	It is created the first time it is used, so that hgvs is not imported with MutationInfo.
+
+	The snapshot stores the (JSON serialized) replies of the UTA interface methods for a set of transcripts, 
+	the transcript sequences and an indexed table with the genomic span of every alignment for get_tx_for_region. 
+	Sequences that are not in the snapshot (i.e. chromosomes) are fetched with SeqFetcher.
+	'''
+
+	required_version = '1.1'
+
+	_schema = [
+		'create table if not exists meta (key text primary key, value text)',
+		'create table if not exists calls (method text, args text, result text, primary key (method, args))',
+		'create table if not exists seq (ac text primary key, seq text)',
+		'create table if not exists tx_region (tx_ac text, alt_ac text, alt_strand integer, alt_aln_method text, start_i integer, end_i integer, primary key (tx_ac, alt_ac, alt_aln_method))',
+		'create index if not exists tx_region_index on tx_region (alt_ac, alt_aln_method, start_i, end_i)',
+	]
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.url = filename
+		self._local = threading.local()
+		super(_SQLiteUTADataProvider, self).__init__()
+
+	def _connection(self):
+		'''
+		sqlite3 connections cannot be shared between threads
+		'''
+		if not hasattr(self._local, 'connection'):
+			self._local.connection = sqlite3.connect(self.filename)
+		return self._local.connection
+
+	def _get(self, method, *args):
+		row = self._connection().execute('select result from calls where method=? and args=?', (method, json.dumps(args))).fetchone()
+		if row is None:
+			return None
+		return json.loads(row[0])
+
+	def _not_available(self, method, *args):
+		raise hgvs_biocommons_exceptions.HGVSDataNotAvailableError('No %s for %s in UTA snapshot: %s' % (method, str(args), self.filename))
+
+	def data_version(self):
+		return self._connection().execute("select value from meta where key='data_version'").fetchone()[0]
+
+	def schema_version(self):
+		return self._connection().execute("select value from meta where key='schema_version'").fetchone()[0]
+
+	def get_tx_exons(self, tx_ac, alt_ac, alt_aln_method):
+		ret = self._get('get_tx_exons', tx_ac, alt_ac, alt_aln_method)
+		if ret is None:
+			self._not_available('tx_exons', tx_ac, alt_ac, alt_aln_method)
+		return ret
+
+	def get_tx_info(self, tx_ac, alt_ac, alt_aln_method):
+		ret = self._get('get_tx_info', tx_ac, alt_ac, alt_aln_method)
+		if ret is None:
+			self._not_available('tx_info', tx_ac, alt_ac, alt_aln_method)
+		return ret
+
+	def get_tx_identity_info(self, tx_ac):
+		ret = self._get('get_tx_identity_info', tx_ac)
+		if ret is None:
+			self._not_available('transcript definition', tx_ac)
+		return ret
+
+	def get_tx_mapping_options(self, tx_ac):
+		return self._get('get_tx_mapping_options', tx_ac) or []
+
+	def get_tx_for_gene(self, gene):
+		return self._get('get_tx_for_gene', gene) or []
+
+	def get_gene_info(self, gene):
+		return self._get('get_gene_info', gene)
+
+	def get_similar_transcripts(self, tx_ac):
+		return self._get('get_similar_transcripts', tx_ac) or []
+
+	def get_pro_ac_for_tx_ac(self, tx_ac):
+		return self._get('get_pro_ac_for_tx_ac', tx_ac)
+
+	def get_acs_for_protein_seq(self, seq):
+		ret = self._get('get_acs_for_protein_seq', seq)
+		if ret is None:
+			self._not_available('protein accessions', seq)
+		return ret
+
+	def get_tx_for_region(self, alt_ac, alt_aln_method, start_i, end_i):
+		cursor = self._connection().execute(
+			'select tx_ac, alt_ac, alt_strand, alt_aln_method, start_i, end_i from tx_region where alt_ac=? and alt_aln_method=? and end_i>? and start_i<?', 
+			(alt_ac, alt_aln_method, start_i, end_i))
+		columns = [x[0] for x in cursor.description]
+		return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+	def get_tx_seq(self, ac):
+		row = self._connection().execute('select seq from seq where ac=?', (ac,)).fetchone()
+		if row is None:
+			return None
+		return row[0]
+
+	def fetch_seq(self, ac, start_i=None, end_i=None):
+		if start_i is None or end_i is None:
+			row = self._connection().execute('select seq from seq where ac=?', (ac,)).fetchone()
+		else:
+			row = self._connection().execute('select substr(seq, ?, ?) from seq where ac=?', (start_i + 1, end_i - start_i, ac)).fetchone()
+		if not row is None:
+			return row[0]
+
+		logging.info('Sequence %s is not in the UTA snapshot. Fetching it..' % (ac))
+		return super(_SQLiteUTADataProvider, self).fetch_seq(ac, start_i, end_i)
+
+	@staticmethod
+	def build(filename, hdp, transcripts=None, genes=None):
+		'''
+		Create (or extend) a UTA snapshot with all the data of the transcripts and genes that the biocommons mapping uses.
+
+		:param filename: The SQLite file of the snapshot
+		:param hdp: A (remote) UTA data provider. i.e. ``hgvs.dataproviders.uta.connect()``
+		:param transcripts: A list of transcript accessions (i.e. NM_000367.2)
+		:param genes: A list of HGNC gene names. All transcripts of these genes are included 
+		'''
+
+		transcripts = list(transcripts or [])
+		genes = list(genes or [])
+
+		def as_json(value):
+			if value is None:
+				return None
+			if hasattr(value, 'keys'):
+				# Rows. Checked first: psycopg2's DictRow is a list
+				return {k: as_json(value[k]) for k in value.keys()}
+			if isinstance(value, (list, tuple)):
+				return [as_json(x) for x in value]
+			return value
+
+		with contextlib.closing(sqlite3.connect(filename)) as connection:
+			for statement in SQLiteUTADataProvider._schema:
+				connection.execute(statement)
+			connection.execute('insert or replace into meta values (?, ?)', ('schema_version', hdp.schema_version()))
+			connection.execute('insert or replace into meta values (?, ?)', ('data_version', hdp.data_version()))
+
+			def store(method, *args):
+				try:
+					result = as_json(getattr(hdp, method)(*args))
+				except hgvs_biocommons_exceptions.HGVSError as e:
+					logging.warning('UTA snapshot: %s%s failed: %s' % (method, str(args), str(e)))
+					return None
+				connection.execute('insert or replace into calls values (?, ?, ?)', (method, json.dumps(args), json.dumps(result, default=str)))
+				return result
+
+			for gene in genes:
+				logging.info('UTA snapshot: gene %s' % (gene))
+				store('get_gene_info', gene)
+				for tx in store('get_tx_for_gene', gene) or []:
+					if not tx['tx_ac'] in transcripts:
+						transcripts.append(tx['tx_ac'])
+
+			for tx_ac in transcripts:
+				logging.info('UTA snapshot: transcript %s' % (tx_ac))
+				store('get_tx_identity_info', tx_ac)
+				store('get_similar_transcripts', tx_ac)
+				pro_ac = store('get_pro_ac_for_tx_ac', tx_ac)
+
+				for option in store('get_tx_mapping_options', tx_ac) or []:
+					store('get_tx_info', tx_ac, option['alt_ac'], option['alt_aln_method'])
+					exons = store('get_tx_exons', tx_ac, option['alt_ac'], option['alt_aln_method'])
+					if exons:
+						connection.execute('insert or replace into tx_region values (?, ?, ?, ?, ?, ?)', (
+							tx_ac, option['alt_ac'], exons[0]['alt_strand'], option['alt_aln_method'], 
+							min(x['alt_start_i'] for x in exons), max(x['alt_end_i'] for x in exons)))
+
+				for ac in [tx_ac, pro_ac]:
+					if ac is None:
+						continue
+					try:
+						seq = hdp.fetch_seq(ac)
+					except Exception as e:
+						logging.warning('UTA snapshot: Could not fetch sequence %s: %s' % (ac, str(e)))
+						continue
+					connection.execute('insert or replace into seq values (?, ?)', (ac, seq))
+
+			connection.commit()
+
+		logging.info('UTA snapshot saved in: %s (%i transcripts)' % (filename, len(transcripts)))
+
+SQLiteUTADataProvider = _LazyImport(loader=lambda: type('SQLiteUTADataProvider', 
+	(_SQLiteUTADataProvider, hgvs_biocommons_interface.Interface, hgvs_biocommons_seqfetcher.SeqFetcher), {'__module__': __name__}))
+
+
+class LiftOver(object):
+	'''
+	Converts positions between assemblies with the UCSC chain files (http://hgdownload.cse.ucsc.edu/goldenPath/hg19/liftOver/ ).
+
+	The aligned blocks of a chain file are stored as sorted numpy arrays. The key of a block is ``chromosome index * 2**32 + start`` 
+	so a batch of positions (from any chromosome) is converted with a single binary search. 
+	The arrays are saved next to the chain file (``.npz``), so a chain file is parsed only once. 
+	Positions are lifted individually. Where blocks of the source assembly overlap, the block of the chain with the highest score is used 
+	(same as UCSC liftOver). 
+	'''
+
+	chain_url = 'http://hgdownload.cse.ucsc.edu/goldenPath/{source}/liftOver/{chain}'
+	npz_version = 2 # Version of the parsed (.npz) chain files. Older versions are parsed again
+
+	def __init__(self, directory, target):
+		'''
+		:param directory: Where chain files are downloaded
+		:param target: The assembly to convert to (i.e. hg19)
+		'''
+		self.directory = directory
+		self.target = target
+		self.chains = {}
+		self.lock = threading.Lock()
+
+	def chain_filename(self, source):
+		return os.path.join(self.directory, '%sTo%s.over.chain.gz' % (source, self.target[0].upper() + self.target[1:]))
+
+	@staticmethod
+	def parse_chain_file(filename):
+		'''
+		Returns the numpy arrays of the blocks of a chain file. Format: https://genome.ucsc.edu/goldenPath/help/chain.html 
+		'''
+
+		source_chromosomes = {}
+		target_chromosomes = {}
+
+		source_key = array.array('l')
+		source_length = array.array('l')
+		target_chrom = array.array('l')
+		target_start = array.array('l')
+		target_strand = array.array('b')
+		target_size = array.array('l')
+		score = array.array('l')
+
+		opener = gzip.open if filename.endswith('.gz') else open
+		with opener(filename) as f:
+			for line in f:
+				ls = line.split()
+				if not ls:
+					continue
+
+				if ls[0] == 'chain':
+					# chain score tName tSize tStrand tStart tEnd qName qSize qStrand qStart qEnd id 
+					chain_score = int(ls[1])
+					t_chrom = source_chromosomes.setdefault(ls[2], len(source_chromosomes))
+					t_start = int(ls[5])
+					q_chrom = target_chromosomes.setdefault(ls[7], len(target_chromosomes))
+					q_size = int(ls[8])
+					q_strand = 1 if ls[9] == '-' else 0
+					q_start = int(ls[10])
+					continue
+
+				# size [dt dq]
+				size = int(ls[0])
+				source_key.append(t_chrom * 2**32 + t_start)
+				source_length.append(size)
+				target_chrom.append(q_chrom)
+				target_start.append(q_start)
+				target_strand.append(q_strand)
+				target_size.append(q_size)
+				score.append(chain_score)
+
+				if len(ls) == 3:
+					t_start += size + int(ls[1])
+					q_start += size + int(ls[2])
+
+		start = np.array(source_key, dtype=np.int64)
+		order = np.argsort(start, kind='mergesort')
+		start = start[order]
+		end = start + np.array(source_length, dtype=np.int64)[order]
+		target_start = np.array(target_start, dtype=np.int64)[order]
+		score = np.array(score, dtype=np.int64)[order]
+
+		# Groups of overlapping blocks. Most blocks do not overlap with any other
+		new_group = np.ones(len(start), dtype=bool)
+		new_group[1:] = start[1:] >= np.maximum.accumulate(end)[:-1]
+		group_starts = np.flatnonzero(new_group)
+		group_ends = np.append(group_starts[1:], len(start))
+		overlapping = np.flatnonzero(group_ends - group_starts > 1)
+
+		if len(overlapping):
+			# Split every group into the pieces of the best scoring block that covers them
+			pieces = []
+			for group_start, group_end in zip(group_starts[overlapping], group_ends[overlapping]):
+				covered = [] # Sorted, non overlapping [start, end) intervals
+				for i in sorted(range(group_start, group_end), key=lambda x: (-score[x], order[x])):
+					parts = [(int(start[i]), int(end[i]))]
+					for covered_start, covered_end in covered:
+						parts = [y for part_start, part_end in parts for y in [(part_start, min(part_end, covered_start)), (max(part_start, covered_end), part_end)] if y[0] < y[1]]
+					for part_start, part_end in parts:
+						pieces.append((part_start, part_end, i))
+					covered = sorted(covered + parts)
+
+			keep = np.ones(len(start), dtype=bool)
+			for group_start, group_end in zip(group_starts[overlapping], group_ends[overlapping]):
+				keep[group_start:group_end] = False
+			blocks = np.concatenate((np.flatnonzero(keep), np.array([x[2] for x in pieces], dtype=np.int64)))
+			piece_start = np.concatenate((start[keep], np.array([x[0] for x in pieces], dtype=np.int64)))
+			piece_end = np.concatenate((end[keep], np.array([x[1] for x in pieces], dtype=np.int64)))
+
+			piece_order = np.argsort(piece_start, kind='mergesort')
+			blocks, piece_start, piece_end = blocks[piece_order], piece_start[piece_order], piece_end[piece_order]
+			target_start = target_start[blocks] + piece_start - start[blocks]
+			start, end, order = piece_start, piece_end, order[blocks]
+
+		return {
+			'start': start,
+			'end': end,
+			'target_chrom': np.array(target_chrom, dtype=np.int32)[order],
+			'target_start': target_start,
+			'target_strand': np.array(target_strand, dtype=np.int8)[order],
+			'target_size': np.array(target_size, dtype=np.int64)[order],
+			'source_chromosomes': np.array(sorted(source_chromosomes, key=source_chromosomes.get)),
+			'target_chromosomes': np.array(sorted(target_chromosomes, key=target_chromosomes.get)),
+		}
+
+	def _load(self, source):
+		'''
+		Download (if necessary), parse and load the chain file from source to target
+		'''
+
+		with self.lock:
+			if source in self.chains:
+				return self.chains[source]
+
+			chain_filename = self.chain_filename(source)
+			npz_filename = '%s.%i.npz' % (chain_filename, self.npz_version)
+			with Utils.single_flight(npz_filename) as missing:
+				if missing:
+					if not Utils.file_exists(chain_filename):
+						url = self.chain_url.format(source=source, chain=os.path.basename(chain_filename))
+						logging.info('Downloading chain file: %s' % (url))
+						Utils.download(url, chain_filename, md5=Utils.remote_md5(url))
+					logging.info('Parsing chain file: %s' % (chain_filename))
+					arrays = LiftOver.parse_chain_file(chain_filename)
+					with Utils.atomic_write(npz_filename, 'wb') as f:
+						np.savez(f, **arrays)
+
+			chain = dict(np.load(npz_filename).items())
+			chain['source_index'] = {str(x):i for i, x in enumerate(chain['source_chromosomes'])}
+			chain['target_chromosomes'] = [str(x) for x in chain['target_chromosomes']]
+			self.chains[source] = chain
+			return chain
+
+	def convert(self, source, chroms, positions):
+		'''
+		Convert (1-based) positions from source to the target assembly. 
+
+		:param source: The assembly of the positions (i.e. hg38)
+		:param chroms: List of UCSC chromosome names (i.e. chr1)
+		:param positions: List of positions
+		:return: A list with a (chrom, position, strand) tuple for every position. None for positions that could not be converted.
+		'''
+
+		chain = self._load(source)
+
+		chrom_index = np.array([chain['source_index'].get(chrom, -1) for chrom in chroms], dtype=np.int64)
+		keys = chrom_index * 2**32 + np.array(positions, dtype=np.int64) - 1
+
+		index = np.searchsorted(chain['start'], keys, side='right') - 1
+		found = (chrom_index >= 0) & (index >= 0)
+		index[~found] = 0
+		found &= keys < chain['end'][index]
+
+		minus = chain['target_strand'][index] == 1
+		target = chain['target_start'][index] + keys - chain['start'][index]
+		target = np.where(minus, chain['target_size'][index] - 1 - target, target) + 1
+
+		target_chromosomes = chain['target_chromosomes']
+		return [(target_chromosomes[c], int(t), '-' if m else '+') if f else None for f, c, t, m in zip(found, chain['target_chrom'][index], target, minus)]
+
+
+class RequestCoalescer(object):
+	'''
+	Coalesces identical concurrent requests in the same process. Keys are (genome, request, arguments) tuples (see :py:func:`MutationInfo._coalescing_key`).
+	The first request for a key runs the function. Requests for the same key that arrive while 
+	the first is still running wait for it and get (a copy of) its result instead of running the function again. 
+
+	``requests`` and ``coalesced`` count all requests and the requests that were attached to a request in flight.
+	'''
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._in_flight = {}
+		self._local = threading.local()
+		self.requests = 0
+		self.coalesced = 0
+
+	def run(self, key, function, *args, **kwargs):
+
+		if getattr(self._local, 'running', False):
+			# Nested call from a request that already runs in this thread.
+			# Waiting here for another request could deadlock, so run it directly 
+			return function(*args, **kwargs)
+
+		with self._lock:
+			self.requests += 1
+			pending = self._in_flight.get(key)
+			if pending is None:
+				pending = {'done': threading.Event(), 'result': None, 'exc_info': None}
+				self._in_flight[key] = pending
+				leader = True
+			else:
+				self.coalesced += 1
+				leader = False
+
+		if not leader:
+			logging.info('Request: %s . Attached to identical request in flight (coalesced requests so far: %i)' % (key[1], self.coalesced))
+			pending['done'].wait()
+			if pending['exc_info']:
+				exc_type, exc_value, exc_traceback = pending['exc_info']
+				raise exc_type, exc_value, exc_traceback
+			# Callers may modify the returned dictionaries
+			return copy.deepcopy(pending['result'])
+
+		self._local.running = True
+		try:
+			pending['result'] = function(*args, **kwargs)
+		except:
+			pending['exc_info'] = sys.exc_info()
+			raise
+		finally:
+			self._local.running = False
+			with self._lock:
+				del self._in_flight[key]
+			pending['done'].set()
+
+		return pending['result']
+
+	def stats(self):
+		'''
+		Number of requests, coalesced requests and requests currently in flight
+		'''
+		with self._lock:
+			return {
+				'requests' : self.requests,
+				'coalesced' : self.coalesced,
+				'in_flight' : len(self._in_flight),
+			}
+
+
+class Utils(object):
+	'''
+	Useful functions to help manange files
+	'''
+
+	@staticmethod
+	def directory_exists(dirname):
+		'''
+		Check if directory exists
+		'''
+		return os.path.isdir(dirname)
+
+	@staticmethod
+	def file_exists(filename):
+		'''
+		Check if filename exists
+		'''
+		return os.path.isfile(filename) 
+
+
+	@staticmethod
+	def mkdir_p(dirname):
+		'''
+		Create directory
+		Functionality similar with: mkdir -p
+		Reference: http://stackoverflow.com/questions/600268/mkdir-p-functionality-in-python 
+		'''
+		try:
+			os.makedirs(dirname)
+		except OSError as exc: # Python >2.5
+			if exc.errno == errno.EEXIST and os.path.isdir(dirname):
+				pass
+			else:
+				raise
+
+	@staticmethod
+	def load_json_filename(filename):
+		'''
+		Load a json file
+		'''
+		with open(filename) as f:
+			data = json.load(f)
+
+		return data
+
+	@staticmethod
+	def load_assembly_report(filename):
+		'''
+		Load a tab separated assembly report: accession.version, chromosome, assembly, length 
+		Returns a dictionary: ACCESSION.VERSION --> (chromosome, assembly, length)
+		'''
+		ret = {}
+		with open(filename) as f:
+			for l in f:
+				if l[0] == '#' or not l.strip():
+					continue
+				accession, chromosome, assembly, length = l.rstrip('\n').split('\t')
+				ret[accession.upper()] = (chromosome, assembly, int(length))
+
+		return ret
+
+	@staticmethod
+	def save_json_filenane(filename, data):
+		'''
+		Save a json file
+		'''
+		with Utils.atomic_write(filename) as f:
+			f.write(json.dumps(data, indent=4) + '\n')
+
+	@staticmethod
+	@contextlib.contextmanager
+	def atomic_write(filename, mode='w'):
+		'''
+		Write to a temporary file in the same directory and rename it to filename when the block exits.
+		Readers (possibly in other processes) never see a half written file.
+		If the block raises, the temporary file is removed and filename is left untouched.
+		'''
+		directory = os.path.dirname(os.path.abspath(filename))
+		fd, temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+		try:
+			with os.fdopen(fd, mode) as f:
+				yield f
+			os.chmod(temp_filename, 0644) # mkstemp creates files with 0600
+			os.rename(temp_filename, filename) # Atomic on POSIX
+		except:
+			if os.path.exists(temp_filename):
+				os.remove(temp_filename)
+			raise
+
+	_network = threading.local()
+	_network_guard_lock = threading.Lock()
+	_network_guard_users = 0 # Guarded blocks (of all threads) that are running
+	_network_guard_originals = None
+
+	@staticmethod
+	@contextlib.contextmanager
+	def network_guard(offline=True):
+		'''
+		If offline is True, any attempt of this thread to resolve a host name within this block raises MutationInfoOfflineError immediately \
+		instead of waiting for a timeout. Other threads are not affected.
+		The socket module is patched only while a guarded block is running (in any thread). 
+		Connections of C libraries (psycopg2, MySQLdb) are not guarded. 
+		'''
+		if not offline:
+			yield
+			return
+
+		Utils._install_network_guard()
+		previous = getattr(Utils._network, 'offline', False)
+		Utils._network.offline = True
+		try:
+			yield
+		finally:
+			Utils._network.offline = previous
+			Utils._uninstall_network_guard()
+
+	@staticmethod
+	def _install_network_guard():
+		'''
+		Wrap the name resolution functions of the socket module. Every python client (urllib2, httplib, requests) goes through them.
+		'''
+		with Utils._network_guard_lock:
+			Utils._network_guard_users += 1
+			if Utils._network_guard_users > 1:
+				return
+
+			def guard(f):
+				def guarded(host, *args, **kwargs):
+					if getattr(Utils._network, 'offline', False):
+						raise MutationInfoOfflineError('Offline mode: connection to %s is not allowed' % (str(host)))
+					return f(host, *args, **kwargs)
+				return guarded
+
+			Utils._network_guard_originals = (socket.getaddrinfo, socket.gethostbyname)
+			socket.getaddrinfo = guard(socket.getaddrinfo)
+			socket.gethostbyname = guard(socket.gethostbyname)
+
+	@staticmethod
+	def _uninstall_network_guard():
+		'''
+		Restore the functions of the socket module when the last guarded block exits
+		'''
+		with Utils._network_guard_lock:
+			Utils._network_guard_users -= 1
+			if Utils._network_guard_users == 0:
+				socket.getaddrinfo, socket.gethostbyname = Utils._network_guard_originals
+				Utils._network_guard_originals = None
+
+	@staticmethod
+	@contextlib.contextmanager
+	def file_lock(filename):
+		'''
+		Cross-process exclusive lock for filename.
+		The lock is taken on a sidecar <filename>.lock file with fcntl.flock
+		If fcntl is not available (windows) this does not lock.
+		'''
+		with open(filename + '.lock', 'a') as lock_file:
+			if fcntl:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				if fcntl:
+					fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+	@staticmethod
+	@contextlib.contextmanager
+	def single_flight(filename):
+		'''
+		Single-flight creation of a cache file. Usage:
+
+		with Utils.single_flight(filename) as missing:
+			if missing:
+				# create filename
+
+		If filename exists, missing is False and no lock is taken.
+		Otherwise the lock of filename is held for the whole block and missing is rechecked after the lock is acquired.
+		This way N concurrent processes that need the same file cause exactly one fetch, while the others wait for it.
+		'''
+		if Utils.file_exists(filename):
+			yield False
+			return
+
+		with Utils.file_lock(filename):
+			yield not Utils.file_exists(filename)
+
+	@staticmethod
+	def download(url, filename=None, md5=None, segments=None):
+		'''
+		http://www.pypedia.com/index.php/download
+		The file is downloaded in a temporary file which is renamed to filename when the download is complete. 
+		Interrupted downloads are resumed and large files are downloaded in parallel segments if the server supports it (see :py:class:`Downloader`).
+		If md5 is not None, the checksum of the downloaded file is verified.
+		'''
+		if not filename:
+			file_name = url.split('/')[-1]
+		else:
+			file_name = filename
+
+		Downloader(url, file_name, md5=md5, segments=segments).run()
+
+	@staticmethod
+	def remote_md5(url):
+		'''
+		UCSC publishes an md5sum.txt file next to the downloadable files. 
+		Returns the md5 checksum of url from it or None if it is not available.
+		'''
+		directory, basename = url.rsplit('/', 1)
+		try:
+			content = urllib2.urlopen(directory + '/md5sum.txt').read()
+		except (urllib2.URLError, socket.error) as e:
+			logging.warning('Could not get md5 checksum of %s : %s' % (url, str(e)))
+			return None
+
+		for line in content.split('\n'):
+			fields = line.split()
+			if len(fields) == 2 and fields[1].lstrip('*') == basename:
+				return fields[0]
+
+		return None
+
+	@staticmethod
+	def conditional_download(url, filename):
+		'''
+		Download url to filename only if it has changed since the last download.
+		The ETag and Last-Modified validators of the server are stored in <filename>.validators.json 
+		and they are sent back as If-None-Match and If-Modified-Since.
+
+		Returns True if filename was (re)downloaded, False if the server replied 304 Not Modified.
+		'''
+
+		validators_filename = filename + '.validators.json'
+		validators = {}
+		if Utils.file_exists(filename) and Utils.file_exists(validators_filename):
+			validators = Utils.load_json_filename(validators_filename)
+
+		request = urllib2.Request(url)
+		if 'etag' in validators:
+			request.add_header('If-None-Match', validators['etag'])
+		if 'last_modified' in validators:
+			request.add_header('If-Modified-Since', validators['last_modified'])
+
+		try:
+			u = urllib2.urlopen(request)
+		except urllib2.HTTPError as e:
+			if e.code == 304:
+				logging.info('%s has not been modified' % (url))
+				return False
+			raise
+
+		meta = u.info()
+		with Utils.atomic_write(filename, 'wb') as f:
+			Utils._download_stream(u, f, url)
+
+		validators = {}
+		if meta.getheader('ETag'):
+			validators['etag'] = meta.getheader('ETag')
+		if meta.getheader('Last-Modified'):
+			validators['last_modified'] = meta.getheader('Last-Modified')
+		Utils.save_json_filenane(validators_filename, validators)
+
+		return True
+
+	@staticmethod
+	def _download_stream(u, f, url):
+		'''
+		Copy an opened url to file object f
+		'''
+		content_length = u.info().getheader('Content-Length')
+		content_length = int(content_length) if content_length else None
+		progress = DownloadProgress(url, content_length)
+		size = 0
+		for buffer in iter(lambda: u.read(Downloader.block_size), ''):
+			f.write(buffer)
+			size += len(buffer)
+			progress.update(len(buffer))
+		progress.end()
+
+		if content_length is not None and size < content_length:
+			raise MutationInfoException('Download: %s . The connection closed at byte %i of %i' % (url, size, content_length))
+
+	@staticmethod
+	def strip_fasta_file(fasta_filename, sequence_filename):
+		'''
+		Same as :py:func:`MutationInfo.strip_fasta` but from file to file, one line at a time
+		'''
+		with open(fasta_filename, 'rb') as fasta_f, Utils.atomic_write(sequence_filename, 'wb') as sequence_f:
+			for line in fasta_f:
+				if not '>' in line:
+					sequence_f.write(line.rstrip('\r\n'))
+
+	@staticmethod
+	def read_file_range(filename, start, end):
+		'''
+		Returns the same as open(filename).read()[start:end] . The file is mmap'd so only [start, end) is read and copied
+		'''
+		with open(filename, 'rb') as f:
+			if not os.fstat(f.fileno()).st_size:
+				return ''
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				return data[start:end]
+			finally:
+				data.close()
+
+	@staticmethod
+	def open_genome(filename):
+		'''
+		Open a reference genome with :py:class:`TwoBitReader` (.2bit files) or :py:class:`FastaReader` (anything else)
+		'''
+		if filename.endswith('.2bit'):
+			return TwoBitReader(filename)
+		return FastaReader(filename)
+
+	@staticmethod
+	def tar_gz_to_fasta(tar_gz_filename, fasta_filename, contigs=None):
+		'''
+		Merge all .fa files of a tar.gz archive (like UCSC's chromFa.tar.gz) into fasta_filename and create its .fai index.
+		The archive is read once as a stream. Nothing else is written on disk.
+		If contigs is not None, only the contigs in it are kept.
+		'''
+
+		with Utils.fasta_writer(fasta_filename) as write, tarfile.open(tar_gz_filename, 'r|gz') as tar:
+			for member in tar:
+				if not member.isfile() or not member.name.endswith('.fa'):
+					continue
+
+				contig = os.path.basename(member.name)[:-3]
+				if contigs is not None and not contig in contigs:
+					logging.info('Skipping: %s' % (member.name))
+					continue
+
+				logging.info('Extracting: %s' % (member.name))
+				for line in tar.extractfile(member):
+					if not line.endswith('\n'):
+						line += '\n'
+					write(line)
+
+	@staticmethod
+	@contextlib.contextmanager
+	def fasta_writer(fasta_filename):
+		'''
+		Write a FASTA file one line at a time together with its .fai index. Usage:
+
+		with Utils.fasta_writer(fasta_filename) as write:
+			write(line)
+
+		If fasta_filename ends with .gz it is BGZF compressed and the .gzi index is written too.
+		'''
+
+		with Utils.atomic_write(fasta_filename, 'wb') as fasta_f, Utils.atomic_write(fasta_filename + '.fai') as index_f:
+			indexer = FastaIndexer(index_f, fasta_filename)
+			output = BgzfWriter(fasta_f) if fasta_filename.endswith('.gz') else fasta_f
+
+			def write(line):
+				output.write(line)
+				indexer.add_line(line)
+
+			yield write
+
+			indexer.close()
+			if output is not fasta_f:
+				output.close()
+				with Utils.atomic_write(fasta_filename + '.gzi', 'wb') as gzi_f:
+					output.write_index(gzi_f)
+
+	@staticmethod
+	def bgzip(fasta_filename, bgzf_filename):
+		'''
+		Compress a FASTA file with BGZF and create the .fai and .gzi indexes (same as bgzip -i and samtools faidx)
+		'''
+
+		with open(fasta_filename, 'rb') as f, Utils.fasta_writer(bgzf_filename) as write:
+			for line in f:
+				write(line)
+
+	@staticmethod
+	def get_application_dir(application_name):
+		'''
+		Create a cross platform local directory for this app
+		Reference: https://pypi.python.org/pypi/appdirs/1.4.0 
+		'''
+		directory = user_data_dir(application_name, '')
+		if not Utils.directory_exists(directory):
+			Utils.mkdir_p(directory)
+
+		return directory
+
+
+class Downloader(object):
+	'''
+	The download engine of :py:func:`Utils.download`. 
+
+	The file is downloaded in <filename>.part and renamed to filename when it is complete. 
+	If the server supports Range requests, large files (at least 2 * min_segment_size) are downloaded in parallel segments and an interrupted download \
+	resumes from where it stopped. The progress of the segments is kept in <filename>.part.json 
+	'''
+
+	block_size = 1024 * 1024
+	segments = 4 # Maximum number of parallel connections
+	min_segment_size = 32 * 1024 * 1024 # Smaller files are downloaded with a single connection
+	save_state_interval = 5.0 # Seconds between saves of the segments state
+
+	def __init__(self, url, filename, md5=None, segments=None):
+		self.url = url
+		self.filename = filename
+		self.md5 = md5
+		if segments is not None:
+			self.segments = segments
+
+		self.part_filename = filename + '.part'
+		self.state_filename = self.part_filename + '.json'
+		self.state = None
+		self.lock = threading.Lock()
+		self.progress = None
+		self.last_save = 0
+
+	def run(self):
+		with Utils.file_lock(self.part_filename):
+			if self._load_state():
+				logging.info('Resuming download of: %s' % (self.url))
+				try:
+					self._download_segments(self.state['segments'])
+				except MutationInfoException as e:
+					logging.warning('Could not resume download: %s . Restarting it' % (str(e)))
+					self._start()
+			else:
+				self._start()
+
+			self._verify()
+			os.rename(self.part_filename, self.filename)
+			if Utils.file_exists(self.state_filename):
+				os.remove(self.state_filename)
+
+	@staticmethod
+	def content_range_total(u):
+		'''
+		The total size of the file from the Content-Range header of a 206 Partial Content response. For example: bytes 0-99/1000
+		'''
+		content_range = u.info().getheader('Content-Range')
+		if u.getcode() != 206 or not content_range:
+			return None
+
+		total = content_range.split('/')[-1].strip()
+		return int(total) if total.isdigit() else None
+
+	def _load_state(self):
+		if not (Utils.file_exists(self.part_filename) and Utils.file_exists(self.state_filename)):
+			return False
+
+		state = Utils.load_json_filename(self.state_filename)
+		if state.get('url') != self.url or os.path.getsize(self.part_filename) != state.get('total'):
+			return False
+
+		self.state = state
+		return True
+
+	def _save_state(self, force=False):
+		now = time.time()
+		if force or now - self.last_save >= self.save_state_interval:
+			self.last_save = now
+			Utils.save_json_filenane(self.state_filename, self.state)
+
+	def _start(self):
+		'''
+		Start a new download. The first request asks for the whole file with a Range header. 
+		A 206 reply means that the server supports ranges. 
+		'''
+		u = urllib2.urlopen(urllib2.Request(self.url, headers={'Range': 'bytes=0-'}))
+		total = Downloader.content_range_total(u)
+
+		n = 1 if total is None else min(self.segments, total // self.min_segment_size)
+		if n <= 1:
+			# No Range support or a small file. Download with a single connection
+			content_length = u.info().getheader('Content-Length')
+			content_length = int(content_length) if content_length else None
+			self.progress = DownloadProgress(self.url, content_length)
+			with open(self.part_filename, 'wb') as f:
+				size = self.copy(u, f)
+			self.progress.end()
+
+			if content_length is not None and size < content_length:
+				raise MutationInfoException('Download: %s . The connection closed at byte %i of %i' % (self.url, size, content_length))
+			return
+
+		size = -(-total // n)
+		self.state = {
+			'url': self.url,
+			'total': total,
+			'segments': [[start, min(start + size, total), start] for start in range(0, total, size)], # start, end, position
+		}
+
+		with open(self.part_filename, 'wb') as f:
+			f.truncate(total)
+		self._save_state(force=True)
+
+		self._download_segments(self.state['segments'], u)
+
+	def _download_segments(self, segments, first_response=None):
+		self.progress = DownloadProgress(self.url, self.state['total'], sum(position - start for start, end, position in segments))
+		logging.info('Downloading: %s in %i segment(s)' % (self.url, len([x for x in segments if x[2] < x[1]])))
+
+		errors = []
+		def worker(segment, u):
+			try:
+				self._download_segment(segment, u)
+			except Exception as e:
+				errors.append(e)
+
+		threads = []
+		for index, segment in enumerate(segments):
+			u = first_response if index == 0 else None
+			if segment[2] >= segment[1]:
+				if u:
+					u.close()
+				continue
+			thread = threading.Thread(target=worker, args=(segment, u))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+		for thread in threads:
+			thread.join()
+
+		with self.lock:
+			self._save_state(force=True)
+		self.progress.end()
+
+		if errors:
+			raise errors[0]
+
+	def _download_segment(self, segment, u=None):
+		start, end, position = segment
+
+		if u is None:
+			u = urllib2.urlopen(urllib2.Request(self.url, headers={'Range': 'bytes=%i-%i' % (position, end - 1)}))
+			if Downloader.content_range_total(u) != self.state['total']:
+				u.close()
+				raise MutationInfoException('Download: %s . The server did not return the requested range (or the file has changed)' % (self.url))
+
+		with open(self.part_filename, 'r+b', 0) as f: # Unbuffered. The saved state never claims bytes that are not written
+			f.seek(position)
+			position = self.copy(u, f, segment)
+		u.close()
+
+		if position < end:
+			raise MutationInfoException('Download: %s . The connection closed at byte %i. Call again to resume it' % (self.url, position))
+
+	def copy(self, u, f, segment=None):
+		'''
+		Copy the opened url u to file object f. If segment is not None, stop at its end and keep its position updated
+		'''
+
+		position = segment[2] if segment else 0
+		while True:
+			size = self.block_size if segment is None else min(self.block_size, segment[1] - position)
+			if size <= 0:
+				break
+			buffer = u.read(size)
+			if not buffer:
+				break
+
+			f.write(buffer)
+			position += len(buffer)
+			with self.lock:
+				if segment:
+					segment[2] = position
+				self.progress.update(len(buffer))
+				if segment:
+					self._save_state()
+
+		return position
+
+	def _verify(self):
+		if not self.md5:
+			return
+
+		md5 = hashlib.md5()
+		with open(self.part_filename, 'rb') as f:
+			for buffer in iter(lambda: f.read(self.block_size), ''):
+				md5.update(buffer)
+
+		if md5.hexdigest() != self.md5.lower():
+			os.remove(self.part_filename)
+			if Utils.file_exists(self.state_filename):
+				os.remove(self.state_filename)
+			raise MutationInfoException('Download: %s . md5 checksum mismatch. Expected: %s Found: %s' % (self.url, self.md5, md5.hexdigest()))
+
+
+class DownloadProgress(object):
+	'''
+	The progress bar of a download. Updates are printed at most once every progress_interval seconds. 
+	If total (the size of the file) is not known, only the url is printed. 
+	'''
+
+	progress_interval = 1.0 # Seconds between progress bar updates
+
+	def __init__(self, url, total, done=0):
+		self.done = done
+		self.last_progress = 0
+		print("Downloading: {0} Bytes: {1}".format(url, total))
+		if total:
+			self.progress_bar = ProgressBar(total, 'Progress')
+		else:
+			self.progress_bar = None
+			logging.warning('Could not determine file size')
+
+	def update(self, size):
+		'''
+		size more bytes have been downloaded
+		'''
+		self.done += size
+		now = time.time()
+		if self.progress_bar and now - self.last_progress >= self.progress_interval:
+			self.last_progress = now
+			self.progress_bar.animate(self.done)
+
+	def end(self):
+		if self.progress_bar:
+			self.progress_bar.update_iteration(self.done) # animate prints the previous iteration
+			self.progress_bar.animate(self.done)
+		print # We need a new line here
 
 
 class ProgressBar:
@@ -2544,13 +6134,14 @@ class ProgressBar:
 		self.fill_char = '*'
 		self.width = 40
 		self.__update_amount(0)
-		if have_ipython:
+		if 'IPython' in sys.modules:
 			self.animate = self.animate_ipython
 		else:
 			self.animate = self.animate_noipython
 
 	def animate_ipython(self, iter):
 		try:
+			from IPython.core.display import clear_output
 			clear_output()
 		except Exception:
 			# terminal IPython has no clear_output
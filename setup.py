@@ -80,11 +80,11 @@ setup(name='MutationInfo',
       ],
       install_requires=[
             'biopython',
+            'numpy',
             'appdirs',
             'hgvs>=0.4,<0.5',
             'feedparser',
             'cruzdb',
-            'pygr',
             'sqlalchemy',
             'beautifulsoup4',
             'pyhgvs>=0.0.1',
@@ -97,6 +97,7 @@ setup(name='MutationInfo',
             'https://github.com/kantale/pyVEP/tarball/master#egg=pyVEP-2.0.0',
       ],
       packages=['MutationInfo', 'biopython_mapper'],
+      package_data={'MutationInfo': ['data/*.tsv']},
 )
 
 # Check if psycopg2 is 'importable'
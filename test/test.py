@@ -4,7 +4,7 @@ import unittest
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
-from MutationInfo import MutationInfo
+from MutationInfo import MutationInfo, MutationInfoException, MutationInfoOfflineError, Utils, RequestCoalescer, RefGeneMapper, RefGeneIndex, LocalAligner, LocalDbSNP, SQLiteUTADataProvider, LiftOver, FastaReader, TwoBitReader, BgzfReader, Downloader
 
 mi = MutationInfo()
 
@@ -36,6 +36,146 @@ class TestMutationInfo(unittest.TestCase):
 
     maxDiff = None
 
+    def _temporary_directory(self):
+        '''
+        A temporary directory that is removed after the test
+        '''
+        import shutil
+        import tempfile
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        return directory
+
+    def _write_fasta(self, directory, chromosomes, width, description=''):
+        '''
+        Write chromosomes (name --> sequence) in <directory>/genome.fa with width bases per line. Returns the filename
+        '''
+        import os
+
+        fasta_filename = os.path.join(directory, 'genome.fa')
+        with open(fasta_filename, 'w') as f:
+            for chrom in sorted(chromosomes):
+                f.write('>%s%s\n' % (chrom, description))
+                for i in range(0, len(chromosomes[chrom]), width):
+                    f.write(chromosomes[chrom][i:i+width] + '\n')
+        return fasta_filename
+
+    def test_IMPORT_TIME(self):
+        print '--------IMPORT TIME-----------------'
+        import os
+        import sys
+        import json
+        import subprocess
+
+        # numpy is imported by the lookup tables of the module. Everything heavy is imported on first use
+        script = '''
+import sys, time, json
+import numpy
+start = time.time()
+import MutationInfo
+print json.dumps([time.time() - start, sorted(set(x.split('.')[0] for x in sys.modules) & set(sys.argv[1:]))])
+'''
+        heavy = ['hgvs', 'psycopg2', 'pyhgvs', 'cruzdb', 'sqlalchemy', 'MySQLdb', 'pyVEP', 'Bio', 'bs4', 'feedparser', 'requests', 'IPython']
+        package_directory = os.path.dirname(os.path.dirname(os.path.abspath(sys.modules['MutationInfo'].__file__)))
+        results = [json.loads(subprocess.check_output([sys.executable, '-c', script] + heavy, cwd=package_directory)) for _ in range(3)]
+        self.assertEqual(results[0][1], [])
+        self.assertLess(min(x[0] for x in results), 0.1)
+
+    def test_LAZY_BACKENDS(self):
+        print '--------LAZY BACKENDS-----------------'
+        import time
+        import threading
+
+        lazy_mi = MutationInfo(offline=True)
+        for name in ['biocommons_hdp', 'lovd_transcript_dict', 'refgene_mapper']:
+            self.assertNotIn(name, vars(lazy_mi))
+        self.assertEqual(lazy_mi._assemblies, {})
+
+        # Concurrent first uses load the backend once
+        calls = []
+        lovd_setup = lazy_mi._lovd_setup
+        def slow_lovd_setup():
+            calls.append(1)
+            time.sleep(0.2)
+            lovd_setup()
+        lazy_mi._lovd_setup = slow_lovd_setup
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(lazy_mi.lovd_transcript_dict)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(x is results[0] for x in results))
+
+        # The refGene mapper does not load the reference genome
+        lazy_mi.refgene_mapper
+        self.assertNotIn('counsyl_hgvs', lazy_mi._assemblies.get('hg19', {}))
+
+        # Loading one assembly does not block the other assemblies
+        loading = threading.Event()
+        release = threading.Event()
+        loaded = []
+        load_liftover = lazy_mi._load_assembly_liftover
+        def slow_load_liftover():
+            if lazy_mi.genome == 'hg38':
+                loading.set()
+                release.wait(5)
+            load_liftover()
+        lazy_mi._load_assembly_liftover = slow_load_liftover
+        def use_hg38():
+            with lazy_mi.using_genome('hg38'):
+                loaded.append(lazy_mi.liftover)
+        thread = threading.Thread(target=use_hg38)
+        thread.start()
+        loading.wait()
+        self.assertIsNone(lazy_mi.liftover) # hg19
+        self.assertEqual(loaded, []) # hg38 is still loading
+        release.set()
+        thread.join()
+        self.assertEqual(loaded, [None])
+
+    def test_LAZY_IMPORT(self):
+        print '--------LAZY IMPORT-----------------'
+        import types
+        from MutationInfo import _LazyImport
+
+        lazy_module = _LazyImport(loader=lambda: types.ModuleType('lazy_module'))
+        lazy_module.email = 'first@example.com'
+        self.assertEqual(lazy_module.email, 'first@example.com') # Not imported yet
+        self.assertEqual(lazy_module.__name__, 'lazy_module')
+        self.assertEqual(lazy_module.email, 'first@example.com') # Set on the module
+        lazy_module.email = 'second@example.com'
+        self.assertEqual(lazy_module.email, 'second@example.com')
+
+    def test_MULTI_ASSEMBLY(self):
+        print '--------MULTI ASSEMBLY-----------------'
+        import threading
+
+        self.assertEqual(mi.genome, 'hg19')
+        refgene_mapper = mi.refgene_mapper
+        with mi.using_genome('hg38'):
+            self.assertEqual(mi.genome, 'hg38')
+            self.assertEqual(mi.genome_GrCh, 'GRCh38')
+            self.assertEqual(mi.liftover, None) # Loaded for hg38
+            self.assertIn('liftover', mi._assemblies['hg38'])
+            self.assertIs(mi.refgene_mapper, refgene_mapper) # Shared
+
+            # Other threads are not affected
+            genomes = []
+            thread = threading.Thread(target=lambda: genomes.append(mi.genome))
+            thread.start()
+            thread.join()
+            self.assertEqual(genomes, ['hg19'])
+
+        self.assertEqual(mi.genome, 'hg19')
+        self.assertNotIn('counsyl_hgvs', mi._assemblies['hg38'])
+
+        with self.assertRaises(KeyError):
+            mi.get_info('NM_000367.2:c.-178C>T', genome='hg00')
+
     def test_FYZZY_HGVS_CORRECTOR(self):
         print '------FUZZY HGVS CORRECTOR---------'
         ret = MutationInfo.fuzzy_hgvs_corrector('1048G->C')
@@ -72,6 +212,676 @@ class TestMutationInfo(unittest.TestCase):
         self.assertEqual(ret, 'NT_005120.15:c.1160_1161delinsGT')
 
 
+    def test_CACHE_WRITES(self):
+        print '--------CACHE WRITES-----------------'
+        import os
+        import threading
+
+        directory = self._temporary_directory()
+        filename = os.path.join(directory, 'entry.txt')
+        fetches = []
+
+        def worker():
+            with Utils.single_flight(filename) as missing:
+                if missing:
+                    fetches.append(1)
+                    with Utils.atomic_write(filename) as f:
+                        f.write('data')
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(open(filename).read(), 'data')
+
+        # A failed write leaves nothing behind
+        try:
+            with Utils.atomic_write(os.path.join(directory, 'failed.txt')) as f:
+                f.write('half')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(os.path.exists(os.path.join(directory, 'failed.txt')))
+        self.assertEqual([x for x in os.listdir(directory) if x.endswith('.tmp')], [])
+
+    def test_COALESCING(self):
+        print '--------REQUEST COALESCING-----------------'
+        import time
+        import threading
+
+        coalescer = RequestCoalescer()
+        runs = []
+
+        def pipeline(variant):
+            runs.append(variant)
+            time.sleep(0.5)
+            return {'chrom': '3'}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalescer.run(('hg19', 'rs53576', ()), pipeline, 'rs53576'))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(runs, ['rs53576'])
+        self.assertEqual(results, [{'chrom': '3'}] * 5)
+        self.assertEqual(coalescer.stats(), {'requests': 5, 'coalesced': 4, 'in_flight': 0})
+
+    def test_CANONICAL_KEY(self):
+        print '--------CANONICAL KEY-----------------'
+        key = mi.canonical_key('NM_006446.4:c.1198T>G')
+        self.assertEqual(key, 'NM_006446.4:c.1198T>G')
+        self.assertEqual(mi.canonical_key('nm_006446.4:c.1198T>G'), key)
+        self.assertEqual(mi.canonical_key(u' NM_006446.4:c.1198T>G \n'), key)
+        self.assertIsNone(mi.canonical_key(u'NM_006446.4:c.1198T>G\u00e9')) # Non ascii variants are not coalesced or cached
+
+        self.assertEqual(mi.canonical_key('RS53576'), 'rs53576')
+
+        self.assertEqual(mi.canonical_key('1048G->C', transcript='NM_001042351.1', ref_type='c'), 'NM_001042351.1:c.1048G>C')
+        self.assertEqual(mi.canonical_key('NT_005120.15:c.-1126(C>T)'), mi.canonical_key('NT_005120.15:c.-1126C>T'))
+        self.assertIsNone(mi.canonical_key('1387C->T/A', transcript='NM_001042351.1', ref_type='c'))
+
+    def test_LOCAL_ALIGNER(self):
+        print '--------LOCAL ALIGNER-----------------'
+        import os
+        import random
+
+        random.seed(1)
+        directory = self._temporary_directory()
+        chromosomes = {}
+        for chrom in ['chr1', 'chr2']:
+            chromosomes[chrom] = ''.join(random.choice('ACGT') for _ in range(100000))
+        # GT-AG splice sites of the intron 10300-20000. The junction 60300 / 70000 does not have any
+        sequence = chromosomes['chr2']
+        sequence = sequence[:10300] + 'GT' + sequence[10302:19998] + 'AG' + sequence[20000:]
+        chromosomes['chr2'] = sequence[:60298] + 'ACAA' + sequence[60302:69998] + 'TCG' + sequence[70001:]
+        fasta_filename = self._write_fasta(directory, chromosomes, 50)
+
+        aligner = LocalAligner(fasta_filename, os.path.join(directory, 'index'), processes=2)
+
+        # A "transcript" with three exons on chr2
+        exons = [(10000, 10300), (20000, 20150), (50000, 50400)]
+        transcript = ''.join(chromosomes['chr2'][start:end] for start, end in exons)
+
+        self.assertEqual(aligner.align(transcript, 10), ('chr2', 10010, '+'))
+        self.assertEqual(aligner.align(transcript, 350), ('chr2', 20050, '+'))
+        self.assertEqual(aligner.align(transcript, 700), ('chr2', 50250, '+'))
+
+        reverse = MutationInfo.reverse_inverse(transcript)
+        self.assertEqual(aligner.align(reverse, len(transcript) - 350 + 1), ('chr2', 20050, '-'))
+
+        # Exon boundaries are found by extending the aligned segments
+        self.assertEqual(aligner.align(transcript, 1), ('chr2', 10001, '+'))
+        self.assertEqual(aligner.align(transcript, 290), ('chr2', 10290, '+'))
+        self.assertEqual(aligner.align(transcript, 300), ('chr2', 10300, '+'))
+        self.assertEqual(aligner.align(transcript, 301), ('chr2', 20001, '+'))
+        self.assertEqual(aligner.align(reverse, len(transcript) - 300 + 1), ('chr2', 10300, '-'))
+        self.assertEqual(aligner.align(reverse, len(transcript) - 301 + 1), ('chr2', 20001, '-'))
+
+        # The last base of the first exon (C) matches the intron before the second exon. Without splice sites the junction is ambiguous
+        exons = [(60000, 60300), (70000, 70150)]
+        transcript = ''.join(chromosomes['chr2'][start:end] for start, end in exons)
+        self.assertEqual(aligner.align(transcript, 299), ('chr2', 60299, '+'))
+        self.assertEqual(aligner.align(transcript, 300), (None, None, None))
+        self.assertEqual(aligner.align(transcript, 301), ('chr2', 70001, '+'))
+
+        # A short exon without indexed k-mers cannot be located. It is not extrapolated from its neighbours
+        exons = [(10000, 10300), (30000, 30040), (50000, 50400)]
+        transcript = ''.join(chromosomes['chr2'][start:end] for start, end in exons)
+        self.assertEqual(aligner.align(transcript, 336), (None, None, None)) # 21 bases before the first k-mer of the next exon
+        self.assertEqual(aligner.align(transcript, 700), ('chr2', 50360, '+'))
+
+    def test_FASTA_READER(self):
+        print '--------FASTA READER-----------------'
+        import os
+        import random
+
+        random.seed(2)
+        chromosomes = {'chr1': ''.join(random.choice('ACGTacgtN') for _ in range(1003)), 'chr2': 'ACGTA'}
+        fasta_filename = self._write_fasta(self._temporary_directory(), chromosomes, 60, description=' description')
+
+        reader = FastaReader(fasta_filename)
+        self.assertTrue(os.path.exists(fasta_filename + '.fai'))
+        self.assertEqual(reader.keys(), ['chr1', 'chr2'])
+        self.assertEqual(len(reader['chr1']), 1003)
+        for start, end in [(0, 1), (55, 65), (59, 60), (60, 120), (0, 1003), (990, 2000)]:
+            self.assertEqual(reader['chr1'][start:end], chromosomes['chr1'][start:end])
+        self.assertEqual(reader['chr1'][119], chromosomes['chr1'][119])
+        self.assertEqual(str(reader['chr2']), 'ACGTA')
+        self.assertEqual(-reader['chr2'][1:4], 'ACG')
+
+        # The existing index is reused
+        self.assertEqual(FastaReader(fasta_filename)['chr1'][55:65], chromosomes['chr1'][55:65])
+        reader.close()
+
+        # Empty file
+        empty_filename = os.path.join(os.path.dirname(fasta_filename), 'empty.fa')
+        open(empty_filename, 'w').close()
+        reader = FastaReader(empty_filename)
+        self.assertEqual(reader.keys(), [])
+        reader.close()
+
+        # Like samtools faidx: empty lines are allowed only at the end of a record and only the last line can be shorter
+        for content in ['>chr1\nACGT\n\nACGT\n', '>chr1\nACGT\nACGTA\n', '>chr1\nACGT\nAC\nACGT\n']:
+            bad_filename = os.path.join(os.path.dirname(fasta_filename), 'bad.fa')
+            with open(bad_filename, 'w') as f:
+                f.write(content)
+            self.assertRaises(MutationInfoException, FastaReader.build_index, bad_filename, bad_filename + '.fai')
+
+        with open(bad_filename, 'w') as f:
+            f.write('>chr1\nACGT\nAC\n\n>chr2\nACG\n\n')
+        FastaReader.build_index(bad_filename, bad_filename + '.fai')
+        with open(bad_filename + '.fai') as f:
+            self.assertEqual(f.read(), 'chr1\t6\t6\t4\t5\nchr2\t3\t21\t3\t4\n')
+
+    def test_TWOBIT(self):
+        print '--------TWOBIT-----------------'
+        import os
+        import random
+
+        random.seed(4)
+        directory = self._temporary_directory()
+        chromosomes = {}
+        for chrom in ['chr1', 'chr2', 'chrM']:
+            # Upper and lower case (soft masked) regions and N regions
+            sequence = ''.join(random.choice(['ACGTTGCAAC', 'acgttgcaac', 'G', 'NNNN', 'nn']) for _ in range(300))
+            chromosomes[chrom] = sequence[:random.randint(len(sequence)-4, len(sequence))]
+        fasta_filename = self._write_fasta(directory, chromosomes, 60)
+
+        # A: 2, C: 1, G: 3, T: 0
+        self.assertEqual(TwoBitReader.encode('ACGT')[-1], chr(0b10011100))
+
+        twobit_filename = os.path.join(directory, 'genome.2bit')
+        TwoBitReader.convert(fasta_filename, twobit_filename)
+        reader = Utils.open_genome(twobit_filename)
+        self.assertTrue(isinstance(reader, TwoBitReader))
+        self.assertEqual(reader.keys(), ['chr1', 'chr2', 'chrM'])
+        for chrom in chromosomes:
+            self.assertEqual(len(reader[chrom]), len(chromosomes[chrom]))
+            self.assertEqual(str(reader[chrom]), chromosomes[chrom])
+            for _ in range(100):
+                start = random.randint(0, len(chromosomes[chrom]))
+                end = start + random.randint(0, 50)
+                self.assertEqual(reader[chrom][start:end], chromosomes[chrom][start:end])
+        self.assertEqual(reader['chr1'][5], chromosomes['chr1'][5])
+        self.assertEqual(-reader['chr1'][10:20], -FastaReader(fasta_filename)['chr1'][10:20])
+
+    def test_VERIFY_REFERENCE(self):
+        print '--------VERIFY REFERENCE-----------------'
+        import os
+        import random
+
+        self.assertEqual(mi.verify_references(['6', 'chr6', '6', '6', '6', 'Un'], [18155397, 18155397, 18155397, 18155397, 0, 1], ['G', 'C', 'T', '', 'G', 'A']),
+            ['match', 'reverse', 'mismatch', None, None, None])
+
+        # Same results from the FASTA and the .2bit reader
+        random.seed(5)
+        directory = self._temporary_directory()
+        sequence = ''.join(random.choice(['ACGTTGCAAC', 'acgttgcaac', 'NNNN']) for _ in range(300))
+        fasta_filename = self._write_fasta(directory, {'chr1': sequence}, 60)
+        twobit_filename = os.path.join(directory, 'genome.2bit')
+        TwoBitReader.convert(fasta_filename, twobit_filename)
+
+        starts = [random.randint(0, len(sequence) - 10) for _ in range(1000)]
+        refs = [sequence[start:start + random.randint(1, 10)].upper() for start in starts]
+        expected = ['match'] * len(refs)
+        for i in range(0, len(refs), 3):
+            if not 'N' in refs[i] and refs[i] != MutationInfo.reverse_inverse(refs[i]):
+                refs[i] = MutationInfo.reverse_inverse(refs[i])
+                expected[i] = 'reverse'
+        starts.append(len(sequence) - 2)
+        refs.append('AAA') # Outside the chromosome
+        expected.append(None)
+
+        for reader in [FastaReader(fasta_filename), TwoBitReader(twobit_filename)]:
+            self.assertEqual(MutationInfo._compare_references(reader['chr1'], starts, refs), expected)
+            self.assertEqual(MutationInfo._compare_references(reader['chr1'], [0], ['A' if sequence[0].upper() != 'A' else 'C']), ['mismatch'])
+
+    def test_BGZF(self):
+        print '--------BGZF-----------------'
+        import os
+        import gzip
+        import random
+
+        random.seed(6)
+        directory = self._temporary_directory()
+        chromosomes = {}
+        for chrom in ['chr1', 'chr2']:
+            chromosomes[chrom] = ''.join(random.choice('ACGTacgtN') for _ in range(200000))
+        fasta_filename = self._write_fasta(directory, chromosomes, 50)
+
+        bgzf_filename = fasta_filename + '.gz'
+        Utils.bgzip(fasta_filename, bgzf_filename)
+        self.assertTrue(os.path.exists(bgzf_filename + '.fai'))
+        self.assertTrue(os.path.exists(bgzf_filename + '.gzi'))
+
+        # A valid gzip file
+        with gzip.open(bgzf_filename) as f, open(fasta_filename) as fasta_f:
+            self.assertEqual(f.read(), fasta_f.read())
+        FastaReader(fasta_filename)
+        with open(fasta_filename + '.fai') as f, open(bgzf_filename + '.fai') as bgzf_f:
+            self.assertEqual(f.read(), bgzf_f.read())
+
+        reader = Utils.open_genome(bgzf_filename)
+        self.assertTrue(isinstance(reader.data, BgzfReader))
+        for _ in range(200):
+            chrom = random.choice(['chr1', 'chr2'])
+            start = random.randint(0, 200000)
+            end = start + random.randint(0, 70000) # Can span more than one block
+            self.assertEqual(reader[chrom][start:end], chromosomes[chrom][start:end])
+        self.assertTrue(len(reader.data.cache) <= BgzfReader.cache_size)
+
+        positions = [random.randint(0, 199999) for _ in range(1000)]
+        self.assertEqual(reader['chr2'].bases_at(positions).tostring(), ''.join(chromosomes['chr2'][x] for x in positions).upper())
+
+        # The index can be rebuilt from the block headers
+        with open(bgzf_filename + '.gzi', 'rb') as f:
+            gzi = f.read()
+        os.remove(bgzf_filename + '.gzi')
+        BgzfReader(bgzf_filename)
+        with open(bgzf_filename + '.gzi', 'rb') as f:
+            self.assertEqual(f.read(), gzi)
+
+    def test_GENOME_INSTALL(self):
+        print '--------GENOME INSTALL-----------------'
+        import os
+        import tarfile
+        from StringIO import StringIO
+
+        directory = self._temporary_directory()
+        tar_gz_filename = os.path.join(directory, 'chromFa.tar.gz')
+        chromosomes = {'chr1': 'ACGT' * 30 + 'AC', 'chr2': 'GGCCA' * 10, 'chrUn_gl000220': 'NNNNACGT'}
+        with tarfile.open(tar_gz_filename, 'w:gz') as tar:
+            for chrom in ['chr1', 'chr2', 'chrUn_gl000220']:
+                content = '>%s\n' % chrom + '\n'.join(chromosomes[chrom][i:i+50] for i in range(0, len(chromosomes[chrom]), 50)) # No final new line
+                info = tarfile.TarInfo(chrom + '.fa')
+                info.size = len(content)
+                tar.addfile(info, StringIO(content))
+
+        fasta_filename = os.path.join(directory, 'hg19.fa')
+        Utils.tar_gz_to_fasta(tar_gz_filename, fasta_filename, contigs=['chr1', 'chr2'])
+        self.assertEqual(sorted(os.listdir(directory)), ['chromFa.tar.gz', 'hg19.fa', 'hg19.fa.fai'])
+
+        reader = FastaReader(fasta_filename)
+        self.assertEqual(reader.keys(), ['chr1', 'chr2'])
+        self.assertEqual(reader['chr1'][40:60], chromosomes['chr1'][40:60])
+        self.assertEqual(str(reader['chr2']), chromosomes['chr2'])
+
+        # The streamed index is the same as the one built from the FASTA file
+        with open(fasta_filename + '.fai') as f:
+            index = f.read()
+        FastaReader.build_index(fasta_filename, fasta_filename + '.fai')
+        with open(fasta_filename + '.fai') as f:
+            self.assertEqual(f.read(), index)
+
+    def test_DOWNLOADER(self):
+        print '--------DOWNLOADER-----------------'
+        import os
+        import json
+        import random
+        import hashlib
+        import threading
+        import BaseHTTPServer
+
+        random.seed(3)
+        content = ''.join(random.choice('ACGT') for _ in range(100000))
+        requests_log = []
+        truncated = []
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_log.append(self.headers.getheader('Range'))
+                start, end = 0, len(content)
+                if self.headers.getheader('Range'):
+                    start, end = self.headers.getheader('Range')[len('bytes='):].split('-')
+                    start, end = int(start), int(end) + 1 if end else len(content)
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %i-%i/%i' % (start, end - 1, len(content)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(end - start))
+                self.end_headers()
+                self.wfile.write(content[start:end][:50000] if truncated else content[start:end])
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        url = 'http://127.0.0.1:%i/genome.fa' % (server.server_port)
+        md5 = hashlib.md5(content).hexdigest()
+        directory = self._temporary_directory()
+
+        original_min_segment_size = Downloader.min_segment_size
+        Downloader.min_segment_size = 10000
+        try:
+            # Parallel segments
+            filename = os.path.join(directory, 'genome.fa')
+            Utils.download(url, filename, md5=md5)
+            with open(filename) as f:
+                self.assertEqual(f.read(), content)
+            self.assertEqual(len(requests_log), 4)
+            self.assertFalse(os.path.exists(filename + '.part'))
+
+            # Resume an interrupted download
+            filename = os.path.join(directory, 'resumed.fa')
+            with open(filename + '.part', 'wb') as f:
+                f.write(content[:30000] + '\0' * 70000)
+            with open(filename + '.part.json', 'w') as f:
+                json.dump({'url': url, 'total': 100000, 'segments': [[0, 50000, 30000], [50000, 100000, 50000]]}, f)
+            del requests_log[:]
+            Utils.download(url, filename, md5=md5)
+            with open(filename) as f:
+                self.assertEqual(f.read(), content)
+            self.assertEqual(sorted(requests_log), ['bytes=30000-49999', 'bytes=50000-99999'])
+
+            # Wrong checksum
+            filename = os.path.join(directory, 'wrong.fa')
+            self.assertRaises(MutationInfoException, Utils.download, url, filename, md5='0' * 32)
+            self.assertFalse(os.path.exists(filename))
+
+            # The connection closes before Content-Length bytes (single connection)
+            Downloader.min_segment_size = original_min_segment_size
+            truncated.append(True)
+            filename = os.path.join(directory, 'truncated.fa')
+            self.assertRaises(MutationInfoException, Utils.download, url, filename)
+            self.assertFalse(os.path.exists(filename))
+        finally:
+            Downloader.min_segment_size = original_min_segment_size
+            server.shutdown()
+
+    def test_CONDITIONAL_DOWNLOAD(self):
+        print '--------CONDITIONAL DOWNLOAD-----------------'
+        import os
+        import threading
+        import BaseHTTPServer
+
+        feeds = {'/genes': ('"1"', '<feed>genes</feed>'), '/variants/TPMT': ('"1"', '<feed>TPMT</feed>')}
+        requests_log = []
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag, content = feeds[self.path]
+                requests_log.append((self.path, self.headers.getheader('If-None-Match')))
+                if self.headers.getheader('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        base_url = 'http://127.0.0.1:%i' % (server.server_port)
+        directory = self._temporary_directory()
+
+        try:
+            filename = os.path.join(directory, 'genes.atom')
+            self.assertTrue(Utils.conditional_download(base_url + '/genes', filename))
+            self.assertEqual(requests_log[-1], ('/genes', None))
+
+            # 304 leaves the file untouched
+            os.utime(filename, (0, 0))
+            self.assertFalse(Utils.conditional_download(base_url + '/genes', filename))
+            self.assertEqual(requests_log[-1], ('/genes', '"1"'))
+            self.assertEqual(os.path.getmtime(filename), 0)
+            with open(filename) as f:
+                self.assertEqual(f.read(), '<feed>genes</feed>')
+
+            # Changed on the server
+            feeds['/genes'] = ('"2"', '<feed>genes 2</feed>')
+            self.assertTrue(Utils.conditional_download(base_url + '/genes', filename))
+            with open(filename) as f:
+                self.assertEqual(f.read(), '<feed>genes 2</feed>')
+
+            # The first refresh after the initial downloads costs one 304 per feed
+            lovd_mi = MutationInfo.__new__(MutationInfo)
+            lovd_mi.lovd_directory = directory
+            lovd_mi.lovd_genes_atom = filename
+            lovd_mi.lovd_genes_url = base_url + '/genes'
+            lovd_mi.lovd_variants_url = base_url + '/variants/{gene}'
+            Utils.conditional_download(base_url + '/variants/TPMT', os.path.join(directory, 'TPMT.atom'))
+            del requests_log[:]
+            ret = lovd_mi.refresh_lovd(threads=2)
+            self.assertEqual(ret, {'changed': [], 'unchanged': ['genes', 'TPMT'], 'failed': []})
+            self.assertEqual(sorted(requests_log), [('/genes', '"2"'), ('/variants/TPMT', '"1"')])
+        finally:
+            server.shutdown()
+
+    def test_LOCAL_DBSNP(self):
+        print '--------LOCAL DBSNP-----------------'
+        import os
+
+        directory = self._temporary_directory()
+        vcf_filename = os.path.join(directory, 'dbsnp.vcf')
+        with open(vcf_filename, 'w') as f:
+            f.write('##fileformat=VCFv4.0\n')
+            f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+            f.write('7\t117199644\trs113993960\tATCT\tA\t.\t.\tRS=113993960\n')
+            f.write('3\t8762685\trs53576\tA\tG\t.\t.\tRS=53576\n')
+
+        LocalDbSNP.build(vcf_filename, os.path.join(directory, 'index'), 'hg38')
+        local_dbsnp = LocalDbSNP(os.path.join(directory, 'index'))
+
+        # Same representation as UCSC's snp tables
+        self.assertEqual(local_dbsnp.search('rs53576'), [('3', 8762685, '+', 'A', 'A', 'A/G')])
+        self.assertEqual(local_dbsnp.search('rs113993960'), [('7', 117199647, '+', 'TCT', 'TCT', 'TCT/-')])
+        self.assertEqual(local_dbsnp.search('rs1'), [])
+        self.assertEqual(local_dbsnp.search('rs53576abc'), [])
+        self.assertEqual(local_dbsnp.search('NM_000367.2:c.-178C>T'), [])
+
+        ret = mi._dbsnp_record_to_ret_dict('rs113993960', *(local_dbsnp.search('rs113993960')[0] + ('hg38', 'LOCAL_DBSNP')))
+        self.assertEqual(remove_notes(ret), {'chrom': '7', 'offset': 117199645, 'ref': 'TCT', 'alt': '', 'genome': 'hg38', 'source': 'LOCAL_DBSNP'})
+
+    def test_UTA_SNAPSHOT(self):
+        print '--------UTA SNAPSHOT-----------------'
+        import os
+
+        class DictRow(list):
+            '''
+            Like psycopg2.extras.DictRow: a list of values that can also be indexed by column name
+            '''
+            def __init__(self, **columns):
+                list.__init__(self, columns.values())
+                self._columns = columns.keys()
+            def keys(self): return list(self._columns)
+            def __getitem__(self, key):
+                if isinstance(key, basestring):
+                    key = self._columns.index(key)
+                return list.__getitem__(self, key)
+
+        class FakeUTA(object):
+            def schema_version(self): return '1.1'
+            def data_version(self): return 'uta_test'
+            def get_tx_identity_info(self, tx_ac): return DictRow(tx_ac=tx_ac, cds_start_i=2, cds_end_i=8, lengths=[4, 6])
+            def get_similar_transcripts(self, tx_ac): return []
+            def get_pro_ac_for_tx_ac(self, tx_ac): return None
+            def get_tx_mapping_options(self, tx_ac): return [DictRow(tx_ac=tx_ac, alt_ac='NC_000006.11', alt_aln_method='splign')]
+            def get_tx_info(self, tx_ac, alt_ac, alt_aln_method): return DictRow(tx_ac=tx_ac, cds_start_i=2, cds_end_i=8)
+            def get_tx_exons(self, tx_ac, alt_ac, alt_aln_method):
+                return [
+                    DictRow(ord=1, alt_strand=-1, tx_start_i=4, tx_end_i=10, alt_start_i=1000, alt_end_i=1006),
+                    DictRow(ord=0, alt_strand=-1, tx_start_i=0, tx_end_i=4, alt_start_i=2000, alt_end_i=2004),
+                ]
+            def fetch_seq(self, ac, start_i=None, end_i=None): return 'ACGTACGTAC'
+
+        filename = os.path.join(self._temporary_directory(), 'uta.sqlite')
+        SQLiteUTADataProvider.build(filename, FakeUTA(), transcripts=['NM_000367.2'])
+        hdp = SQLiteUTADataProvider(filename)
+
+        self.assertEqual(hdp.schema_version(), '1.1')
+        self.assertEqual(hdp.get_tx_info('NM_000367.2', 'NC_000006.11', 'splign')['cds_end_i'], 8)
+        self.assertEqual(hdp.get_tx_identity_info('NM_000367.2')['lengths'], [4, 6])
+        self.assertEqual(len(hdp.get_tx_exons('NM_000367.2', 'NC_000006.11', 'splign')), 2)
+        self.assertEqual([x['tx_ac'] for x in hdp.get_tx_for_region('NC_000006.11', 'splign', 1500, 1501)], ['NM_000367.2'])
+        self.assertEqual(hdp.get_tx_for_region('NC_000006.11', 'splign', 3000, 3001), [])
+        self.assertEqual(hdp.fetch_seq('NM_000367.2', 2, 5), 'GTA')
+
+    def test_ASSEMBLY_REPORT(self):
+        print '--------ASSEMBLY REPORT-----------------'
+        report = Utils.load_assembly_report(MutationInfo.assembly_report_filename)
+        self.assertEqual(report['NC_000001.10'], ('1', 'GRCh37.p13', 249250621))
+        self.assertEqual(report['NC_000023.11'], ('X', 'GRCh38.p7', 156040895))
+
+        self.assertEqual(mi._get_assembly_info('nc_000006.11'), ('6', 'GRCh37.p13', 171115067))
+
+    def test_SEQUENCE_RANGE(self):
+        print '--------SEQUENCE RANGE-----------------'
+        chunk = mi._get_sequence_range('NM_006446.4', 1000, 1100)
+        self.assertEqual(len(chunk), 100)
+        fasta = mi._get_data_from_nucleotide_entrez('NM_006446.4', retmode='text', rettype='fasta')
+        self.assertEqual(chunk, fasta[1000:1100])
+        self.assertEqual(mi._get_sequence_length('NM_006446.4'), len(fasta))
+
+        # Cached FASTA records are sliced from their .seq file
+        import os
+        filenames = [mi._ncbi_filename('XX_000001.1', 'fasta'), mi._ncbi_filename('XX_000001.1', 'seq'), mi._ncbi_filename('XX_000001.1', 'seq') + '.lock']
+        try:
+            with open(filenames[0], 'w') as f:
+                f.write('>XX_000001.1 Test\nACGTACGTAC\nGGGGCCCCTT\nA\n')
+            self.assertEqual(mi._get_sequence_range('XX_000001.1', 8, 13), 'ACGGG')
+            self.assertTrue(os.path.exists(filenames[1]))
+            self.assertEqual(mi._get_data_from_nucleotide_entrez('XX_000001.1', retmode='text', rettype='fasta'), 'ACGTACGTACGGGGCCCCTTA')
+        finally:
+            # mi uses the real cache of the user
+            for filename in filenames:
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def test_FEATURE_TABLE(self):
+        print '--------FEATURE TABLE-----------------'
+        feature_table = '>Feature ref|NM_000001.1|\n1\t500\tgene\n\t\t\tgene\tTEST\n<1\t>500\tmRNA\n41\t60\tCDS\n101\t130\n\t\t\tproduct\tTEST\n900\t801\tCDS\n'
+        features = MutationInfo._features_from_feature_table(feature_table)
+        self.assertEqual(features, [('gene', [[0, 500, 1]]), ('mRNA', [[0, 500, 1]]), ('CDS', [[40, 60, 1], [100, 130, 1]]), ('CDS', [[800, 900, -1]])])
+
+        c2g = mi._biopython_c2g_mapper(features[2][1])
+        self.assertEqual([c2g(1), c2g(20), c2g(21)], [41, 60, 101])
+        c2g = mi._biopython_c2g_mapper(features[3][1])
+        self.assertEqual([c2g(1), c2g(100)], [900, 801])
+
+        # An mRNA record has a single part CDS
+        self.assertEqual(len(mi._get_exons_from_entrez('NM_006446.4')), 1)
+
+    def test_LOCAL_REFGENE(self):
+        print '--------LOCAL REFGENE-----------------'
+        from pyhgvs.utils import make_transcript
+
+        def transcript(strand):
+            return make_transcript({'id': 'NM_000001.2', 'gene_name': 'TEST', 'chrom': 'chr1', 'start': 100, 'end': 400, 'strand': strand,
+                'cds_start': 130, 'cds_end': 350, 'exons': [(100, 150), (200, 260), (300, 400)]})
+
+        mapper = RefGeneMapper({'NM_000001.2': transcript('+')})
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 1), ('chr1', 131, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 21), ('chr1', 201, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 20, 3), ('chr1', 153, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 21, -3), ('chr1', 198, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', -5), ('chr1', 126, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 1, cds_end=True), ('chr1', 351, '+'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 5, 3), None) # Not at an exon boundary
+        self.assertEqual(mapper.c_to_g('NM_000001.1', 1), None) # Different version
+
+        mapper = RefGeneMapper({'NM_000001.2': transcript('-')})
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 1), ('chr1', 350, '-'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', -5), ('chr1', 355, '-'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 51), ('chr1', 260, '-'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 50, 2), ('chr1', 299, '-'))
+        self.assertEqual(mapper.c_to_g('NM_000001.2', 1, cds_end=True), ('chr1', 130, '-'))
+
+    def test_REFGENE_INDEX(self):
+        print '--------REFGENE INDEX-----------------'
+        import os
+        from pyhgvs.utils import read_transcripts
+
+        directory = self._temporary_directory()
+        refgene_filename = os.path.join(directory, 'genes.refGene')
+        with open(refgene_filename, 'w') as f:
+            f.write('0\tNM_000001.2\tchr1\t+\t100\t400\t130\t350\t3\t100,200,300,\t150,260,400,\t0\tTEST\tcmpl\tcmpl\t0,1,2,\n')
+            f.write('0\tNR_000002.1\tchr2\t-\t1000\t2000\t2000\t2000\t2\t1000,1500,\t1100,2000,\t0\tTEST2\tnone\tnone\t-1,-1,\n')
+            f.write('0\tNM_000001.3\tchrX\t-\t500\t900\t550\t850\t1\t500,\t900,\t0\tTEST\tcmpl\tcmpl\t0,\n')
+        index = RefGeneIndex.load(refgene_filename, os.path.join(directory, 'index'))
+        with open(refgene_filename) as f:
+            expected = read_transcripts(f)
+
+        position = lambda x: (x.chrom, x.chrom_start, x.chrom_stop, x.is_forward_strand)
+        self.assertEqual(len(index), len(expected))
+        for name, transcript in expected.iteritems():
+            self.assertIn(name, index)
+            found = index.get(name)
+            self.assertEqual(found.full_name, transcript.full_name)
+            self.assertEqual(found.gene.name, transcript.gene.name)
+            self.assertEqual(position(found.tx_position), position(transcript.tx_position))
+            self.assertEqual(position(found.cds_position), position(transcript.cds_position))
+            self.assertEqual([position(x.tx_position) for x in found.exons], [position(x.tx_position) for x in transcript.exons])
+        self.assertIs(index.get('NM_000001'), index.get('NM_000001'))
+        self.assertEqual(index.get('NM_000001').full_name, 'NM_000001.3') # The last record wins
+        self.assertEqual(index.get('NM_999999.1'), None)
+        self.assertNotIn('NM_00000', index)
+        self.assertEqual(RefGeneMapper(index).c_to_g('NM_000001.2', 21), ('chr1', 201, '+'))
+
+    def test_LIFTOVER(self):
+        print '--------LIFTOVER-----------------'
+        import os
+
+        directory = self._temporary_directory()
+        liftover = LiftOver(directory, 'hg19')
+        with open(liftover.chain_filename('hg38')[:-3], 'w') as f:
+            f.write('chain 1000 chr1 1000 + 100 300 chr1 1200 + 200 410 1\n50 10 20\n140\n\n')
+            f.write('chain 500 chr2 1000 + 0 100 chr5 500 - 0 100 2\n100\n\n')
+
+        arrays = LiftOver.parse_chain_file(liftover.chain_filename('hg38')[:-3])
+        self.assertEqual(list(arrays['start']), [100, 160, 2**32])
+        self.assertEqual(list(arrays['end']), [150, 300, 2**32 + 100])
+
+        liftover.chain_filename = lambda source: os.path.join(directory, 'hg38ToHg19.over.chain')
+        ret = liftover.convert('hg38', ['chr1', 'chr1', 'chr1', 'chr2', 'chr2', 'chr3'], [101, 155, 161, 1, 100, 1])
+        self.assertEqual(ret, [('chr1', 201, '+'), None, ('chr1', 271, '+'), ('chr5', 500, '-'), ('chr5', 401, '-'), None])
+
+        # Overlapping chains: the best scoring chain is used where they overlap
+        with open(os.path.join(directory, 'overlap.chain'), 'w') as f:
+            f.write('chain 1000 chr1 1000 + 100 300 chr1 1200 + 200 400 1\n200\n\n')
+            f.write('chain 5000 chr1 1000 + 150 200 chr7 5000 + 1000 1050 2\n50\n\n')
+            f.write('chain 10 chr1 1000 + 120 400 chr9 5000 + 0 280 3\n280\n\n')
+        liftover = LiftOver(directory, 'hg19')
+        liftover.chain_filename = lambda source: os.path.join(directory, 'overlap.chain')
+        ret = liftover.convert('hg38', ['chr1'] * 7, [101, 150, 151, 200, 201, 300, 301])
+        self.assertEqual(ret, [('chr1', 201, '+'), ('chr1', 250, '+'), ('chr7', 1001, '+'), ('chr7', 1050, '+'), ('chr1', 301, '+'), ('chr1', 400, '+'), ('chr9', 181, '+')])
+
+    def test_OFFLINE(self):
+        print '--------OFFLINE-----------------'
+        import socket
+        import urllib2
+
+        original_getaddrinfo = socket.getaddrinfo
+        with Utils.network_guard():
+            self.assertRaises(MutationInfoOfflineError, socket.getaddrinfo, 'www.ncbi.nlm.nih.gov', 80)
+            try:
+                urllib2.urlopen('https://www.ncbi.nlm.nih.gov/')
+                self.fail('Connection in offline mode')
+            except urllib2.URLError as e:
+                self.assertTrue(isinstance(e.reason, MutationInfoOfflineError))
+
+        # The socket module is restored once the last offline block exits
+        self.assertIs(socket.getaddrinfo, original_getaddrinfo)
+
+        # Local methods work offline
+        offline_mi = MutationInfo(offline=True)
+        info = offline_mi.get_info('NM_000367.2:c.-178C>T')
+        self.assertEqual(remove_notes(info),  {'chrom': '6', 'source': 'LOCAL_REFGENE', 'genome': 'hg19', 'offset': 18155397, 'alt': 'A', 'ref': 'G'})
+
     def test_HGVS_PARSER(self):
         print '--------HGVS PARSER-----------------'
         ret = MutationInfo.biocommons_parse('unparsable')
@@ -212,7 +1022,7 @@ class TestMutationInfo(unittest.TestCase):
 
         info = mi.get_info('NM_000367.2:c.-178C>T')
         print info
-        self.assertEqual(remove_notes(info),  {'chrom': '6', 'source': 'counsyl_hgvs_to_vcf', 'genome': 'hg19', 'offset': 18155397, 'alt': 'A', 'ref': 'G'})
+        self.assertEqual(remove_notes(info),  {'chrom': '6', 'source': 'LOCAL_REFGENE', 'genome': 'hg19', 'offset': 18155397, 'alt': 'A', 'ref': 'G'})
 
         info = mi.get_info('NT_005120.15:c.IVS1-72T>G', gene='UGT1A1')
         print info